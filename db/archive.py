@@ -0,0 +1,149 @@
+import os
+import re
+from datetime import datetime, timedelta
+from db.change_bus import DELETE
+
+# قاعدة الأرشيف تُربط بكل اتصال باسم archive. الاستعلامات بدون اسم قاعدة تقرأ main
+# (القاعدة الساخنة) فقط، والتقارير تضيف الأرشيف عبر Archive.table() عندما تحتاجه.
+ARCHIVE_ALIAS = 'archive'
+ARCHIVED_TABLES = ('patients', 'payments', 'expenses', 'charges',
+                   'patient_rate_history', 'patient_ledger_totals')
+# كل صف في الأرشيف تاريخه قبل هذا اليوم؛ فترة تبدأ منه أو بعده لا تحتاج الأرشيف
+BOUNDARY_KEY = 'archive_boundary'
+
+def archive_path_for(db_path):
+    root, ext = os.path.splitext(db_path)
+    return f'{root}_archive{ext or ".db"}'
+
+def ensure_archive_schema(db):
+    # نفس تعريف جداول main وفهارسها؛ الأعمدة التي أضافتها ترقيات لاحقة تُضاف للأرشيف أيضاً
+    for table in ARCHIVED_TABLES:
+        sql = db.fetchone(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        )[0]
+        db.execute(re.sub(r'^CREATE TABLE\s+"?\w+"?',
+                          f'CREATE TABLE IF NOT EXISTS {ARCHIVE_ALIAS}.{table}', sql, count=1))
+
+        archive_columns = {row[1] for row in db.fetchall(f'PRAGMA {ARCHIVE_ALIAS}.table_info({table})')}
+        for _, name, column_type, not_null, default, _ in db.fetchall(f'PRAGMA main.table_info({table})'):
+            if name in archive_columns:
+                continue
+            definition = f'{name} {column_type}'
+            if default is not None:
+                definition += f' DEFAULT {default}'
+                if not_null:
+                    definition += ' NOT NULL'
+            db.execute(f'ALTER TABLE {ARCHIVE_ALIAS}.{table} ADD COLUMN {definition}')
+
+    placeholders = ', '.join('?' * len(ARCHIVED_TABLES))
+    for (sql,) in db.fetchall(f'''
+        SELECT sql FROM main.sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    ''', ARCHIVED_TABLES):
+        db.execute(re.sub(r'^CREATE (UNIQUE )?INDEX\s+(IF NOT EXISTS\s+)?"?(\w+)"?',
+                          rf'CREATE \1INDEX IF NOT EXISTS {ARCHIVE_ALIAS}.\3', sql, count=1))
+
+class Archive:
+    def __init__(self, db):
+        self.db = db
+        self._columns = {}
+
+    def boundary(self):
+        return self.db.settings.get(BOUNDARY_KEY)
+
+    def needs_archive(self, period=None):
+        # period = None تعني كل الفترات (إجماليات عامة)
+        boundary = self.boundary()
+        if boundary is None:
+            return False
+        return period is None or period.start_str < boundary
+
+    def _table_columns(self, table):
+        if table not in self._columns:
+            self._columns[table] = ', '.join(
+                row[1] for row in self.db.fetchall(f'PRAGMA main.table_info({table})')
+            )
+        return self._columns[table]
+
+    def table(self, table, period=None):
+        # اسم الجدول للاستخدام في FROM: الجدول الساخن فقط أو UNION ALL مع الأرشيف
+        if not self.needs_archive(period):
+            return table
+        columns = self._table_columns(table)
+        return (f'(SELECT {columns} FROM main.{table} '
+                f'UNION ALL SELECT {columns} FROM {ARCHIVE_ALIAS}.{table})')
+
+    def _move(self, table, condition, params=()):
+        columns = self._table_columns(table)
+        self.db.execute(f'''
+            INSERT OR REPLACE INTO {ARCHIVE_ALIAS}.{table} ({columns})
+            SELECT {columns} FROM main.{table} WHERE {condition}
+        ''', params)
+
+    def archive_before(self, year):
+        # نقل المرضى الذين تخرجوا قبل بداية year مع كل بياناتهم، ومصروفات السنوات المغلقة.
+        # في وضع WAL لا يكون commit ذرياً عبر قاعدتين، لذلك النسخ للأرشيف أولاً في
+        # transaction مستقلة، ثم الحذف من main للصفوف الموجودة فعلاً في الأرشيف فقط.
+        cutoff = f'{int(year)}-01-01'
+        patients_condition = "id IN (SELECT id FROM main.patients WHERE status = 'متخرج' AND discharged_at < ?)"
+        related_condition = ("patient_id IN (SELECT id FROM main.patients "
+                             "WHERE status = 'متخرج' AND discharged_at < ?)")
+
+        with self.db.transaction():
+            patients = self.db.fetchone(
+                f'SELECT COUNT(*) FROM main.patients WHERE {patients_condition}', (cutoff,)
+            )[0]
+            expenses = self.db.fetchone(
+                'SELECT COUNT(*) FROM main.expenses WHERE expense_date < ?', (cutoff,)
+            )[0]
+            for table in ('patient_ledger_totals', 'payments', 'charges', 'patient_rate_history'):
+                self._move(table, related_condition, (cutoff,))
+            self._move('patients', patients_condition, (cutoff,))
+            self._move('expenses', 'expense_date < ?', (cutoff,))
+
+        with self.db.transaction():
+            # حذف المدفوعات أولاً ثم المرضى (triggers تحذف المستحقات والأسعار) ثم الإجماليات
+            self.db.execute(f'''
+                DELETE FROM main.payments
+                WHERE id IN (SELECT id FROM {ARCHIVE_ALIAS}.payments)
+            ''')
+            self.db.execute(f'''
+                DELETE FROM main.patients
+                WHERE id IN (SELECT id FROM {ARCHIVE_ALIAS}.patients)
+            ''')
+            self.db.execute(f'''
+                DELETE FROM main.patient_ledger_totals
+                WHERE patient_id IN (SELECT id FROM {ARCHIVE_ALIAS}.patients)
+            ''')
+            self.db.execute(f'''
+                DELETE FROM main.expenses
+                WHERE id IN (SELECT id FROM {ARCHIVE_ALIAS}.expenses)
+            ''')
+            self._update_boundary()
+            if patients:
+                self.db.changes.publish('patients', None, DELETE)
+                self.db.changes.publish('payments', None, DELETE)
+            if expenses:
+                self.db.changes.publish('expenses', None, DELETE)
+
+        return {'patients': patients, 'expenses': expenses}
+
+    def _update_boundary(self):
+        latest = self.db.fetchone(f'''
+            SELECT MAX(latest) FROM (
+                SELECT MAX(substr(payment_date, 1, 10)) AS latest FROM {ARCHIVE_ALIAS}.payments
+                UNION ALL SELECT MAX(substr(expense_date, 1, 10)) FROM {ARCHIVE_ALIAS}.expenses
+                UNION ALL SELECT MAX(charge_date) FROM {ARCHIVE_ALIAS}.charges
+                UNION ALL SELECT MAX(substr(discharged_at, 1, 10)) FROM {ARCHIVE_ALIAS}.patients
+            )
+        ''')[0]
+        if latest is None:
+            return
+        boundary = datetime.strptime(latest, '%Y-%m-%d') + timedelta(days=1)
+        self.db.settings.set(BOUNDARY_KEY, boundary.strftime('%Y-%m-%d'))
+
+    def get_counts(self):
+        return {
+            table: self.db.fetchone(f'SELECT COUNT(*) FROM {ARCHIVE_ALIAS}.{table}')[0]
+            for table in ('patients', 'payments', 'expenses')
+        }
@@ -0,0 +1,130 @@
+import os
+import sqlite3
+from datetime import datetime
+from db.archive import ARCHIVE_ALIAS, archive_path_for
+
+# عدد الصفحات في كل خطوة والانتظار بينها حتى لا تحجز النسخة القاعدة عن باقي الاتصالات
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+
+def integrity_check(path):
+    # يعيد قائمة المشاكل؛ قائمة فارغة تعني أن الملف سليم
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute('PRAGMA integrity_check').fetchall()
+    finally:
+        conn.close()
+    problems = [row[0] for row in rows]
+    return [] if problems == ['ok'] else problems
+
+def archive_overlap(source_path, archive_path):
+    # الجداول التي توجد بعض صفوفها في source_path وفي الأرشيف معاً. استعادة main وحده
+    # فوق أرشيف أحدث منه تجعل Archive.table() تحسب هذه الصفوف مرتين
+    if not os.path.exists(archive_path):
+        return []
+    conn = sqlite3.connect(source_path)
+    try:
+        conn.execute(f'ATTACH DATABASE ? AS {ARCHIVE_ALIAS}', (archive_path,))
+        overlapping = []
+        for table in ('patients', 'payments', 'expenses'):
+            exists = [
+                conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?",
+                             (table,)).fetchone()
+                for schema in ('main', ARCHIVE_ALIAS)
+            ]
+            if all(exists) and conn.execute(
+                f'SELECT 1 FROM main.{table} WHERE id IN (SELECT id FROM {ARCHIVE_ALIAS}.{table}) LIMIT 1'
+            ).fetchone():
+                overlapping.append(table)
+        return overlapping
+    finally:
+        conn.close()
+
+def check_archive_overlap(source_path, archive_path):
+    overlapping = archive_overlap(source_path, archive_path)
+    if overlapping:
+        raise sqlite3.DatabaseError(
+            f'لا يمكن استعادة القاعدة بدون أرشيفها: صفوف من {", ".join(overlapping)} '
+            f'موجودة في الأرشيف الحالي وستُحسب مرتين'
+        )
+
+def copy_database(source_path, dest_path, progress=None):
+    # نسخة متسقة عبر sqlite3 backup API على دفعات من الصفحات بدلاً من نسخ الملف
+    source = sqlite3.connect(source_path)
+    dest = sqlite3.connect(dest_path)
+    try:
+        def step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+        source.backup(dest, pages=BACKUP_PAGES_PER_STEP, progress=step, sleep=BACKUP_STEP_SLEEP)
+    finally:
+        dest.close()
+        source.close()
+
+class BackupService:
+    # النسخ الاحتياطي للقاعدة الحالية: نسخ بالـ backup API ثم فحص سلامة ثم تدوير النسخ القديمة.
+    # الأرشيف يُنسخ ويُستعاد مع main كملف مرافق (archive_path_for) لأن إجماليات Archive
+    # تجمع القاعدتين. لا يعتمد على Qt؛ الواجهة تشغله في DatabaseWorker وتعرض التقدم عبر progress
+    def __init__(self, db, backup_dir=None):
+        self.db = db
+        self.backup_dir = backup_dir or os.path.join(os.path.dirname(db.db_path), 'backups')
+
+    def create_backup(self, prefix='auto_backup', keep=10, progress=None):
+        os.makedirs(self.backup_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        backup_file = os.path.join(self.backup_dir, f'{prefix}_{timestamp}.db')
+
+        # الأرشيف أولاً، فلا توجد نسخة من main بدون أرشيفها
+        if os.path.exists(self.db.archive_path):
+            self._copy_checked(self.db.archive_path, archive_path_for(backup_file))
+        self._copy_checked(self.db.db_path, backup_file, progress)
+
+        if keep:
+            self.rotate(prefix, keep)
+        return backup_file
+
+    def _copy_checked(self, source_path, backup_file, progress=None):
+        temp_file = backup_file + '.tmp'
+        try:
+            copy_database(source_path, temp_file, progress)
+            problems = integrity_check(temp_file)
+            if problems:
+                raise sqlite3.DatabaseError(f'فشل فحص سلامة النسخة الاحتياطية: {problems[0]}')
+            os.replace(temp_file, backup_file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    def rotate(self, prefix, keep):
+        for old_backup in self.list_backups(prefix)[keep:]:
+            backup_file = os.path.join(self.backup_dir, old_backup)
+            os.remove(backup_file)
+            if os.path.exists(archive_path_for(backup_file)):
+                os.remove(archive_path_for(backup_file))
+
+    def list_backups(self, prefix=None):
+        # ملفات الأرشيف المرافقة لا تُعرض كنسخ مستقلة
+        if not os.path.isdir(self.backup_dir):
+            return []
+        return sorted(
+            (f for f in os.listdir(self.backup_dir)
+             if f.endswith('.db') and not f.endswith('_archive.db')
+             and (prefix is None or f.startswith(prefix + '_'))),
+            reverse=True
+        )
+
+    def restore(self, source_path, progress=None):
+        # استبدال محتوى القاعدة الحالية بملف آخر عبر backup API بعد التأكد من سلامته،
+        # فلا يبقى ملف WAL قديم يخالف المحتوى الجديد. الأرشيف المرافق للملف (إن وُجد)
+        # يحل محل الأرشيف الحالي؛ بدونه تُرفض الاستعادة إذا تداخلت صفوفها مع الأرشيف
+        source_archive = archive_path_for(source_path)
+        paired = os.path.exists(source_archive)
+        for path in (source_path, source_archive) if paired else (source_path,):
+            problems = integrity_check(path)
+            if problems:
+                raise sqlite3.DatabaseError(f'ملف قاعدة البيانات تالف: {problems[0]}')
+        if not paired:
+            check_archive_overlap(source_path, self.db.archive_path)
+        copy_database(source_path, self.db.db_path, progress)
+        if paired:
+            copy_database(source_archive, self.db.archive_path)
@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import zlib
+from datetime import datetime, timedelta
+
+from db.archive import archive_path_for
+from db.backup import copy_database, integrity_check, check_archive_overlap
+
+# كل قطعة = 16 صفحة؛ تعديل صف واحد يغيّر قطعة أو اثنتين فقط فتُكتب وحدها
+PAGES_PER_CHUNK = 16
+SNAPSHOT_ID_FORMAT = '%Y%m%d_%H%M%S'
+
+class BackupStore:
+    # مخزن نسخ احتياطية تزايدي: القاعدة تُقسم إلى قطع مسماة بـ sha256 فلا تُكتب
+    # القطعة إلا مرة واحدة، وكل نسخة مجرد manifest يسرد قطعها بالترتيب.
+    #   store/chunks/ab/abcdef...   محتوى مضغوط بـ zlib
+    #   store/manifests/<id>.json   النسخة
+    def __init__(self, root):
+        self.root = root
+        self.chunks_dir = os.path.join(root, 'chunks')
+        self.manifests_dir = os.path.join(root, 'manifests')
+
+    @classmethod
+    def for_database(cls, db_path):
+        return cls(os.path.join(os.path.dirname(db_path), 'backups', 'store'))
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _copy_database(self, db_path, progress=None):
+        # صورة متسقة من القاعدة في ملف مؤقت عبر backup API على دفعات (copy_database)،
+        # ثم فحص سلامتها. الملف يُقرأ بعدها قطعة قطعة فلا تُحمل القاعدة في الذاكرة
+        fd, temp_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            copy_database(db_path, temp_path, progress)
+            problems = integrity_check(temp_path)
+            if problems:
+                raise sqlite3.DatabaseError(f'فشل فحص سلامة النسخة الاحتياطية: {problems[0]}')
+            conn = sqlite3.connect(temp_path)
+            try:
+                page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            finally:
+                conn.close()
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return temp_path, page_size
+
+    def list_snapshots(self):
+        if not os.path.isdir(self.manifests_dir):
+            return []
+        return sorted(f[:-5] for f in os.listdir(self.manifests_dir) if f.endswith('.json'))
+
+    def load_manifest(self, snapshot_id):
+        if snapshot_id == 'latest':
+            snapshots = self.list_snapshots()
+            if not snapshots:
+                raise FileNotFoundError('لا توجد نسخ احتياطية في المخزن')
+            snapshot_id = snapshots[-1]
+        with open(os.path.join(self.manifests_dir, snapshot_id + '.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def snapshot(self, db_path, label='', progress=None):
+        # التقدم بالنسبة المئوية: النسخ (صفحات) حتى 50 ثم التقطيع (بايتات) حتى 100
+        copy_progress = chunk_progress = None
+        if progress:
+            copy_progress = lambda done, total: progress(done * 50 // max(total, 1), 100)
+            chunk_progress = lambda done, total: progress(50 + done * 50 // max(total, 1), 100)
+        temp_path, page_size = self._copy_database(db_path, copy_progress)
+        chunk_size = page_size * PAGES_PER_CHUNK
+
+        chunks = []
+        written = 0
+        data_digest = hashlib.sha256()
+        try:
+            size = os.path.getsize(temp_path)
+            with open(temp_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    data_digest.update(chunk)
+                    digest = hashlib.sha256(chunk).hexdigest()
+                    path = self._chunk_path(digest)
+                    if not os.path.exists(path):
+                        self._write_atomic(path, zlib.compress(chunk))
+                        written += 1
+                    chunks.append(digest)
+                    if chunk_progress:
+                        chunk_progress(min(len(chunks) * chunk_size, size), size)
+        finally:
+            os.remove(temp_path)
+
+        snapshots = self.list_snapshots()
+        if snapshots:
+            # لا تغيير منذ آخر نسخة: لا داعي لـ manifest جديد
+            latest = self.load_manifest(snapshots[-1])
+            if latest['chunks'] == chunks:
+                return latest['id'], 0
+
+        snapshot_id = datetime.now().strftime(SNAPSHOT_ID_FORMAT)
+        suffix = 1
+        while snapshot_id in snapshots:
+            snapshot_id = f'{datetime.now().strftime(SNAPSHOT_ID_FORMAT)}_{suffix}'
+            suffix += 1
+
+        manifest = {
+            'id': snapshot_id,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'label': label,
+            'size': size,
+            'page_size': page_size,
+            'chunk_size': chunk_size,
+            'sha256': data_digest.hexdigest(),
+            'chunks': chunks
+        }
+        self._write_atomic(
+            os.path.join(self.manifests_dir, snapshot_id + '.json'),
+            json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+        )
+        return snapshot_id, written
+
+    def restore(self, snapshot_id, dest_path):
+        # يعيد بناء الملف من القطع ويتحقق منه قبل كتابته في dest_path عبر backup API
+        manifest = self.load_manifest(snapshot_id)
+        fd, temp_path = tempfile.mkstemp(suffix='.db')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                for chunk_digest in manifest['chunks']:
+                    with open(self._chunk_path(chunk_digest), 'rb') as chunk_file:
+                        chunk = zlib.decompress(chunk_file.read())
+                    digest.update(chunk)
+                    f.write(chunk)
+            if digest.hexdigest() != manifest['sha256']:
+                raise sqlite3.DatabaseError(f'النسخة {manifest["id"]} تالفة (sha256 غير مطابق)')
+            problems = integrity_check(temp_path)
+            if problems:
+                raise sqlite3.DatabaseError(f'النسخة {manifest["id"]} تالفة: {problems[0]}')
+            # الأرشيف له مخزن مستقل (archive_store) ويُستعاد أولاً إذا تداخلت النسخة معه
+            check_archive_overlap(temp_path, archive_path_for(dest_path))
+            copy_database(temp_path, dest_path)
+        finally:
+            os.remove(temp_path)
+        return manifest['id']
+
+    def prune(self, keep_all_hours=48, keep_daily_days=180):
+        # الاحتفاظ بكل النسخ لآخر keep_all_hours ساعة، ثم آخر نسخة من كل يوم حتى
+        # keep_daily_days يوماً؛ بعدها تُحذف القطع التي لم تعد أي نسخة تشير إليها
+        now = datetime.now()
+        kept_days = set()
+        removed = 0
+        for snapshot_id in reversed(self.list_snapshots()):
+            created = datetime.strptime(snapshot_id[:15], SNAPSHOT_ID_FORMAT)
+            day = created.date()
+            if now - created <= timedelta(hours=keep_all_hours):
+                kept_days.add(day)
+                continue
+            if now - created <= timedelta(days=keep_daily_days) and day not in kept_days:
+                kept_days.add(day)
+                continue
+            os.remove(os.path.join(self.manifests_dir, snapshot_id + '.json'))
+            removed += 1
+
+        if removed:
+            self.collect_garbage()
+        return removed
+
+    def collect_garbage(self):
+        referenced = set()
+        for snapshot_id in self.list_snapshots():
+            referenced.update(self.load_manifest(snapshot_id)['chunks'])
+        if not os.path.isdir(self.chunks_dir):
+            return 0
+        removed = 0
+        for prefix in os.listdir(self.chunks_dir):
+            prefix_dir = os.path.join(self.chunks_dir, prefix)
+            for chunk_digest in os.listdir(prefix_dir):
+                if chunk_digest not in referenced:
+                    os.remove(os.path.join(prefix_dir, chunk_digest))
+                    removed += 1
+        return removed
+
+DEFAULT_DB_PATH = 'dar_alhayat_accounting/db/dar_alhayat.db'
+
+def main(argv=None):
+    # python -m db.backup_store restore latest
+    parser = argparse.ArgumentParser(description='مخزن النسخ الاحتياطية التزايدي')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='مسار قاعدة البيانات')
+    parser.add_argument('--store', help='مجلد المخزن (افتراضياً backups/store بجوار القاعدة)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='عرض النسخ')
+    commands.add_parser('snapshot', help='أخذ نسخة الآن')
+    restore_parser = commands.add_parser('restore', help='استعادة نسخة إلى --db')
+    restore_parser.add_argument('snapshot_id', help='رقم النسخة أو latest')
+    commands.add_parser('prune', help='حذف النسخ القديمة والقطع غير المستخدمة')
+    args = parser.parse_args(argv)
+
+    store = BackupStore(args.store) if args.store else BackupStore.for_database(args.db)
+    if args.command == 'list':
+        for snapshot_id in store.list_snapshots():
+            manifest = store.load_manifest(snapshot_id)
+            print(f'{snapshot_id}  {manifest["created_at"]}  {manifest["size"] // 1024} KB  {manifest["label"]}')
+    elif args.command == 'snapshot':
+        snapshot_id, written = store.snapshot(args.db, label='cli')
+        print(f'{snapshot_id} ({written} قطعة جديدة)')
+    elif args.command == 'restore':
+        print(f'تمت استعادة النسخة {store.restore(args.snapshot_id, args.db)} إلى {args.db}')
+    elif args.command == 'prune':
+        print(f'تم حذف {store.prune()} نسخة')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import uuid
+from collections import namedtuple
+
+# row_id = None يعني أن صفوفاً كثيرة أو غير معروفة تغيرت في الجدول (تحديث كامل)
+Change = namedtuple('Change', ['table', 'row_id', 'op'])
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+
+# الجداول التي تعرضها الشاشات؛ تُعلن كلها متغيرة إذا استُبدلت القاعدة من جهاز آخر
+WATCHED_TABLES = ('patients', 'patient_ledger_totals', 'payments', 'expenses',
+                  'employees', 'employee_transactions', 'settings')
+CHANGE_LOG_DAYS = 30
+
+class ChangeBus:
+    # المديرون ينشرون (الجدول، رقم الصف، العملية) بعد كل كتابة، والشاشات تشترك
+    # لتحدّث الصفوف المتأثرة فقط. الحدث لا يُسلم إلا بعد commit المعاملة التي
+    # نشرته، فالتراجع لا يصل لأحد؛ والمستمع يُستدعى في الخيط الذي كتب.
+    # كل حدث يُكتب أيضاً في change_log داخل نفس المعاملة حتى تراه الأجهزة
+    # الأخرى المشتركة في نفس الملف عبر poll()
+    def __init__(self, db):
+        self.db = db
+        self.origin = uuid.uuid4().hex
+        self._listeners = []
+        self._logging = False
+        self._last_seen_id = 0
+        self._data_version = None
+
+    def start_log(self):
+        # بعد الترقيات: change_log موجود من هنا فقط
+        self.db.execute(
+            f"DELETE FROM change_log WHERE created_at < datetime('now', '-{CHANGE_LOG_DAYS} days')"
+        )
+        self._last_seen_id = self.db.fetchone('SELECT COALESCE(MAX(id), 0) FROM change_log')[0]
+        self._data_version = self.db.fetchone('PRAGMA data_version')[0]
+        self._logging = True
+
+    def publish(self, table, row_id=None, op=UPDATE):
+        change = Change(table, row_id, op)
+        if self._logging:
+            self.db.execute(
+                'INSERT INTO change_log (table_name, row_id, op, origin) VALUES (?, ?, ?, ?)',
+                (table, row_id, op, self.origin)
+            )
+        self.db.on_commit(lambda: self._notify(change))
+
+    def poll(self):
+        # PRAGMA data_version يتغير فقط عندما يكتب اتصال آخر، فالاستدعاء المتكرر رخيص.
+        # يعيد عدد الأحداث القادمة من أجهزة أخرى
+        if not self._logging:
+            return 0
+        data_version = self.db.fetchone('PRAGMA data_version')[0]
+        if data_version == self._data_version:
+            return 0
+        self._data_version = data_version
+
+        last_id = self.db.fetchone('SELECT COALESCE(MAX(id), 0) FROM change_log')[0]
+        if last_id < self._last_seen_id:
+            # القاعدة استُبدلت (استيراد أو استعادة نسخة) على جهاز آخر
+            self._last_seen_id = last_id
+            changes = [Change(table, None, UPDATE) for table in WATCHED_TABLES]
+        else:
+            rows = self.db.fetchall('''
+                SELECT table_name, row_id, op FROM change_log
+                WHERE id > ? AND id <= ? AND origin != ?
+                ORDER BY id
+            ''', (self._last_seen_id, last_id, self.origin))
+            self._last_seen_id = last_id
+            changes = [Change(*row) for row in rows]
+
+        if any(change.table == 'settings' for change in changes):
+            self.db.settings.reload()
+        for change in changes:
+            self._notify(change)
+        return len(changes)
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, change):
+        for callback in list(self._listeners):
+            try:
+                callback(change)
+            except Exception as e:
+                print(f'خطأ في مستمع التغييرات {change.table}: {str(e)}')
@@ -1,19 +1,82 @@
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import os
+from db.migrations import apply_migrations
+from db.archive import ARCHIVE_ALIAS, archive_path_for, ensure_archive_schema
+from db.settings import SettingsRegistry
+from db.change_bus import ChangeBus
+
+BUSY_TIMEOUT_MS = 5000
+LOCK_RETRY_ATTEMPTS = 5
+LOCK_RETRY_DELAY = 0.05
+# عدد الصفوف التي يقرأها iterate من cursor في كل دفعة
+ITERATE_CHUNK_SIZE = 500
 
 class Database:
-    def __init__(self, db_path='db/dar_alhayat.db'):
+    def __init__(self, db_path='db/dar_alhayat.db', busy_timeout=BUSY_TIMEOUT_MS):
         self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.archive_path = archive_path_for(db_path)
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        self.conn = None
-        self.cursor = None
+        # كل thread يحصل على اتصال خاص به حتى لا تنتظر القراءة الكتابة على cursor واحد
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.connect()
         self.create_tables()
+        self.settings = SettingsRegistry(self)
+        self.changes = ChangeBus(self)
+        self.migrate()
+        ensure_archive_schema(self)
+        self.changes.start_log()
+    
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self.connect()
+        return conn
+    
+    @property
+    def cursor(self):
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self.conn.cursor()
+            self._local.cursor = cursor
+        return cursor
     
     def connect(self):
-        self.conn = sqlite3.connect(self.db_path)
-        self.cursor = self.conn.cursor()
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout / 1000,
+                               check_same_thread=False)
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        self._run_with_retry(conn.execute, 'PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'ATTACH DATABASE ? AS {ARCHIVE_ALIAS}', (self.archive_path,))
+        self._run_with_retry(conn.execute, f'PRAGMA {ARCHIVE_ALIAS}.journal_mode = WAL')
+        
+        self._local.conn = conn
+        self._local.cursor = conn.cursor()
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
+    def _is_lock_error(self, error):
+        message = str(error).lower()
+        return 'locked' in message or 'busy' in message
+    
+    def _run_with_retry(self, func, *args):
+        delay = LOCK_RETRY_DELAY
+        for attempt in range(LOCK_RETRY_ATTEMPTS):
+            try:
+                return func(*args)
+            except sqlite3.OperationalError as e:
+                if not self._is_lock_error(e) or attempt == LOCK_RETRY_ATTEMPTS - 1:
+                    raise
+                time.sleep(delay)
+                delay *= 2
     
     def create_tables(self):
         self.cursor.execute('''
@@ -118,14 +181,7 @@ class Database:
             )
         ''')
         
-        self.cursor.execute('''
-            SELECT COUNT(*) FROM users WHERE username = 'admin'
-        ''')
-        if self.cursor.fetchone()[0] == 0:
-            self.cursor.execute('''
-                INSERT INTO users (username, password, full_name, role)
-                VALUES ('admin', 'admin123', 'مدير النظام', 'admin')
-            ''')
+        # المستخدم admin ينشئه AuthManager.initialize_default_users بكلمة مرور مشفرة
         
         self.cursor.execute('''
             SELECT COUNT(*) FROM settings WHERE setting_key = 'cigarette_pack_price'
@@ -156,19 +212,109 @@ class Database:
         
         self.conn.commit()
     
+    def migrate(self):
+        return apply_migrations(self)
+    
+    def in_transaction(self):
+        return getattr(self._local, 'tx_depth', 0) > 0
+    
+    @contextmanager
+    def transaction(self):
+        # وحدة عمل واحدة: كل عمليات الكتابة داخل الـ with تُحفظ بـ commit واحد
+        # والاستدعاءات المتداخلة تستخدم SAVEPOINT داخل نفس المعاملة
+        conn = self.conn
+        depth = getattr(self._local, 'tx_depth', 0)
+        savepoint = f'sp_{depth}'
+        if depth == 0:
+            if conn.in_transaction:
+                conn.commit()
+            self._run_with_retry(conn.execute, 'BEGIN IMMEDIATE')
+        else:
+            conn.execute(f'SAVEPOINT {savepoint}')
+        
+        if depth == 0:
+            self._local.after_commit = []
+        pending_callbacks = len(self._local.after_commit)
+        self._local.tx_depth = depth + 1
+        try:
+            yield self
+        except BaseException:
+            self._local.tx_depth = depth
+            # ما سُجل داخل الجزء الذي تم التراجع عنه لا يُنفذ
+            del self._local.after_commit[pending_callbacks:]
+            if depth == 0:
+                conn.rollback()
+            else:
+                conn.execute(f'ROLLBACK TO {savepoint}')
+                conn.execute(f'RELEASE {savepoint}')
+            raise
+        
+        self._local.tx_depth = depth
+        if depth == 0:
+            self._run_with_retry(conn.commit)
+            callbacks, self._local.after_commit = self._local.after_commit, []
+            for callback in callbacks:
+                callback()
+        else:
+            conn.execute(f'RELEASE {savepoint}')
+    
+    def on_commit(self, callback):
+        # تنفيذ callback بعد commit المعاملة الحالية فقط (فوراً خارج أي معاملة)
+        if self.in_transaction():
+            self._local.after_commit.append(callback)
+        else:
+            callback()
+    
     def execute(self, query, params=()):
-        self.cursor.execute(query, params)
-        self.conn.commit()
-        return self.cursor
+        conn = self.conn
+        cursor = conn.cursor()
+        self._run_with_retry(cursor.execute, query, params)
+        if not self.in_transaction():
+            self._run_with_retry(conn.commit)
+        return cursor
+    
+    def executemany(self, query, params_seq):
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.executemany(query, params_seq)
+        return cursor
     
     def fetchall(self, query, params=()):
-        self.cursor.execute(query, params)
-        return self.cursor.fetchall()
+        cursor = self.conn.cursor()
+        self._run_with_retry(cursor.execute, query, params)
+        return cursor.fetchall()
+    
+    def iterate(self, query, params=(), chunk_size=ITERATE_CHUNK_SIZE):
+        # مثل fetchall لكن يقرأ الصفوف دفعات بحجم chunk_size، فالذاكرة لا تتجاوز دفعة
+        # واحدة مهما كبر الجدول. يُستهلك في نفس الخيط لأن الاتصال خاص بالخيط
+        cursor = self.conn.cursor()
+        cursor.arraysize = chunk_size
+        self._run_with_retry(cursor.execute, query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
     
     def fetchone(self, query, params=()):
-        self.cursor.execute(query, params)
-        return self.cursor.fetchone()
+        cursor = self.conn.cursor()
+        self._run_with_retry(cursor.execute, query, params)
+        return cursor.fetchone()
+    
+    def checkpoint(self):
+        # نقل محتوى ملف WAL إلى ملف القاعدة قبل نسخه كملف
+        return self.fetchone('PRAGMA wal_checkpoint(TRUNCATE)')
     
     def close(self):
-        if self.conn:
-            self.conn.close()
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
@@ -0,0 +1,309 @@
+# ترقيات مخطط قاعدة البيانات حسب الإصدار (PRAGMA user_version)
+# كل ترقية = (رقم الإصدار, قائمة خطوات). الخطوة إما أمر SQL أو دالة تستقبل db.
+# لا تعدّل ترقية تم نشرها؛ أضف ترقية جديدة برقم أكبر.
+
+def _seed_cigarette_price_history(db):
+    from modules.cigarette_prices import CigarettePriceHistory, DEFAULT_PACK_PRICE
+    history = CigarettePriceHistory(db)
+    result = db.fetchone("SELECT setting_value FROM settings WHERE setting_key = 'cigarette_pack_price'")
+    current_price = float(result[0]) if result else DEFAULT_PACK_PRICE
+    history.ensure_base_price(current_price)
+    history.import_audit_log()
+    # السعر الحالي في الإعدادات هو المرجع لو اختلف عن آخر تغيير مسجل
+    if abs(history.price_on() - current_price) > 0.005:
+        history.set_price(current_price, source='settings')
+
+def _create_patients_search_index(db):
+    from modules.search import create_patients_index
+    create_patients_index(db)
+
+def _create_search_index(db):
+    from modules.search import create_search_index
+    create_search_index(db)
+
+MIGRATIONS = [
+    (1, [
+        # مجموع ومدفوعات المريض: WHERE patient_id = ? ORDER BY payment_date
+        'CREATE INDEX IF NOT EXISTS idx_payments_patient ON payments (patient_id, payment_date, amount)',
+        # الإيرادات حسب الفترة
+        'CREATE INDEX IF NOT EXISTS idx_payments_date ON payments (payment_date, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (expense_date, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses (category, amount)',
+        # رصيد الموظف: GROUP BY transaction_type لموظف واحد
+        'CREATE INDEX IF NOT EXISTS idx_employee_transactions_employee ON employee_transactions (employee_id, transaction_type, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_employee_transactions_date ON employee_transactions (transaction_date)',
+        # عدادات لوحة التحكم وصفحة السجائر
+        'CREATE INDEX IF NOT EXISTS idx_patients_status ON patients (status, receives_cigarettes, cigarettes_count)',
+        'CREATE INDEX IF NOT EXISTS idx_employees_status ON employees (status)',
+        'CREATE INDEX IF NOT EXISTS idx_audit_log_action ON audit_log (action_type, created_at)',
+    ]),
+    (2, [
+        # إجماليات مدفوعات كل مريض تحدّثها triggers بدلاً من SUM عند كل قراءة
+        '''
+            CREATE TABLE IF NOT EXISTS patient_ledger_totals (
+                patient_id INTEGER PRIMARY KEY,
+                total_paid REAL NOT NULL DEFAULT 0,
+                payment_count INTEGER NOT NULL DEFAULT 0,
+                last_payment_date TEXT
+            )
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_ledger_insert
+            AFTER INSERT ON payments
+            BEGIN
+                INSERT OR IGNORE INTO patient_ledger_totals (patient_id) VALUES (NEW.patient_id);
+                UPDATE patient_ledger_totals
+                SET total_paid = total_paid + NEW.amount,
+                    payment_count = payment_count + 1,
+                    last_payment_date = CASE
+                        WHEN last_payment_date IS NULL OR NEW.payment_date > last_payment_date
+                        THEN NEW.payment_date ELSE last_payment_date END
+                WHERE patient_id = NEW.patient_id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_ledger_delete
+            AFTER DELETE ON payments
+            BEGIN
+                UPDATE patient_ledger_totals
+                SET total_paid = total_paid - OLD.amount,
+                    payment_count = payment_count - 1,
+                    last_payment_date = (SELECT MAX(payment_date) FROM payments
+                                         WHERE patient_id = OLD.patient_id)
+                WHERE patient_id = OLD.patient_id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_ledger_update
+            AFTER UPDATE OF patient_id, amount, payment_date ON payments
+            BEGIN
+                UPDATE patient_ledger_totals
+                SET total_paid = total_paid - OLD.amount,
+                    payment_count = payment_count - 1,
+                    last_payment_date = (SELECT MAX(payment_date) FROM payments
+                                         WHERE patient_id = OLD.patient_id)
+                WHERE patient_id = OLD.patient_id;
+                INSERT OR IGNORE INTO patient_ledger_totals (patient_id) VALUES (NEW.patient_id);
+                UPDATE patient_ledger_totals
+                SET total_paid = total_paid + NEW.amount,
+                    payment_count = payment_count + 1,
+                    last_payment_date = (SELECT MAX(payment_date) FROM payments
+                                         WHERE patient_id = NEW.patient_id)
+                WHERE patient_id = NEW.patient_id;
+            END
+        ''',
+        '''
+            INSERT OR REPLACE INTO patient_ledger_totals
+                (patient_id, total_paid, payment_count, last_payment_date)
+            SELECT patient_id, SUM(amount), COUNT(*), MAX(payment_date)
+            FROM payments
+            GROUP BY patient_id
+        ''',
+    ]),
+    (3, [
+        # سطر مستحقات لكل مريض لكل يوم (إقامة / سجائر) يكتبه modules.accruals
+        '''
+            CREATE TABLE IF NOT EXISTS charges (
+                patient_id INTEGER NOT NULL,
+                charge_type TEXT NOT NULL,
+                charge_date TEXT NOT NULL,
+                amount REAL NOT NULL,
+                PRIMARY KEY (patient_id, charge_type, charge_date)
+            ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_charges_date ON charges (charge_date, charge_type, amount)',
+        'ALTER TABLE patient_ledger_totals ADD COLUMN accommodation_charged REAL NOT NULL DEFAULT 0',
+        'ALTER TABLE patient_ledger_totals ADD COLUMN cigarettes_charged REAL NOT NULL DEFAULT 0',
+        'ALTER TABLE patient_ledger_totals ADD COLUMN charged_days INTEGER NOT NULL DEFAULT 0',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_charges_ledger_insert
+            AFTER INSERT ON charges
+            BEGIN
+                INSERT OR IGNORE INTO patient_ledger_totals (patient_id) VALUES (NEW.patient_id);
+                UPDATE patient_ledger_totals
+                SET accommodation_charged = accommodation_charged
+                        + CASE WHEN NEW.charge_type = 'accommodation' THEN NEW.amount ELSE 0 END,
+                    cigarettes_charged = cigarettes_charged
+                        + CASE WHEN NEW.charge_type = 'cigarettes' THEN NEW.amount ELSE 0 END,
+                    charged_days = charged_days
+                        + CASE WHEN NEW.charge_type = 'accommodation' THEN 1 ELSE 0 END
+                WHERE patient_id = NEW.patient_id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_charges_ledger_delete
+            AFTER DELETE ON charges
+            BEGIN
+                UPDATE patient_ledger_totals
+                SET accommodation_charged = accommodation_charged
+                        - CASE WHEN OLD.charge_type = 'accommodation' THEN OLD.amount ELSE 0 END,
+                    cigarettes_charged = cigarettes_charged
+                        - CASE WHEN OLD.charge_type = 'cigarettes' THEN OLD.amount ELSE 0 END,
+                    charged_days = charged_days
+                        - CASE WHEN OLD.charge_type = 'accommodation' THEN 1 ELSE 0 END
+                WHERE patient_id = OLD.patient_id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_patients_charges_delete
+            AFTER DELETE ON patients
+            BEGIN
+                DELETE FROM charges WHERE patient_id = OLD.id;
+            END
+        ''',
+    ]),
+    (4, [
+        # سعر علبة السجائر بتاريخ سريان مع مجموع تراكمي (modules.cigarette_prices)
+        '''
+            CREATE TABLE IF NOT EXISTS cigarette_price_history (
+                day_number INTEGER PRIMARY KEY,
+                effective_date TEXT NOT NULL,
+                price REAL NOT NULL,
+                cumulative_cost REAL NOT NULL DEFAULT 0,
+                source TEXT
+            ) WITHOUT ROWID
+        ''',
+        _seed_cigarette_price_history,
+        # مستحقات السجائر السابقة حُسبت بالسعر الحالي؛ يعاد تسجيلها بسعر كل يوم
+        "DELETE FROM charges WHERE charge_type = 'cigarettes'",
+    ]),
+    (5, [
+        # التكلفة اليومية والقسم لكل مريض بتاريخ سريان (modules.rates)
+        '''
+            CREATE TABLE IF NOT EXISTS patient_rate_history (
+                patient_id INTEGER NOT NULL,
+                effective_date TEXT NOT NULL,
+                daily_cost REAL NOT NULL,
+                department TEXT NOT NULL,
+                PRIMARY KEY (patient_id, effective_date)
+            ) WITHOUT ROWID
+        ''',
+        '''
+            INSERT OR IGNORE INTO patient_rate_history (patient_id, effective_date, daily_cost, department)
+            SELECT id, substr(admission_date, 1, 10), daily_cost, department
+            FROM patients
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_patients_rate_insert
+            AFTER INSERT ON patients
+            BEGIN
+                INSERT OR IGNORE INTO patient_rate_history (patient_id, effective_date, daily_cost, department)
+                VALUES (NEW.id, substr(NEW.admission_date, 1, 10), NEW.daily_cost, NEW.department);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_patients_rate_delete
+            AFTER DELETE ON patients
+            BEGIN
+                DELETE FROM patient_rate_history WHERE patient_id = OLD.id;
+            END
+        ''',
+        # قسم المريض في يوم المستحق حتى تُنسب الإيرادات للقسم الصحيح
+        'ALTER TABLE charges ADD COLUMN department TEXT',
+        '''
+            UPDATE charges
+            SET department = (SELECT department FROM patients WHERE id = charges.patient_id)
+        ''',
+    ]),
+    (6, [
+        # أحداث ChangeBus لكل الأجهزة المشتركة في القاعدة (db.change_bus)؛
+        # origin يميز أحداث البرنامج نفسه عن أحداث الأجهزة الأخرى
+        '''
+            CREATE TABLE IF NOT EXISTS change_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id,
+                op TEXT NOT NULL,
+                origin TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+    ]),
+    (7, [
+        # فهرس بحث FTS5 لأسماء المرضى وهواتفهم بعد توحيد الحروف (modules.search)
+        _create_patients_search_index,
+    ]),
+    (8, [
+        # فهرس موحد للمدفوعات والمصروفات والموظفين وحركاتهم للبحث الشامل (Ctrl+K)
+        _create_search_index,
+    ]),
+    (9, [
+        # صفحات الشاشات بالترتيب (مفتاح، id): فهرس على المفتاح وحده يحتوي id ضمنياً.
+        # المدفوعات والمصروفات بالتاريخ تكفيها idx_payments_date و idx_expenses_date من (1)
+        'CREATE INDEX IF NOT EXISTS idx_patients_name ON patients (name)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_admission ON patients (admission_date)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_status_name ON patients (status, name)',
+        'CREATE INDEX IF NOT EXISTS idx_patients_status_admission ON patients (status, admission_date)',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_category_date ON expenses (category, expense_date)',
+        'CREATE INDEX IF NOT EXISTS idx_employee_transactions_employee_date ON employee_transactions (employee_id, transaction_date)',
+    ]),
+    (10, [
+        # آخر قيم مؤشرات لوحة التحكم مع رقم آخر حدث في change_log حُسبت عنده
+        # (modules.dashboard_stats). value بلا نوع حتى تبقى الأعداد الصحيحة صحيحة
+        '''
+            CREATE TABLE IF NOT EXISTS dashboard_snapshot (
+                name TEXT PRIMARY KEY,
+                value NOT NULL,
+                change_id INTEGER NOT NULL
+            )
+        ''',
+    ]),
+    (11, [
+        # عدد السجائر اليومي (0 = لا يستلم) يصبح جزءاً من سجل الأسعار بتاريخ سريان، فتفعيل
+        # السجائر أو إيقافها أو تغيير عددها يسري من تاريخه ولا يعيد كتابة المستحقات السابقة.
+        # السطور القديمة تأخذ إعداد المريض الحالي كما كانت المستحقات تُحسب قبل الترقية
+        'ALTER TABLE patient_rate_history ADD COLUMN cigarettes_count INTEGER NOT NULL DEFAULT 0',
+        '''
+            UPDATE patient_rate_history
+            SET cigarettes_count = (
+                SELECT CASE WHEN p.receives_cigarettes THEN COALESCE(p.cigarettes_count, 0) ELSE 0 END
+                FROM patients p WHERE p.id = patient_rate_history.patient_id
+            )
+            WHERE patient_id IN (SELECT id FROM patients)
+        ''',
+        'DROP TRIGGER IF EXISTS trg_patients_rate_insert',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_patients_rate_insert
+            AFTER INSERT ON patients
+            BEGIN
+                INSERT OR IGNORE INTO patient_rate_history
+                    (patient_id, effective_date, daily_cost, department, cigarettes_count)
+                VALUES (NEW.id, substr(NEW.admission_date, 1, 10), NEW.daily_cost, NEW.department,
+                        CASE WHEN NEW.receives_cigarettes THEN COALESCE(NEW.cigarettes_count, 0) ELSE 0 END);
+            END
+        ''',
+    ]),
+    (12, [
+        # فهرسان كانت (9) تنشئهما وهما بادئة لـ idx_payments_date و idx_expenses_date،
+        # فلا يستفيد منهما استعلام ويكلفان كل كتابة. نسختهما في الأرشيف تُحذف أيضاً
+        'DROP INDEX IF EXISTS main.idx_payments_date_id',
+        'DROP INDEX IF EXISTS main.idx_expenses_date_id',
+        'DROP INDEX IF EXISTS archive.idx_payments_date_id',
+        'DROP INDEX IF EXISTS archive.idx_expenses_date_id',
+    ]),
+]
+
+def get_schema_version(db):
+    return db.fetchone('PRAGMA user_version')[0]
+
+def apply_migrations(db):
+    applied = []
+    for version, steps in MIGRATIONS:
+        if version <= get_schema_version(db):
+            continue
+
+        with db.transaction():
+            # جهاز آخر ربما رقّى القاعدة بينما كنا ننتظر القفل
+            if version <= get_schema_version(db):
+                continue
+            for step in steps:
+                if callable(step):
+                    step(db)
+                else:
+                    db.execute(step)
+            db.execute(f'PRAGMA user_version = {int(version)}')
+        applied.append(version)
+
+    if applied:
+        db.execute('PRAGMA optimize')
+    return applied
@@ -0,0 +1,47 @@
+from collections import namedtuple
+
+# عدد الصفوف في كل صفحة تقرأها الشاشات؛ الصفحة التالية تُطلب عند الوصول لآخر الجدول
+PAGE_SIZE = 200
+
+# cursor = (قيمة مفتاح الترتيب، id) لآخر صف؛ يُمرر كـ after لقراءة الصفحة التالية
+Page = namedtuple('Page', ['rows', 'cursor', 'has_more'])
+
+def _where(conditions):
+    return f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+def _after_condition(key, id_column, descending, null_key):
+    # SQLite يرتب NULL أولاً تصاعدياً وأخيراً تنازلياً، و (NULL, id) > (?, ?) قيمتها NULL
+    # فلا تطابق أي صف؛ لذلك المفتاح الفارغ له فرع IS NULL صريح في الاتجاهين
+    if descending:
+        if null_key:
+            return f'({key} IS NULL AND {id_column} < ?)'
+        return f'(({key}, {id_column}) < (?, ?) OR {key} IS NULL)'
+    if null_key:
+        return f'(({key} IS NULL AND {id_column} > ?) OR {key} IS NOT NULL)'
+    return f'({key}, {id_column}) > (?, ?)'
+
+def keyset_page(db, columns, source, key, descending=False, conditions=(), params=(),
+                after=None, limit=PAGE_SIZE, id_column='id'):
+    # صفحة بالترتيب (key, id) تبدأ بعد after. المقارنة على (key, id) بدلاً من OFFSET
+    # فتكلفة الصفحة الأخيرة مثل الأولى ما دام هناك فهرس على key
+    conditions = list(conditions)
+    params = list(params)
+    if after is not None:
+        conditions.append(_after_condition(key, id_column, descending, after[0] is None))
+        params.extend(after[1:] if after[0] is None else after)
+    direction = 'DESC' if descending else 'ASC'
+    rows = db.fetchall(f'''
+        SELECT {columns}, {key}, {id_column}
+        FROM {source}
+        {_where(conditions)}
+        ORDER BY {key} {direction}, {id_column} {direction}
+        LIMIT ?
+    ''', tuple(params) + (limit + 1,))
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = tuple(rows[-1][-2:]) if rows else after
+    return Page([row[:-2] for row in rows], cursor, has_more)
+
+def count_rows(db, source, conditions=(), params=()):
+    return db.fetchone(f'SELECT COUNT(*) FROM {source} {_where(conditions)}', tuple(params))[0]
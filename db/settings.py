@@ -0,0 +1,99 @@
+import threading
+from datetime import datetime
+
+def positive_int(raw):
+    # عدد يُقسم عليه (مثل عدد السجائر في العلبة): صفر أو سالب يعامل كقيمة غير صالحة
+    value = int(raw)
+    if value <= 0:
+        raise ValueError(f'{raw} ليس عدداً موجباً')
+    return value
+
+# الإعدادات المعروفة: (النوع، القيمة الافتراضية). المفاتيح غير المسجلة تُقرأ كنص.
+# القيمة الفارغة أو التي يرفضها النوع (ValueError) تُقرأ كالقيمة الافتراضية
+SETTINGS = {
+    'cigarette_pack_price': (float, 40.0),
+    'cigarette_box_cost': (float, 40.0),
+    'cigarettes_per_box': (positive_int, 20),
+    'archive_boundary': (str, None),
+}
+
+class SettingsRegistry:
+    # جدول settings في الذاكرة: يُحمّل مرة واحدة، والقراءة من الذاكرة، والكتابة تمر
+    # على القاعدة داخل transaction ولا تظهر في الذاكرة إلا بعد commit.
+    # المستمعون (callback(key, value)) يُستدعون بعد commit من الخيط الذي كتب.
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._values = {}
+        self._listeners = []
+        self.reload()
+
+    def _convert(self, key, raw):
+        value_type, default = SETTINGS.get(key, (str, None))
+        if raw is None or raw == '':
+            return default
+        try:
+            return value_type(raw)
+        except ValueError:
+            return default
+
+    def reload(self):
+        # بعد استيراد قاعدة أخرى أو تعديل من خارج البرنامج
+        rows = self.db.fetchall('SELECT setting_key, setting_value FROM settings')
+        values = {key: self._convert(key, raw) for key, raw in rows}
+        with self._lock:
+            changed = [key for key in set(values) | set(self._values)
+                       if values.get(key) != self._values.get(key)]
+            self._values = values
+        for key in changed:
+            self._notify(key, self.get(key))
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+        if key in SETTINGS:
+            return SETTINGS[key][1]
+        return default
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.db.transaction():
+            self.db.executemany('''
+                INSERT INTO settings (setting_key, setting_value, updated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(setting_key) DO UPDATE SET
+                    setting_value = excluded.setting_value,
+                    updated_at = excluded.updated_at
+            ''', [(key, '' if value is None else str(value), now) for key, value in values.items()])
+            for key in values:
+                self.db.changes.publish('settings', key)
+            self.db.on_commit(lambda: self._apply(values))
+
+    def _apply(self, values):
+        changed = {}
+        with self._lock:
+            for key, value in values.items():
+                value = self._convert(key, None if value is None else str(value))
+                if self._values.get(key) != value:
+                    self._values[key] = value
+                    changed[key] = value
+        for key, value in changed.items():
+            self._notify(key, value)
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, key, value):
+        for callback in list(self._listeners):
+            try:
+                callback(key, value)
+            except Exception as e:
+                print(f'خطأ في مستمع الإعدادات {key}: {str(e)}')
@@ -1,24 +1,36 @@
 import sys
 import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.startup_profiler import StartupProfiler
+
+# أزمنة الإقلاع تُكتب في startup_log.txt؛ أزمنة الاستيراد عند التشغيل كبرنامج فقط
+profiler = StartupProfiler()
+if __name__ == '__main__':
+    profiler.install()
+
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLabel, QStackedWidget,
                              QMessageBox, QLineEdit, QFrame)
 from PyQt6.QtCore import Qt, QCoreApplication, QTimer
-from PyQt6.QtGui import QFont, QPalette, QColor, QKeyEvent
-import qdarkstyle
+from PyQt6.QtGui import QFont, QPalette, QColor, QKeyEvent, QKeySequence, QShortcut
 from typing import cast
-import shutil
 from datetime import datetime
 
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-
 from db.database import Database
+from db.backup_store import BackupStore
 from modules.patients import PatientManager
 from modules.payments import PaymentManager
 from modules.expenses import ExpenseManager
 from modules.employees import EmployeeManager
 from modules.auth import AuthManager
+from modules.search import SearchService
 from ui.dashboard import DashboardWidget
+from ui.db_worker import DatabaseWorker
+from ui.settings_notifier import SettingsNotifier
+from ui.change_notifier import ChangeNotifier, select_row
+from ui.search_dialog import SearchDialog
 from ui.patients_widget import PatientsWidget
 from ui.payments_widget import PaymentsWidget
 from ui.expenses_widget import ExpensesWidget
@@ -29,6 +41,12 @@ from ui.calculator_widget import CalculatorWidget
 from ui.import_patients_widget import ImportPatientsWidget  # --- NEW FEATURE ---
 from ui.text_editor_widget import TextEditorWidget  # --- NEW FEATURE ---
 
+DB_PATH = 'dar_alhayat_accounting/db/dar_alhayat.db'
+# عدد صفحات stacked_widget بترتيب أزرار الشريط الجانبي
+PAGE_COUNT = 10
+
+profiler.checkpoint('استيراد الوحدات')
+
 class LoginWindow(QWidget):
     def __init__(self, main_app):
         super().__init__()
@@ -93,16 +111,26 @@ class LoginWindow(QWidget):
             QMessageBox.warning(self, 'خطأ', 'اسم المستخدم أو كلمة المرور غير صحيحة')
 
 class MainWindow(QMainWindow):
-    def __init__(self, current_user=None):  # --- NEW FEATURE: User Permissions ---
+    def __init__(self, current_user=None, db=None):  # --- NEW FEATURE: User Permissions ---
         super().__init__()
         self.current_user = current_user  # --- NEW FEATURE: User Permissions ---
-        self.db = Database('dar_alhayat_accounting/db/dar_alhayat.db')
+        # نفس اتصال Application بدلاً من فتح القاعدة وفحص ترحيلاتها مرة ثانية
+        self.db = db or Database(DB_PATH)
         self.patient_mgr = PatientManager(self.db)
         self.payment_mgr = PaymentManager(self.db)
         self.expense_mgr = ExpenseManager(self.db)
         self.employee_mgr = EmployeeManager(self.db)
+        self.db_worker = DatabaseWorker(self)
+        self.db_worker.progress.connect(self.show_db_progress)
+        self.settings_notifier = SettingsNotifier(self.db.settings, self)
+        self.change_notifier = ChangeNotifier(self.db.changes, self)
+        self.search_service = SearchService(self.db)
+        self.search_dialog = None
+        self.backup_store = BackupStore.for_database(self.db.db_path)
+        self.archive_store = BackupStore(os.path.join(os.path.dirname(self.db.db_path), 'backups', 'archive_store'))
         self.current_theme = 'dark'
         self.sidebar_widget = None
+        self.pages = {}
         self.is_fullscreen = False
         
         self.setWindowTitle('دار الحياة - نظام المحاسبة')
@@ -120,31 +148,10 @@ class MainWindow(QMainWindow):
         
         self.stacked_widget = QStackedWidget()
         
-        self.dashboard = DashboardWidget(self.db, self.patient_mgr, 
-                                        self.payment_mgr, self.expense_mgr, 
-                                        self.employee_mgr)
-        # --- NEW FEATURE: Pass current_user to widgets for permission checks ---
-        self.patients_widget = PatientsWidget(self.db, self.patient_mgr, self.payment_mgr, self.current_user)
-        self.payments_widget = PaymentsWidget(self.db, self.payment_mgr, self.patient_mgr, self.current_user)
-        self.expenses_widget = ExpensesWidget(self.db, self.expense_mgr, self.current_user)
-        self.employees_widget = EmployeesWidget(self.db, self.employee_mgr, self.current_user)
-        self.cigarettes_widget = CigarettesWidget(self.db, self.patient_mgr, self.current_user)  # --- FIX (تمرير المستخدم الحالي) ---
-        self.import_patients_widget = ImportPatientsWidget(self.db, self.patient_mgr)  # --- NEW FEATURE ---
-        self.text_editor_widget = TextEditorWidget()  # --- NEW FEATURE ---
-        self.calculator_widget = CalculatorWidget()
-        self.settings_widget = SettingsWidget(self.db)
-        self.settings_widget.theme_changed.connect(self.change_theme)
-        
-        self.stacked_widget.addWidget(self.dashboard)
-        self.stacked_widget.addWidget(self.patients_widget)
-        self.stacked_widget.addWidget(self.payments_widget)
-        self.stacked_widget.addWidget(self.expenses_widget)
-        self.stacked_widget.addWidget(self.employees_widget)
-        self.stacked_widget.addWidget(self.cigarettes_widget)
-        self.stacked_widget.addWidget(self.import_patients_widget)  # --- NEW FEATURE ---
-        self.stacked_widget.addWidget(self.text_editor_widget)  # --- NEW FEATURE ---
-        self.stacked_widget.addWidget(self.calculator_widget)
-        self.stacked_widget.addWidget(self.settings_widget)
+        # لوحة التحكم فقط تُبنى عند الدخول؛ باقي الصفحات عند أول زيارة (page)
+        for index in range(PAGE_COUNT):
+            self.stacked_widget.addWidget(QWidget())
+        self.page(0)
         
         self.sidebar_widget = self.create_sidebar()
         
@@ -152,6 +159,10 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(self.sidebar_widget)
         
         central_widget.setLayout(main_layout)
+        
+        # بحث شامل من أي شاشة؛ Ctrl+F أيضاً لأن Ctrl+K يحذف حتى نهاية السطر في حقول الإدخال
+        for key in ('Ctrl+K', 'Ctrl+F'):
+            QShortcut(QKeySequence(key), self).activated.connect(self.open_search)
     
     def create_sidebar(self):
         sidebar = QFrame()
@@ -215,11 +226,99 @@ class MainWindow(QMainWindow):
         return sidebar
     
     def change_page(self, index):
+        # الصفحات تتحدث بأحداث ChangeBus؛ لوحة التحكم والسجائر تؤجل التحديث حتى تظهر
+        self.page(index)
         self.stacked_widget.setCurrentIndex(index)
+    
+    def page(self, index):
+        # الصفحة تُبنى عند أول طلب وتحل محل الـ placeholder في نفس الموضع؛ بياناتها
+        # تُقرأ في خيط قاعدة البيانات بعد ظهورها
+        widget = self.pages.get(index)
+        if widget is None:
+            widget = self.pages[index] = self.create_page(index)
+            placeholder = self.stacked_widget.widget(index)
+            was_current = self.stacked_widget.currentWidget() is placeholder
+            self.stacked_widget.insertWidget(index, widget)
+            self.stacked_widget.removeWidget(placeholder)
+            placeholder.deleteLater()
+            if was_current:
+                self.stacked_widget.setCurrentWidget(widget)
+        return widget
+    
+    def create_page(self, index):
+        # --- NEW FEATURE: Pass current_user to widgets for permission checks ---
         if index == 0:
-            self.dashboard.refresh_data()
+            self.dashboard = DashboardWidget(self.db, self.patient_mgr, self.payment_mgr, self.expense_mgr,
+                                             self.employee_mgr, self.db_worker, self.change_notifier)
+            return self.dashboard
+        elif index == 1:
+            self.patients_widget = PatientsWidget(self.db, self.patient_mgr, self.payment_mgr, self.current_user,
+                                                  self.db_worker, self.change_notifier)
+            return self.patients_widget
+        elif index == 2:
+            self.payments_widget = PaymentsWidget(self.db, self.payment_mgr, self.patient_mgr, self.current_user,
+                                                  self.db_worker, self.change_notifier)
+            return self.payments_widget
+        elif index == 3:
+            self.expenses_widget = ExpensesWidget(self.db, self.expense_mgr, self.current_user,
+                                                  self.db_worker, self.change_notifier)
+            return self.expenses_widget
+        elif index == 4:
+            self.employees_widget = EmployeesWidget(self.db, self.employee_mgr, self.current_user,
+                                                    self.db_worker, self.change_notifier)
+            return self.employees_widget
         elif index == 5:
-            self.cigarettes_widget.load_cigarettes_data()
+            self.cigarettes_widget = CigarettesWidget(self.db, self.patient_mgr, self.current_user, self.db_worker,
+                                                      self.settings_notifier, self.change_notifier)  # --- FIX (تمرير المستخدم الحالي) ---
+            return self.cigarettes_widget
+        elif index == 6:
+            self.import_patients_widget = ImportPatientsWidget(self.db, self.patient_mgr)  # --- NEW FEATURE ---
+            return self.import_patients_widget
+        elif index == 7:
+            self.text_editor_widget = TextEditorWidget()  # --- NEW FEATURE ---
+            return self.text_editor_widget
+        elif index == 8:
+            self.calculator_widget = CalculatorWidget()
+            return self.calculator_widget
+        elif index == 9:
+            self.settings_widget = SettingsWidget(self.db, self.db_worker)
+            self.settings_widget.theme_changed.connect(self.change_theme)
+            return self.settings_widget
+    
+    def open_search(self):
+        if self.search_dialog is None:
+            self.search_dialog = SearchDialog(self.search_service, self.db_worker, self)
+            self.search_dialog.result_chosen.connect(self.show_search_result)
+        self.search_dialog.search_input.selectAll()
+        self.search_dialog.search_input.setFocus()
+        self.search_dialog.show()
+        self.search_dialog.raise_()
+        self.search_dialog.activateWindow()
+    
+    def show_search_result(self, result):
+        # الصفحة قد تُبنى الآن، فالتحديد ينتظر وصول صفحتها الأولى
+        if result.entity == 'patients':
+            self.change_page(1)
+            self.patients_widget.model.when_loaded(
+                lambda: select_row(self.patients_widget.table, result.entity_id)
+                or self.patients_widget.view_patient_statement(result.entity_id))
+        elif result.entity == 'payments':
+            self.change_page(2)
+            self.select_result(self.payments_widget, result.entity_id)
+        elif result.entity == 'expenses':
+            self.change_page(3)
+            self.select_result(self.expenses_widget, result.entity_id)
+        elif result.entity == 'employees':
+            self.change_page(4)
+            self.select_result(self.employees_widget, result.entity_id)
+        elif result.entity == 'employee_transactions':
+            # الحركات تُعرض في تفاصيل الموظف
+            self.change_page(4)
+            self.select_result(self.employees_widget, result.owner_id)
+            self.employees_widget.view_employee_details(result.owner_id)
+    
+    def select_result(self, widget, row_id):
+        widget.model.when_loaded(lambda: select_row(widget.table, row_id))
     
     def change_theme(self, theme_name):
         app = cast(QApplication, QApplication.instance())
@@ -381,7 +480,7 @@ class MainWindow(QMainWindow):
                 ''')
         elif theme_name == 'الوضع الليلي' and self.current_theme != 'dark':
             self.current_theme = 'dark'
-            app.setStyleSheet(qdarkstyle.load_stylesheet(qt_api='pyqt6'))
+            app.setStyleSheet(app.dark_stylesheet())
             
             if self.sidebar_widget:
                 self.sidebar_widget.setStyleSheet('''
@@ -409,26 +508,58 @@ class MainWindow(QMainWindow):
         self.auto_save_timer = QTimer(self)
         self.auto_save_timer.timeout.connect(self.auto_save_database)
         self.auto_save_timer.start(300000)
+        
+        # تسجيل مستحقات اليوم الجديد حتى لو بقي البرنامج مفتوحاً بعد منتصف الليل
+        self.accrual_timer = QTimer(self)
+        self.accrual_timer.timeout.connect(self.run_accruals)
+        self.accrual_timer.start(3600000)
+        # والأيام التي مرت والبرنامج مغلق تُسجل فور التشغيل
+        self.run_accruals()
+        
+        # كتابات الأجهزة الأخرى على نفس القاعدة تصل للشاشات كأحداث ChangeBus
+        self.change_watch_timer = QTimer(self)
+        self.change_watch_timer.timeout.connect(self.poll_external_changes)
+        self.change_watch_timer.start(1000)
     
-    def auto_save_database(self):
+    def run_accruals(self):
+        # في خيط قاعدة البيانات؛ الأرصدة المعروضة تتحدث بأحداث patient_ledger_totals
+        self.db_worker.submit(
+            self.patient_mgr.accruals.run,
+            on_error=lambda e: print(f'خطأ في تسجيل المستحقات: {str(e)}'),
+            key='accruals'
+        )
+    
+    def poll_external_changes(self):
         try:
-            if self.db and self.db.conn:
-                self.db.conn.commit()
-                backup_dir = 'dar_alhayat_accounting/db/backups'
-                os.makedirs(backup_dir, exist_ok=True)
-                backup_file = os.path.join(
-                    backup_dir, 
-                    f'auto_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
-                )
-                shutil.copy2(self.db.db_path, backup_file)
-                
-                backups = sorted([f for f in os.listdir(backup_dir) if f.startswith('auto_backup_')])
-                if len(backups) > 10:
-                    for old_backup in backups[:-10]:
-                        os.remove(os.path.join(backup_dir, old_backup))
-                
+            self.db.changes.poll()
         except Exception as e:
-            print(f'خطأ في الحفظ التلقائي: {str(e)}')
+            print(f'خطأ في متابعة تغييرات الأجهزة الأخرى: {str(e)}')
+    
+    def auto_save_database(self):
+        # نسخة تزايدية في خيط قاعدة البيانات: تُكتب القطع المتغيرة فقط
+        self.db_worker.submit(
+            self.take_snapshot,
+            on_result=lambda result: self.statusBar().showMessage(
+                f'تم الحفظ التلقائي: {result[0]} ({result[1]} قطعة جديدة)', 5000),
+            on_error=lambda e: print(f'خطأ في الحفظ التلقائي: {str(e)}'),
+            key='auto_backup'
+        )
+    
+    def show_db_progress(self, label, done, total):
+        if label == 'auto_backup' and total:
+            self.statusBar().showMessage(f'جاري الحفظ التلقائي... {done * 100 // total}%')
+    
+    def take_snapshot(self):
+        # يعمل في خيط قاعدة البيانات
+        result = self.backup_store.snapshot(
+            self.db.db_path, label='auto', progress=self.db_worker.progress_callback('auto_backup')
+        )
+        self.backup_store.prune()
+        # الأرشيف نادراً ما يتغير، فنسخته التزايدية لا تكتب شيئاً في الغالب
+        if os.path.exists(self.db.archive_path):
+            self.archive_store.snapshot(self.db.archive_path, label='auto')
+            self.archive_store.prune()
+        return result
     
     def toggle_fullscreen(self):
         if self.is_fullscreen:
@@ -470,6 +601,11 @@ class MainWindow(QMainWindow):
         else:
             self.close()
     
+    def closeEvent(self, event):
+        # انتظار استعلامات الخلفية قبل إغلاق الاتصالات
+        self.db_worker.shutdown()
+        super().closeEvent(event)
+    
     def keyPressEvent(self, event: QKeyEvent):
         if event.key() == Qt.Key.Key_F11:
             self.toggle_fullscreen()
@@ -483,23 +619,45 @@ class Application(QApplication):
         
         default_font = QFont("Arial", 12, QFont.Weight.Bold)
         self.setFont(default_font)
+        profiler.checkpoint('QApplication')
         
-        self.setStyleSheet(qdarkstyle.load_stylesheet(qt_api='pyqt6'))
+        self._dark_stylesheet = None
+        self.setStyleSheet(self.dark_stylesheet())
+        profiler.checkpoint('الثيم الليلي')
         
-        self.db = Database('dar_alhayat_accounting/db/dar_alhayat.db')
+        self.db = Database(DB_PATH)
         auth_mgr = AuthManager(self.db)
         auth_mgr.initialize_default_users()
+        profiler.checkpoint('قاعدة البيانات والمستخدمون')
         
         self.current_user = None
         self.login_window = LoginWindow(self)
         self.main_window = None
+        profiler.checkpoint('نافذة الدخول')
+    
+    def dark_stylesheet(self):
+        # qdarkstyle يمر عبر qtpy وهو أغلى ما بقي في الإقلاع، فيُحمل مرة واحدة
+        if self._dark_stylesheet is None:
+            import qdarkstyle
+            self._dark_stylesheet = qdarkstyle.load_stylesheet(qt_api='pyqt6')
+        return self._dark_stylesheet
     
     def show_login(self):
         self.login_window.show()
+        # يُكتب السجل بعد أول دورة للأحداث حتى يشمل رسم النافذة
+        QTimer.singleShot(0, lambda: self.log_startup('إقلاع البرنامج', 'عرض نافذة الدخول'))
+    
+    def log_startup(self, title, phase):
+        profiler.checkpoint(phase)
+        profiler.uninstall()
+        profiler.write(title)
     
     def show_main_window(self):
-        self.main_window = MainWindow(self.current_user)  # --- NEW FEATURE: User Permissions ---
+        profiler.restart()
+        self.main_window = MainWindow(self.current_user, self.db)  # --- NEW FEATURE: User Permissions ---
+        profiler.checkpoint('بناء النافذة الرئيسية')
         self.main_window.show()
+        QTimer.singleShot(0, lambda: self.log_startup('فتح النافذة الرئيسية', 'عرض النافذة الرئيسية'))
 
 if __name__ == '__main__':
     app = Application()
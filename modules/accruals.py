@@ -0,0 +1,126 @@
+from datetime import date, timedelta
+from itertools import chain
+from modules.periods import to_date, DATE_FORMAT
+from modules.cigarette_prices import CigarettePriceHistory
+from modules.rates import PatientRateHistory
+from db.archive import Archive
+from db.change_bus import UPDATE
+
+ACCOMMODATION = 'accommodation'
+CIGARETTES = 'cigarettes'
+
+class AccrualEngine:
+    # يكتب سطر مستحقات لكل مريض لكل يوم في جدول charges حتى تصبح الأرصدة
+    # والكشوف مجرد SUM مفهرس. التشغيل متكرر بأمان: يبدأ كل مريض من آخر يوم مسجل له.
+    def __init__(self, db):
+        self.db = db
+        self.prices = CigarettePriceHistory(db)
+        self.rates = PatientRateHistory(db)
+        self.archive = Archive(db)
+
+    def _pending_patients(self, patient_ids=None):
+        query = '''
+            SELECT p.id,
+                   (SELECT MAX(charge_date) FROM charges
+                    WHERE patient_id = p.id AND charge_type = 'accommodation'),
+                   (SELECT MAX(charge_date) FROM charges
+                    WHERE patient_id = p.id AND charge_type = 'cigarettes')
+            FROM patients p
+        '''
+        params = ()
+        if patient_ids is not None:
+            if not patient_ids:
+                return {}
+            query += f' WHERE p.id IN ({", ".join("?" * len(patient_ids))})'
+            params = tuple(patient_ids)
+        return {row[0]: row[1:] for row in self.db.fetchall(query, params)}
+
+    def _charge_rows(self, pending, intervals, price_on, cigarettes_per_box):
+        # مرور واحد على فترات الأسعار المرتبة؛ كل يوم يُسجل بتكلفة وقسم وعدد سجائر فترته
+        for patient_id, start, end, daily_cost, department, cigarettes_count in intervals:
+            last_accommodation, last_cigarettes = pending[patient_id]
+            accommodation_from = start
+            if last_accommodation:
+                accommodation_from = max(start, to_date(last_accommodation) + timedelta(days=1))
+            cigarettes_from = None
+            if cigarettes_count:
+                packs = cigarettes_count / cigarettes_per_box
+                cigarettes_from = start
+                if last_cigarettes:
+                    cigarettes_from = max(start, to_date(last_cigarettes) + timedelta(days=1))
+
+            day = min(accommodation_from, cigarettes_from or accommodation_from)
+            while day <= end:
+                charge_date = day.strftime(DATE_FORMAT)
+                if day >= accommodation_from:
+                    yield (patient_id, ACCOMMODATION, charge_date, daily_cost, department)
+                if cigarettes_from and day >= cigarettes_from:
+                    yield (patient_id, CIGARETTES, charge_date, packs * price_on(day), department)
+                day += timedelta(days=1)
+
+    def run(self, through_date=None, patient_ids=None):
+        through = to_date(through_date or date.today())
+        if patient_ids is not None:
+            patient_ids = list(patient_ids)
+        pending = self._pending_patients(patient_ids)
+        intervals = self.rates.intervals(patient_ids, through)
+        rows = self._charge_rows(pending, intervals, self.prices.price_lookup(),
+                                 self.db.settings.get('cigarettes_per_box'))
+        first = next(rows, None)
+        if first is None:
+            return 0
+
+        charged = set()
+        def track(rows):
+            for row in rows:
+                charged.add(row[0])
+                yield row
+
+        with self.db.transaction():
+            cursor = self.db.executemany('''
+                INSERT OR IGNORE INTO charges (patient_id, charge_type, charge_date, amount, department)
+                VALUES (?, ?, ?, ?, ?)
+            ''', track(chain([first], rows)))
+            if cursor.rowcount:
+                for patient_id in charged:
+                    self.db.changes.publish('patient_ledger_totals', patient_id, UPDATE)
+        return cursor.rowcount
+
+    def invalidate(self, patient_id=None, charge_type=None, since=None):
+        # حذف المستحقات المتأثرة بتعديل ما؛ يعاد حسابها في التشغيل التالي
+        conditions = []
+        params = []
+        if patient_id is not None:
+            conditions.append('patient_id = ?')
+            params.append(patient_id)
+        if charge_type is not None:
+            conditions.append('charge_type = ?')
+            params.append(charge_type)
+        if since is not None:
+            conditions.append('charge_date >= ?')
+            params.append(to_date(since).strftime(DATE_FORMAT))
+
+        query = 'DELETE FROM charges'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        with self.db.transaction():
+            if self.db.execute(query, tuple(params)).rowcount:
+                self.db.changes.publish('patient_ledger_totals', patient_id, UPDATE)
+
+    def recalculate(self, patient_id=None, charge_type=None, since=None):
+        with self.db.transaction():
+            self.invalidate(patient_id, charge_type, since)
+            self.run(patient_ids=None if patient_id is None else [patient_id])
+
+    def get_accrued_revenue(self, period):
+        condition, params = period.where('charge_date')
+        query = f'''
+            SELECT charge_type, SUM(amount)
+            FROM {self.archive.table('charges', period)}
+            WHERE {condition}
+            GROUP BY charge_type
+        '''
+        totals = {ACCOMMODATION: 0, CIGARETTES: 0}
+        for charge_type, amount in self.db.fetchall(query, params):
+            totals[charge_type] = amount or 0
+        return totals
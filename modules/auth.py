@@ -9,6 +9,9 @@ class AuthManager:
         salt = bcrypt.gensalt()
         return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
     
+    def is_hashed(self, password):
+        return password.startswith(('$2a$', '$2b$', '$2y$'))
+    
     def verify_password(self, password, hashed):
         try:
             return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
@@ -50,10 +53,12 @@ class AuthManager:
             return False
     
     def initialize_default_users(self):
-        admin_exists = self.db.fetchone("SELECT COUNT(*) FROM users WHERE username = 'admin'")
-        if admin_exists and admin_exists[0] == 0:
+        # المستخدمون الافتراضيون يُنشؤون مرة واحدة؛ لا يعاد تشفير كلمة المرور (bcrypt) في كل تشغيل.
+        # admin بكلمة مرور غير مشفرة (قواعد أنشأتها نسخ سابقة) يأخذ كلمة المرور الافتراضية مشفرة مرة واحدة
+        admin = self.db.fetchone("SELECT password FROM users WHERE username = 'admin'")
+        if admin is None:
             self.create_user('admin', '1231', 'مدير النظام', 'admin')
-        else:
+        elif not self.is_hashed(admin[0] or ''):
             self.update_password('admin', '1231')
         
         user_exists = self.db.fetchone("SELECT COUNT(*) FROM users WHERE username = 'user'")
@@ -0,0 +1,183 @@
+import re
+from bisect import bisect_right
+from datetime import date, timedelta
+from modules.periods import to_date, DATE_FORMAT
+
+# أول يوم في السجل: السعر المسجل له يسري على كل ما قبل أول تغيير معروف
+HISTORY_START = date(2000, 1, 1)
+DEFAULT_PACK_PRICE = 40.0
+PRICE_CHANGE_ACTION = 'تغيير سعر السجائر'
+
+LOG_HEADER = re.compile(r'^===\s*تغيير سعر السجائر\s*-\s*(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2})')
+LOG_OLD_PRICE = re.compile(r'السعر القديم:\s*([\d.]+)')
+LOG_NEW_PRICE = re.compile(r'السعر الجديد:\s*([\d.]+)')
+
+class CigarettePriceHistory:
+    # سعر علبة السجائر بتاريخ سريان. كل سطر يحفظ cumulative_cost = مجموع سعر العلبة
+    # لكل يوم منذ HISTORY_START حتى اليوم السابق لسريانه، فتكلفة أي فترة
+    # هي F(end + 1) - F(start) ببحثين في المفتاح الأساسي
+    def __init__(self, db):
+        self.db = db
+
+    def _anchor(self, day_number):
+        row = self.db.fetchone('''
+            SELECT day_number, price, cumulative_cost
+            FROM cigarette_price_history
+            WHERE day_number <= ?
+            ORDER BY day_number DESC
+            LIMIT 1
+        ''', (day_number,))
+        if row is None:
+            row = self.db.fetchone('''
+                SELECT day_number, price, cumulative_cost
+                FROM cigarette_price_history
+                ORDER BY day_number
+                LIMIT 1
+            ''')
+        return row
+
+    def _cumulative(self, day):
+        day_number = to_date(day).toordinal()
+        anchor = self._anchor(day_number)
+        if anchor is None:
+            return (day_number - HISTORY_START.toordinal()) * DEFAULT_PACK_PRICE
+        anchor_day, price, cumulative = anchor
+        return cumulative + (day_number - anchor_day) * price
+
+    def price_on(self, day=None):
+        anchor = self._anchor(to_date(day or date.today()).toordinal())
+        return anchor[1] if anchor else DEFAULT_PACK_PRICE
+
+    def pack_cost(self, start, end):
+        # مجموع سعر العلبة لكل يوم من start حتى end شاملاً
+        return self._cumulative(to_date(end) + timedelta(days=1)) - self._cumulative(start)
+
+    def cost_for_interval(self, start, end, cigarettes_count):
+        return cigarettes_count / self.db.settings.get('cigarettes_per_box') * self.pack_cost(start, end)
+
+    def price_lookup(self):
+        # نسخة في الذاكرة لمحرك المستحقات الذي يسأل عن سعر كل يوم على حدة
+        rows = self.db.fetchall('SELECT day_number, price FROM cigarette_price_history ORDER BY day_number')
+        if not rows:
+            return lambda day: DEFAULT_PACK_PRICE
+        day_numbers = [row[0] for row in rows]
+        prices = [row[1] for row in rows]
+
+        def lookup(day):
+            index = bisect_right(day_numbers, to_date(day).toordinal()) - 1
+            return prices[max(index, 0)]
+        return lookup
+
+    def get_history(self):
+        return self.db.fetchall('''
+            SELECT effective_date, price, source
+            FROM cigarette_price_history
+            ORDER BY day_number DESC
+        ''')
+
+    def rebuild_cumulative(self):
+        rows = self.db.fetchall('SELECT day_number, price FROM cigarette_price_history ORDER BY day_number')
+        updates = []
+        cumulative = 0.0
+        previous = None
+        for day_number, price in rows:
+            if previous is not None:
+                cumulative += (day_number - previous[0]) * previous[1]
+            updates.append((cumulative, day_number))
+            previous = (day_number, price)
+        if updates:
+            self.db.executemany(
+                'UPDATE cigarette_price_history SET cumulative_cost = ? WHERE day_number = ?',
+                updates
+            )
+
+    def _sync_current_price(self):
+        # إعداد cigarette_pack_price يبقى مساوياً لسعر اليوم لباقي الشاشات
+        self.db.settings.set('cigarette_pack_price', self.price_on())
+
+    def _insert_rows(self, rows):
+        self.db.executemany('''
+            INSERT OR REPLACE INTO cigarette_price_history
+                (day_number, effective_date, price, cumulative_cost, source)
+            VALUES (?, ?, ?, 0, ?)
+        ''', [
+            (day.toordinal(), day.strftime(DATE_FORMAT), float(price), source)
+            for day, price, source in rows
+        ])
+
+    def set_price(self, price, effective_date=None, source='manual'):
+        effective = to_date(effective_date or date.today())
+        with self.db.transaction():
+            self._insert_rows([(effective, price, source)])
+            self.rebuild_cumulative()
+            self._sync_current_price()
+        return effective
+
+    def ensure_base_price(self, price):
+        self.db.execute('''
+            INSERT OR IGNORE INTO cigarette_price_history
+                (day_number, effective_date, price, cumulative_cost, source)
+            VALUES (?, ?, ?, 0, 'settings')
+        ''', (HISTORY_START.toordinal(), HISTORY_START.strftime(DATE_FORMAT), float(price)))
+
+    def import_changes(self, changes, source):
+        # changes: [(changed_at, old_price, new_price)] وكل تغيير يسري من يوم حدوثه.
+        # يعيد عدد التغييرات وأول تاريخ تأثر حتى يعيد المستدعي حساب المستحقات منه
+        changes = sorted(changes)
+        if not changes:
+            return 0, None
+
+        earliest = to_date(changes[0][0])
+        with self.db.transaction():
+            first_change = self.db.fetchone(
+                'SELECT MIN(day_number) FROM cigarette_price_history WHERE day_number > ?',
+                (HISTORY_START.toordinal(),)
+            )[0]
+            rows = []
+            if first_change is None or earliest.toordinal() < first_change:
+                # السعر قبل أول تغيير معروف هو السعر القديم لذلك التغيير
+                rows.append((HISTORY_START, changes[0][1], source))
+            # عدة تغييرات في اليوم نفسه: الأخير هو الساري
+            rows.extend((to_date(changed_at), new_price, source) for changed_at, _, new_price in changes)
+            self._insert_rows(rows)
+            self.rebuild_cumulative()
+            self._sync_current_price()
+        return len(changes), earliest
+
+    def import_audit_log(self):
+        changes = []
+        for created_at, old_value, new_value in self.db.fetchall('''
+            SELECT created_at, old_value, new_value
+            FROM audit_log
+            WHERE action_type = ?
+            ORDER BY created_at
+        ''', (PRICE_CHANGE_ACTION,)):
+            try:
+                changes.append((created_at, float(old_value), float(new_value)))
+            except (TypeError, ValueError):
+                continue
+        return self.import_changes(changes, 'audit_log')
+
+    def import_log_file(self, file_path):
+        # الصيغة القديمة لملف cigarette_price_log.txt
+        changes = []
+        current = None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                header = LOG_HEADER.match(line)
+                if header:
+                    current = [header.group(1), None, None]
+                    continue
+                if current is None:
+                    continue
+                old_price = LOG_OLD_PRICE.search(line)
+                new_price = LOG_NEW_PRICE.search(line)
+                if old_price:
+                    current[1] = float(old_price.group(1))
+                if new_price:
+                    current[2] = float(new_price.group(1))
+                if current[1] is not None and current[2] is not None:
+                    changes.append(tuple(current))
+                    current = None
+        return self.import_changes(changes, 'log_file')
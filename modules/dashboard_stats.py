@@ -0,0 +1,63 @@
+# الجداول التي يعتمد عليها كل مؤشر؛ التغيير يعيد حساب مؤشراته فقط
+STAT_TABLES = {
+    'active': ('patients',),
+    'graduated': ('patients',),
+    'cigarettes': ('patients',),
+    'revenue': ('payments',),
+    'expenses': ('expenses',),
+    'employees': ('employees',),
+}
+
+class DashboardStats:
+    # مؤشرات لوحة التحكم مع نسخة محفوظة في dashboard_snapshot مختومة برقم آخر حدث في
+    # change_log حُسبت عنده. snapshot() تقرأ النسخة فوراً عند الإقلاع، و revalidate()
+    # تعيد حساب المؤشرات التي كُتب في جداولها حدث بعد الختم فقط ثم تحفظ النسخة بالختم الجديد
+    def __init__(self, db, patient_mgr, payment_mgr, expense_mgr, employee_mgr):
+        self.db = db
+        self.collectors = {
+            'active': patient_mgr.get_active_count,
+            'graduated': patient_mgr.get_graduated_count,
+            'revenue': payment_mgr.get_total_revenue,
+            'expenses': expense_mgr.get_total_expenses,
+            'employees': employee_mgr.get_active_count,
+            'cigarettes': patient_mgr.get_total_cigarettes
+        }
+
+    def collect(self, names=None):
+        return {name: collect() for name, collect in self.collectors.items() if names is None or name in names}
+
+    def snapshot(self):
+        # ({المؤشر: القيمة}, الختم) من آخر حساب محفوظ؛ الختم None إذا لم يُحفظ شيء بعد
+        rows = self.db.fetchall('SELECT name, value, change_id FROM dashboard_snapshot')
+        values = {name: value for name, value, _ in rows if name in self.collectors}
+        return values, min((change_id for _, _, change_id in rows), default=None)
+
+    def stale_names(self, stamp):
+        # المؤشرات التي قد تكون تغيرت منذ الختم، ورقم آخر حدث الآن
+        first_id, last_id = self.db.fetchone('SELECT MIN(id), MAX(id) FROM change_log')
+        last_id = last_id or 0
+        if stamp is None or stamp > last_id or (first_id or 0) > stamp + 1:
+            # لا ختم، أو القاعدة استُبدلت، أو أحداث ما بعد الختم حُذفت مع السجل القديم
+            return set(self.collectors), last_id
+        if stamp == last_id:
+            return set(), last_id
+        tables = {row[0] for row in self.db.fetchall(
+            'SELECT DISTINCT table_name FROM change_log WHERE id > ? AND id <= ?', (stamp, last_id)
+        )}
+        return {name for name, sources in STAT_TABLES.items() if tables.intersection(sources)}, last_id
+
+    def revalidate(self, names=()):
+        # يعمل في خيط قاعدة البيانات. names تُحسب في كل الأحوال (زر التحديث).
+        # الختم يُقرأ قبل الحساب، فالكتابة التي تصل أثناءه يُعاد حسابها في المرة التالية
+        values, stamp = self.snapshot()
+        stale, last_id = self.stale_names(stamp)
+        stale |= set(names) | (set(self.collectors) - set(values))
+        if not stale and stamp == last_id:
+            return values
+        values.update(self.collect(stale))
+        with self.db.transaction():
+            self.db.executemany(
+                'INSERT OR REPLACE INTO dashboard_snapshot (name, value, change_id) VALUES (?, ?, ?)',
+                [(name, value, last_id) for name, value in values.items()]
+            )
+        return values
@@ -1,12 +1,24 @@
 import os
-import shutil
-from datetime import datetime
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QFileDialog, QMessageBox
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QFileDialog, QMessageBox, QProgressBar
+from db.archive import archive_path_for
+from db.backup import BackupService
+from ui.db_worker import DatabaseWorker
+
+# مراحل الاستيراد في خيط قاعدة البيانات: اسم التقدم في DatabaseWorker ونصه في شريط التقدم
+IMPORT_STEPS = {
+    'import_backup': 'نسخ احتياطي للقاعدة الحالية',
+    'import_restore': 'استيراد القاعدة الجديدة',
+}
 
 class DatabaseImportDialog(QDialog):
-    def __init__(self, current_db_path, parent=None):
+    def __init__(self, db, worker=None, parent=None):
         super().__init__(parent)
-        self.current_db_path = current_db_path
+        self.db = db
+        self.worker = worker or DatabaseWorker(self)
+        self.current_db_path = db.db_path
+        self.backup_service = BackupService(db)
+        self.busy = False
+        self.worker.progress.connect(self.show_progress)
         self.setWindowTitle('استيراد قاعدة بيانات')
         self.setFixedSize(500, 300)
         self.setup_ui()
@@ -33,6 +45,10 @@ class DatabaseImportDialog(QDialog):
         import_btn.clicked.connect(self.import_database)
         layout.addWidget(import_btn)
         
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
+        
         close_btn = QPushButton('إلغاء')
         close_btn.clicked.connect(self.reject)
         layout.addWidget(close_btn)
@@ -58,41 +74,88 @@ class DatabaseImportDialog(QDialog):
         )
         
         if reply == QMessageBox.StandardButton.Yes:
-            try:
-                db_dir = os.path.dirname(self.current_db_path)
-                backup_dir = os.path.join(db_dir, 'backups')
-                os.makedirs(backup_dir, exist_ok=True)
-                
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                backup_file = os.path.join(backup_dir, f'backup_before_import_{timestamp}.db')
-                
-                if os.path.exists(self.current_db_path):
-                    shutil.copy2(self.current_db_path, backup_file)
-                
-                import glob
-                db_files = glob.glob('*.db') + glob.glob('*.sqlite')
-                db_files += glob.glob('db/**/*.db', recursive=True)
-                db_files += glob.glob('db/**/*.sqlite', recursive=True)
-                
-                for db_file in db_files:
-                    if 'backup' not in db_file and os.path.abspath(db_file) != os.path.abspath(file_path):
-                        try:
-                            os.remove(db_file)
-                        except:
-                            pass
-                
-                shutil.copy2(file_path, self.current_db_path)
-                
-                QMessageBox.information(
-                    self,
-                    'نجح',
-                    f'تم استيراد قاعدة البيانات بنجاح!\nتم حفظ نسخة احتياطية في:\n{backup_file}\n\nيرجى إعادة تشغيل التطبيق.'
-                )
-                self.accept()
-                
-            except Exception as e:
-                QMessageBox.critical(
-                    self,
-                    'خطأ',
-                    f'حدث خطأ أثناء استيراد قاعدة البيانات:\n{str(e)}'
-                )
+            # النسخ والاستيراد في خيط قاعدة البيانات؛ النافذة معطلة حتى ينتهي الاستبدال
+            self.set_busy(True)
+            self.worker.submit(
+                self.replace_database, file_path,
+                on_result=self.import_finished,
+                on_error=self.import_failed,
+                key='db_import'
+            )
+    
+    def replace_database(self, file_path):
+        # يعمل في خيط قاعدة البيانات
+        backup_file = self.backup_service.create_backup(
+            'backup_before_import', keep=None, progress=self.worker.progress_callback('import_backup')
+        )
+        
+        import glob
+        db_files = glob.glob('*.db') + glob.glob('*.sqlite')
+        db_files += glob.glob('db/**/*.db', recursive=True)
+        db_files += glob.glob('db/**/*.sqlite', recursive=True)
+        
+        # الملف المستورد والقاعدة الحالية وأرشيف كل منهما لا تُحذف
+        kept_files = {os.path.abspath(path) for path in (
+            file_path, archive_path_for(file_path), self.current_db_path, self.db.archive_path
+        )}
+        for db_file in db_files:
+            if 'backup' not in db_file and os.path.abspath(db_file) not in kept_files:
+                try:
+                    os.remove(db_file)
+                except:
+                    pass
+        
+        # المحتوى الجديد يُكتب عبر backup API في القاعدة الحالية بعد فحص سلامته، مع
+        # أرشيفه إن وُجد بجواره؛ بدونه يُرفض الاستيراد إذا تداخل مع الأرشيف الحالي
+        self.backup_service.restore(file_path, progress=self.worker.progress_callback('import_restore'))
+        return backup_file
+    
+    def import_finished(self, backup_file):
+        self.db.settings.reload()
+        self.set_busy(False)
+        QMessageBox.information(
+            self,
+            'نجح',
+            f'تم استيراد قاعدة البيانات بنجاح!\nتم حفظ نسخة احتياطية في:\n{backup_file}\n\nيرجى إعادة تشغيل التطبيق.'
+        )
+        self.accept()
+    
+    def import_failed(self, error):
+        self.set_busy(False)
+        self.progress_bar.setVisible(False)
+        QMessageBox.critical(
+            self,
+            'خطأ',
+            f'حدث خطأ أثناء استيراد قاعدة البيانات:\n{str(error)}'
+        )
+    
+    def set_busy(self, busy):
+        # تعطيل النافذة الرئيسية يعطل هذه النافذة معها؛ لا تُغلق قبل انتهاء الاستبدال
+        self.busy = busy
+        if busy:
+            self.progress_bar.setValue(0)
+            self.progress_bar.setVisible(True)
+        window = self.parentWidget().window() if self.parentWidget() else self
+        window.setEnabled(not busy)
+        self.setEnabled(not busy)
+    
+    def show_progress(self, label, done, total):
+        if label not in IMPORT_STEPS or not total:
+            return
+        self.progress_bar.setFormat(f'{IMPORT_STEPS[label]} %p%')
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+    
+    def done(self, result):
+        self.worker.progress.disconnect(self.show_progress)
+        super().done(result)
+    
+    def reject(self):
+        if not self.busy:
+            super().reject()
+    
+    def closeEvent(self, event):
+        if self.busy:
+            event.ignore()
+        else:
+            super().closeEvent(event)
@@ -1,4 +1,22 @@
 from datetime import datetime
+from db.change_bus import INSERT, UPDATE, DELETE
+from db.paging import PAGE_SIZE, keyset_page, count_rows
+
+# ترتيبات صفحات الموظفين ومعاملاتهم المسموحة ← عمود SQL
+EMPLOYEE_SORTS = {
+    'id': 'id',
+    'name': 'name',
+    'position': 'position',
+    'hire_date': 'hire_date',
+    'salary': 'base_salary',
+}
+
+TRANSACTION_SORTS = {
+    'id': 'et.id',
+    'type': 'et.transaction_type',
+    'amount': 'et.amount',
+    'date': 'et.transaction_date',
+}
 
 class EmployeeManager:
     def __init__(self, db):
@@ -9,7 +27,9 @@ class EmployeeManager:
             INSERT INTO employees (name, position, phone, hire_date, base_salary, status)
             VALUES (?, ?, ?, ?, ?, 'نشط')
         '''
-        self.db.execute(query, (name, position, phone, hire_date, base_salary))
+        with self.db.transaction():
+            cursor = self.db.execute(query, (name, position, phone, hire_date, base_salary))
+            self.db.changes.publish('employees', cursor.lastrowid, INSERT)
         return True
     
     def get_all_employees(self, status=None):
@@ -20,17 +40,39 @@ class EmployeeManager:
             query = 'SELECT * FROM employees ORDER BY id DESC'
             return self.db.fetchall(query)
     
+    def _employee_filters(self, status):
+        if status:
+            return ['status = ?'], [status]
+        return [], []
+    
+    def get_employees_page(self, status=None, after=None, limit=PAGE_SIZE, sort='id', descending=True):
+        # الأحدث إضافة أولاً افتراضياً مثل get_all_employees
+        conditions, params = self._employee_filters(status)
+        return keyset_page(self.db, '*', 'employees', EMPLOYEE_SORTS[sort], descending, conditions, params, after, limit)
+    
+    def count_employees(self, status=None):
+        return count_rows(self.db, 'employees', *self._employee_filters(status))
+    
     def get_employee(self, employee_id):
         query = 'SELECT * FROM employees WHERE id = ?'
         return self.db.fetchone(query, (employee_id,))
     
+    def get_employees(self, employee_ids):
+        employee_ids = list(employee_ids)
+        if not employee_ids:
+            return []
+        query = f'SELECT * FROM employees WHERE id IN ({", ".join("?" * len(employee_ids))})'
+        return self.db.fetchall(query, tuple(employee_ids))
+    
     def update_employee(self, employee_id, name, position, phone, base_salary):
         query = '''
             UPDATE employees 
             SET name = ?, position = ?, phone = ?, base_salary = ?
             WHERE id = ?
         '''
-        self.db.execute(query, (name, position, phone, base_salary, employee_id))
+        with self.db.transaction():
+            self.db.execute(query, (name, position, phone, base_salary, employee_id))
+            self.db.changes.publish('employees', employee_id, UPDATE)
         return True
     
     def add_transaction(self, employee_id, transaction_type, amount, transaction_date, notes=''):
@@ -38,7 +80,9 @@ class EmployeeManager:
             INSERT INTO employee_transactions (employee_id, transaction_type, amount, transaction_date, notes)
             VALUES (?, ?, ?, ?, ?)
         '''
-        self.db.execute(query, (employee_id, transaction_type, amount, transaction_date, notes))
+        with self.db.transaction():
+            cursor = self.db.execute(query, (employee_id, transaction_type, amount, transaction_date, notes))
+            self.db.changes.publish('employee_transactions', cursor.lastrowid, INSERT)
         return True
     
     def get_employee_transactions(self, employee_id):
@@ -90,23 +134,55 @@ class EmployeeManager:
         }
     
     def get_all_transactions(self):
+        return list(self.iter_transactions())
+    
+    def iter_transactions(self, employee_id=None):
         query = '''
             SELECT et.*, e.name 
             FROM employee_transactions et
             JOIN employees e ON et.employee_id = e.id
-            ORDER BY et.transaction_date DESC
         '''
-        return self.db.fetchall(query)
+        params = ()
+        if employee_id is not None:
+            query += ' WHERE et.employee_id = ?'
+            params = (employee_id,)
+        query += ' ORDER BY et.transaction_date DESC'
+        return self.db.iterate(query, params)
+    
+    def _transaction_filters(self, employee_id, transaction_type):
+        conditions, params = [], []
+        if employee_id is not None:
+            conditions.append('et.employee_id = ?')
+            params.append(employee_id)
+        if transaction_type:
+            conditions.append('et.transaction_type = ?')
+            params.append(transaction_type)
+        return conditions, params
+    
+    def get_transactions_page(self, employee_id=None, transaction_type=None, after=None, limit=PAGE_SIZE,
+                              sort='date', descending=True):
+        conditions, params = self._transaction_filters(employee_id, transaction_type)
+        return keyset_page(self.db, 'et.*, e.name',
+                           'employee_transactions et JOIN employees e ON et.employee_id = e.id',
+                           TRANSACTION_SORTS[sort], descending, conditions, params, after, limit, 'et.id')
+    
+    def count_transactions(self, employee_id=None, transaction_type=None):
+        return count_rows(self.db, 'employee_transactions et JOIN employees e ON et.employee_id = e.id',
+                          *self._transaction_filters(employee_id, transaction_type))
     
     def delete_employee(self, employee_id):
-        trans_query = 'DELETE FROM employee_transactions WHERE employee_id = ?'
-        self.db.execute(trans_query, (employee_id,))
-        
-        employee_query = 'DELETE FROM employees WHERE id = ?'
-        self.db.execute(employee_query, (employee_id,))
+        with self.db.transaction():
+            trans_query = 'DELETE FROM employee_transactions WHERE employee_id = ?'
+            self.db.execute(trans_query, (employee_id,))
+            
+            employee_query = 'DELETE FROM employees WHERE id = ?'
+            self.db.execute(employee_query, (employee_id,))
+            self.db.changes.publish('employees', employee_id, DELETE)
         return True
     
     def delete_transaction(self, transaction_id):
         query = 'DELETE FROM employee_transactions WHERE id = ?'
-        self.db.execute(query, (transaction_id,))
+        with self.db.transaction():
+            self.db.execute(query, (transaction_id,))
+            self.db.changes.publish('employee_transactions', transaction_id, DELETE)
         return True
@@ -1,40 +1,109 @@
 from datetime import datetime
+from modules.periods import Period
+from db.archive import Archive
+from db.change_bus import INSERT, UPDATE, DELETE
+from db.paging import PAGE_SIZE, keyset_page, count_rows
+
+# ترتيبات صفحات المصروفات المسموحة ← عمود SQL
+EXPENSE_SORTS = {
+    'id': 'id',
+    'category': 'category',
+    'amount': 'amount',
+    'date': 'expense_date',
+}
 
 class ExpenseManager:
     def __init__(self, db):
         self.db = db
+        self.archive = Archive(db)
     
     def add_expense(self, category, amount, expense_date, description=''):
         query = '''
             INSERT INTO expenses (category, amount, expense_date, description)
             VALUES (?, ?, ?, ?)
         '''
-        self.db.execute(query, (category, amount, expense_date, description))
+        with self.db.transaction():
+            cursor = self.db.execute(query, (category, amount, expense_date, description))
+            self.db.changes.publish('expenses', cursor.lastrowid, INSERT)
         return True
     
     def get_all_expenses(self):
         query = 'SELECT * FROM expenses ORDER BY expense_date DESC'
         return self.db.fetchall(query)
     
+    def _expense_filters(self, category, period):
+        conditions, params = [], []
+        if category:
+            conditions.append('category = ?')
+            params.append(category)
+        if period is not None:
+            condition, period_params = period.where('expense_date')
+            conditions.append(condition)
+            params.extend(period_params)
+        return conditions, params
+    
+    def get_expenses_page(self, category=None, period=None, after=None, limit=PAGE_SIZE,
+                          sort='date', descending=True):
+        conditions, params = self._expense_filters(category, period)
+        return keyset_page(self.db, '*', 'expenses', EXPENSE_SORTS[sort], descending, conditions, params, after, limit)
+    
+    def count_expenses(self, category=None, period=None):
+        return count_rows(self.db, 'expenses', *self._expense_filters(category, period))
+    
+    def get_expenses(self, expense_ids):
+        expense_ids = list(expense_ids)
+        if not expense_ids:
+            return []
+        query = f'SELECT * FROM expenses WHERE id IN ({", ".join("?" * len(expense_ids))})'
+        return self.db.fetchall(query, tuple(expense_ids))
+    
     def get_total_expenses(self):
-        query = 'SELECT SUM(amount) FROM expenses'
+        query = f'SELECT SUM(amount) FROM {self.archive.table("expenses")}'
         result = self.db.fetchone(query)
         return result[0] if result[0] else 0
     
+    def get_expenses_total(self, period):
+        condition, params = period.where('expense_date')
+        query = f'SELECT SUM(amount) FROM {self.archive.table("expenses", period)} WHERE {condition}'
+        result = self.db.fetchone(query, params)
+        return result[0] if result[0] else 0
+    
     def get_monthly_expenses(self, year, month):
-        query = '''
-            SELECT SUM(amount) 
-            FROM expenses 
-            WHERE strftime('%Y', expense_date) = ? 
-            AND strftime('%m', expense_date) = ?
+        return self.get_expenses_total(Period.month(year, month))
+    
+    def get_expenses_by_month(self, period):
+        condition, params = period.where('expense_date')
+        query = f'''
+            SELECT substr(expense_date, 1, 7) AS month, SUM(amount)
+            FROM {self.archive.table('expenses', period)}
+            WHERE {condition}
+            GROUP BY month
         '''
-        result = self.db.fetchone(query, (str(year), f'{month:02d}'))
-        return result[0] if result[0] else 0
+        return {row[0]: row[1] for row in self.db.fetchall(query, params)}
+    
+    def get_expenses_in_period(self, period):
+        return list(self.iter_expenses(period))
+    
+    def iter_expenses(self, period=None):
+        # (التاريخ، البند، المبلغ، الوصف) الأحدث أولاً؛ period = None لكل السجل
+        condition, params = period.where('expense_date') if period else ('1', ())
+        query = f'''
+            SELECT expense_date, category, amount, description
+            FROM {self.archive.table('expenses', period)}
+            WHERE {condition}
+            ORDER BY expense_date DESC, id DESC
+        '''
+        return self.db.iterate(query, params)
+    
+    def count_expenses_in_period(self, period):
+        condition, params = period.where('expense_date')
+        query = f'SELECT COUNT(*) FROM {self.archive.table("expenses", period)} WHERE {condition}'
+        return self.db.fetchone(query, params)[0]
     
     def get_expenses_by_category(self):
-        query = '''
+        query = f'''
             SELECT category, SUM(amount) as total
-            FROM expenses
+            FROM {self.archive.table('expenses')}
             GROUP BY category
             ORDER BY total DESC
         '''
@@ -50,10 +119,14 @@ class ExpenseManager:
             SET category = ?, amount = ?, expense_date = ?, description = ?
             WHERE id = ?
         '''
-        self.db.execute(query, (category, amount, expense_date, description, expense_id))
+        with self.db.transaction():
+            self.db.execute(query, (category, amount, expense_date, description, expense_id))
+            self.db.changes.publish('expenses', expense_id, UPDATE)
         return True
     
     def delete_expense(self, expense_id):
         query = 'DELETE FROM expenses WHERE id = ?'
-        self.db.execute(query, (expense_id,))
+        with self.db.transaction():
+            self.db.execute(query, (expense_id,))
+            self.db.changes.publish('expenses', expense_id, DELETE)
         return True
@@ -1,56 +1,62 @@
-import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
 from datetime import datetime
 
+EXPORT_COLUMNS = ['الرقم', 'الاسم', 'هاتف الأهل', 'تاريخ الدخول', 'القسم',
+                  'التكلفة اليومية', 'يستلم سجائر', 'عدد السجائر', 'الحالة']
+
 class ImportExport:
+    # الاستيراد والتصدير صفاً صفاً عبر openpyxl (read_only / write_only) فلا يُحمل
+    # الملف ولا الجدول كاملاً في الذاكرة
     def __init__(self, db, patient_mgr):
         self.db = db
         self.patient_mgr = patient_mgr
     
-    def import_patients_from_excel(self, file_path):
+    def _read_rows(self, file_path):
+        # كل سطر كقاموس بأسماء أعمدة السطر الأول
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
         try:
-            df = pd.read_excel(file_path)
-            
-            required_cols = ['الاسم', 'هاتف الأهل', 'تاريخ الدخول', 'القسم', 'التكلفة اليومية']
-            
-            for index, row in df.iterrows():
-                name = str(row.get('الاسم', ''))
-                family_phone = str(row.get('هاتف الأهل', ''))
-                admission_date = str(row.get('تاريخ الدخول', datetime.now().strftime('%Y-%m-%d')))
-                department = str(row.get('القسم', 'ديتوكس'))
-                daily_cost = float(row.get('التكلفة اليومية', 0))
-                receives_cigarettes = 1 if row.get('يستلم سجائر', 'لا') == 'نعم' else 0
-                cigarettes_count = int(row.get('عدد السجائر', 0))
-                
-                self.patient_mgr.add_patient(
-                    name, family_phone, admission_date, department,
-                    daily_cost, receives_cigarettes, cigarettes_count
-                )
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+            for values in rows:
+                if any(value is not None for value in values):
+                    yield {column: value for column, value in zip(header, values) if value is not None}
+        finally:
+            workbook.close()
+    
+    def _patient_records(self, file_path):
+        for row in self._read_rows(file_path):
+            name = str(row.get('الاسم', ''))
+            family_phone = str(row.get('هاتف الأهل', ''))
+            admission_date = row.get('تاريخ الدخول', datetime.now())
+            if isinstance(admission_date, datetime):
+                admission_date = admission_date.strftime('%Y-%m-%d')
+            department = str(row.get('القسم', 'ديتوكس'))
+            daily_cost = float(row.get('التكلفة اليومية', 0))
+            receives_cigarettes = 1 if row.get('يستلم سجائر', 'لا') == 'نعم' else 0
+            cigarettes_count = int(row.get('عدد السجائر', 0))
             
-            return True, len(df)
+            yield (
+                name, family_phone, str(admission_date), department,
+                daily_cost, receives_cigarettes, cigarettes_count
+            )
+    
+    def import_patients_from_excel(self, file_path):
+        try:
+            return True, self.patient_mgr.add_patients(self._patient_records(file_path))
         except Exception as e:
             return False, str(e)
     
     def export_patients_to_excel(self, file_path):
         try:
-            patients = self.patient_mgr.get_all_patients()
-            
-            data = []
-            for p in patients:
-                data.append({
-                    'الرقم': p[0],
-                    'الاسم': p[1],
-                    'هاتف الأهل': p[2],
-                    'تاريخ الدخول': p[3],
-                    'القسم': p[4],
-                    'التكلفة اليومية': p[5],
-                    'يستلم سجائر': 'نعم' if p[6] else 'لا',
-                    'عدد السجائر': p[7],
-                    'الحالة': p[8]
-                })
-            
-            df = pd.DataFrame(data)
-            df.to_excel(file_path, index=False, engine='openpyxl')
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append(EXPORT_COLUMNS)
+            for p in self.patient_mgr.iter_patients():
+                sheet.append([
+                    p[0], p[1], p[2], p[3], p[4], p[5],
+                    'نعم' if p[6] else 'لا', p[7], p[8]
+                ])
+            workbook.save(file_path)
             
             return True
         except Exception as e:
@@ -1,8 +1,23 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from modules.accruals import AccrualEngine, CIGARETTES
+from db.archive import Archive
+from db.change_bus import INSERT, UPDATE, DELETE
+from modules.search import fts_query, SEARCH_LIMIT
+from db.paging import PAGE_SIZE, keyset_page, count_rows
+
+# ترتيبات قائمة المرضى: (مفتاح الترتيب، تنازلي)
+PATIENT_SORTS = {
+    'name': ('name', False),
+    'name_desc': ('name', True),
+    'oldest': ('admission_date', False),
+    'newest': ('admission_date', True),
+}
 
 class PatientManager:
     def __init__(self, db):
         self.db = db
+        self.accruals = AccrualEngine(db)
+        self.archive = Archive(db)
     
     def add_patient(self, name, family_phone, admission_date, department, 
                    daily_cost, receives_cigarettes, cigarettes_count):
@@ -11,32 +26,127 @@ class PatientManager:
                                 daily_cost, receives_cigarettes, cigarettes_count, status)
             VALUES (?, ?, ?, ?, ?, ?, ?, 'نشط')
         '''
-        self.db.execute(query, (name, family_phone, admission_date, department,
-                               daily_cost, receives_cigarettes, cigarettes_count))
+        with self.db.transaction():
+            cursor = self.db.execute(query, (name, family_phone, admission_date, department,
+                                            daily_cost, receives_cigarettes, cigarettes_count))
+            self.db.changes.publish('patients', cursor.lastrowid, INSERT)
+            self.accruals.run(patient_ids=[cursor.lastrowid])
         return True
     
+    def add_patients(self, records):
+        # records: (name, family_phone, admission_date, department, daily_cost,
+        #           receives_cigarettes, cigarettes_count) — تُحفظ كلها في commit واحد
+        query = '''
+            INSERT INTO patients (name, family_phone, admission_date, department, 
+                                daily_cost, receives_cigarettes, cigarettes_count, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'نشط')
+        '''
+        # records قد يكون generator (الاستيراد): executemany يستهلكه دون بناء قائمة
+        with self.db.transaction():
+            cursor = self.db.executemany(query, records)
+            self.db.changes.publish('patients', None, INSERT)
+            self.accruals.run()
+        return cursor.rowcount
+    
     def get_all_patients(self, status=None):
+        return list(self.iter_patients(status))
+    
+    def iter_patients(self, status=None):
         if status:
             query = 'SELECT * FROM patients WHERE status = ? ORDER BY id DESC'
-            return self.db.fetchall(query, (status,))
+            return self.db.iterate(query, (status,))
         else:
             query = 'SELECT * FROM patients ORDER BY id DESC'
-            return self.db.fetchall(query)
+            return self.db.iterate(query)
+    
+    def _patient_filters(self, status):
+        if status:
+            return ['status = ?'], [status]
+        return [], []
+    
+    def get_patients_page(self, status=None, sort='newest', after=None, limit=PAGE_SIZE):
+        key, descending = PATIENT_SORTS[sort]
+        conditions, params = self._patient_filters(status)
+        return keyset_page(self.db, '*', 'patients', key, descending, conditions, params, after, limit)
+    
+    def count_patients(self, status=None):
+        return count_rows(self.db, 'patients', *self._patient_filters(status))
     
     def get_patient(self, patient_id):
         query = 'SELECT * FROM patients WHERE id = ?'
         return self.db.fetchone(query, (patient_id,))
     
+    def search_patients(self, text, status=None, limit=SEARCH_LIMIT):
+        # بحث بالبادئة في الاسم والهاتف مرتب بالأقرب (bm25؛ الاسم أثقل من الهاتف)
+        query_text = fts_query(text)
+        if not query_text:
+            return []
+        query = '''
+            SELECT p.*
+            FROM patients_fts f
+            JOIN patients p ON p.id = f.rowid
+            WHERE patients_fts MATCH ?
+        '''
+        params = [query_text]
+        if status:
+            query += ' AND p.status = ?'
+            params.append(status)
+        query += ' ORDER BY bm25(patients_fts, 10.0, 1.0) LIMIT ?'
+        params.append(limit)
+        return self.db.fetchall(query, tuple(params))
+    
+    def get_patients(self, patient_ids):
+        patient_ids = list(patient_ids)
+        if not patient_ids:
+            return []
+        query = f'SELECT * FROM patients WHERE id IN ({", ".join("?" * len(patient_ids))})'
+        return self.db.fetchall(query, tuple(patient_ids))
+    
     def update_patient(self, patient_id, name, family_phone, department, 
-                      daily_cost, receives_cigarettes, cigarettes_count):
+                      daily_cost, receives_cigarettes, cigarettes_count, effective_date=None):
+        current = self.db.fetchone(
+            'SELECT daily_cost, department, receives_cigarettes, cigarettes_count FROM patients WHERE id = ?',
+            (patient_id,)
+        )
+        cigarettes = cigarettes_count if receives_cigarettes else 0
         query = '''
             UPDATE patients 
             SET name = ?, family_phone = ?, department = ?,
                 daily_cost = ?, receives_cigarettes = ?, cigarettes_count = ?
             WHERE id = ?
         '''
-        self.db.execute(query, (name, family_phone, department, daily_cost,
-                               receives_cigarettes, cigarettes_count, patient_id))
+        with self.db.transaction():
+            self.db.execute(query, (name, family_phone, department, daily_cost,
+                                   receives_cigarettes, cigarettes_count, patient_id))
+            if current is None:
+                return True
+            self.db.changes.publish('patients', patient_id, UPDATE)
+            
+            rate_changed = (float(daily_cost), department) != (float(current[0]), current[1])
+            cigarettes_changed = cigarettes != (current[3] if current[2] else 0)
+            if rate_changed or cigarettes_changed:
+                # السعر والقسم والسجائر الجديدة تسري من effective_date فقط
+                effective = self.accruals.rates.set_rate(patient_id, daily_cost, department, cigarettes,
+                                                         effective_date)
+                self.accruals.recalculate(patient_id, None if rate_changed else CIGARETTES, since=effective)
+        return True
+    
+    def set_cigarettes(self, patient_id, receives_cigarettes, cigarettes_count, effective_date=None):
+        query = '''
+            UPDATE patients 
+            SET receives_cigarettes = ?, cigarettes_count = ?
+            WHERE id = ?
+        '''
+        current = self.db.fetchone('SELECT daily_cost, department FROM patients WHERE id = ?', (patient_id,))
+        with self.db.transaction():
+            self.db.execute(query, (receives_cigarettes, cigarettes_count, patient_id))
+            if current is None:
+                return True
+            self.db.changes.publish('patients', patient_id, UPDATE)
+            # مستحقات السجائر قبل effective_date (اليوم افتراضياً) تبقى كما هي
+            effective = self.accruals.rates.set_rate(patient_id, current[0], current[1],
+                                                     cigarettes_count if receives_cigarettes else 0, effective_date)
+            self.accruals.recalculate(patient_id, CIGARETTES, since=effective)
         return True
     
     def discharge_patient(self, patient_id):
@@ -45,28 +155,71 @@ class PatientManager:
             SET status = 'متخرج', discharged_at = ?
             WHERE id = ?
         '''
-        self.db.execute(query, (datetime.now().strftime('%Y-%m-%d'), patient_id))
+        today = datetime.now()
+        with self.db.transaction():
+            self.db.execute(query, (today.strftime('%Y-%m-%d'), patient_id))
+            self.db.changes.publish('patients', patient_id, UPDATE)
+            self.accruals.invalidate(patient_id, since=today + timedelta(days=1))
         return True
     
+    def delete_patient(self, patient_id):
+        # مدفوعات المريض تختفي من قائمة المدفوعات مع حذفه
+        with self.db.transaction():
+            payment_ids = self.db.fetchall('SELECT id FROM payments WHERE patient_id = ?', (patient_id,))
+            self.db.execute('DELETE FROM patients WHERE id = ?', (patient_id,))
+            self.db.changes.publish('patients', patient_id, DELETE)
+            for (payment_id,) in payment_ids:
+                self.db.changes.publish('payments', payment_id, DELETE)
+        return True
+    
+    def _query_balances(self, condition='', params=()):
+        # المستحقات اليومية والمدفوعات مجمعة مسبقاً في patient_ledger_totals. القراءة لا
+        # تسجل مستحقات: التسجيل عند التشغيل وكل ساعة (MainWindow.run_accruals) وعند الكتابة
+        query = f'''
+            SELECT p.id,
+                   COALESCE(l.charged_days, 0),
+                   COALESCE(l.accommodation_charged, 0),
+                   COALESCE(l.cigarettes_charged, 0),
+                   COALESCE(l.total_paid, 0)
+            FROM patients p
+            LEFT JOIN patient_ledger_totals l ON l.patient_id = p.id
+            {condition}
+        '''
+        rows = self.db.fetchall(query, tuple(params))
+        
+        balances = {}
+        for patient_id, days, accommodation_cost, cigarettes_cost, total_paid in rows:
+            total_expenses = accommodation_cost + cigarettes_cost
+            balances[patient_id] = {
+                'days': days,
+                'accommodation_cost': accommodation_cost,
+                'cigarettes_cost': cigarettes_cost,
+                'total_expenses': total_expenses,
+                'total_paid': total_paid,
+                'balance': total_expenses - total_paid
+            }
+        return balances
+    
+    def get_all_balances(self, status=None):
+        if status:
+            return self._query_balances('WHERE p.status = ?', (status,))
+        return self._query_balances()
+    
+    def get_balances(self, patient_ids):
+        patient_ids = list(patient_ids)
+        if not patient_ids:
+            return {}
+        return self._query_balances(f'WHERE p.id IN ({", ".join("?" * len(patient_ids))})', patient_ids)
+    
     def get_patient_balance(self, patient_id):
-        patient = self.get_patient(patient_id)
-        if not patient:
+        balances = self._query_balances('WHERE p.id = ?', (patient_id,))
+        if patient_id not in balances:
             return 0
-        
-        admission_date = datetime.strptime(patient[3], '%Y-%m-%d')
-        if patient[8] == 'متخرج' and patient[10]:
-            discharge_date = datetime.strptime(patient[10], '%Y-%m-%d')
-        else:
-            discharge_date = datetime.now()
-        
-        days = (discharge_date - admission_date).days + 1
-        total_cost = days * float(patient[5])
-        
-        payments_query = 'SELECT SUM(amount) FROM payments WHERE patient_id = ?'
-        payments = self.db.fetchone(payments_query, (patient_id,))
-        total_paid = float(payments[0]) if payments[0] else 0
-        
-        return total_cost - total_paid
+        return balances[patient_id]['balance']
+    
+    def get_department_stats(self, period):
+        # أيام الإقامة وتكلفتها لكل قسم داخل الفترة حسب سجل الأسعار
+        return self.accruals.rates.sweep(period)['departments']
     
     def get_active_count(self):
         query = 'SELECT COUNT(*) FROM patients WHERE status = "نشط"'
@@ -74,7 +227,8 @@ class PatientManager:
         return result[0] if result else 0
     
     def get_graduated_count(self):
-        query = 'SELECT COUNT(*) FROM patients WHERE status = "متخرج"'
+        # الخريجون المؤرشفون يُحسبون أيضاً
+        query = f'SELECT COUNT(*) FROM {self.archive.table("patients")} WHERE status = "متخرج"'
         result = self.db.fetchone(query)
         return result[0] if result else 0
     
@@ -94,8 +248,14 @@ class PatientManager:
         else:
             discharge_date = datetime.now()
         
-        days = (discharge_date - admission_date).days + 1
-        accommodation_cost = days * float(patient[5])
+        # قراءة فقط: المستحقات تُسجل عند التشغيل وكل ساعة وعند الكتابة كما في _query_balances
+        totals_query = '''
+            SELECT charged_days, accommodation_charged, cigarettes_charged, total_paid
+            FROM patient_ledger_totals
+            WHERE patient_id = ?
+        '''
+        totals = self.db.fetchone(totals_query, (patient_id,))
+        days, accommodation_cost, cigarettes_cost, total_paid = totals if totals else (0, 0, 0, 0)
         
         payments_query = '''
             SELECT payment_date, amount, notes 
@@ -104,17 +264,6 @@ class PatientManager:
             ORDER BY payment_date DESC
         '''
         payments = self.db.fetchall(payments_query, (patient_id,))
-        total_paid = sum(p[1] for p in payments)
-        
-        cigarettes_cost = 0
-        if patient[6]:
-            price_query = "SELECT setting_value FROM settings WHERE setting_key = 'cigarette_pack_price'"
-            price_result = self.db.fetchone(price_query)
-            cigarette_pack_price = float(price_result[0]) if price_result else 40
-            
-            cigarettes_per_day = patient[7]
-            packs_per_day = cigarettes_per_day / 20
-            cigarettes_cost = packs_per_day * days * cigarette_pack_price
         
         total_expenses = accommodation_cost + cigarettes_cost
         balance = total_expenses - total_paid
@@ -124,6 +273,7 @@ class PatientManager:
             'admission_date': admission_date,
             'discharge_date': discharge_date if patient[8] == 'متخرج' else None,
             'days': days,
+            'rate_periods': self.accruals.rates.get_stay_periods(patient_id),
             'accommodation_cost': accommodation_cost,
             'cigarettes_cost': cigarettes_cost,
             'total_expenses': total_expenses,
@@ -1,15 +1,31 @@
 from datetime import datetime
+from modules.periods import Period
+from db.archive import Archive
+from db.change_bus import INSERT, UPDATE, DELETE
+from db.paging import PAGE_SIZE, keyset_page, count_rows
+
+# ترتيبات صفحات المدفوعات المسموحة ← عمود SQL
+PAYMENT_SORTS = {
+    'id': 'p.id',
+    'patient': 'pt.name',
+    'amount': 'p.amount',
+    'date': 'p.payment_date',
+}
 
 class PaymentManager:
     def __init__(self, db):
         self.db = db
+        self.archive = Archive(db)
     
     def add_payment(self, patient_id, amount, payment_date, notes=''):
         query = '''
             INSERT INTO payments (patient_id, amount, payment_date, notes)
             VALUES (?, ?, ?, ?)
         '''
-        self.db.execute(query, (patient_id, amount, payment_date, notes))
+        with self.db.transaction():
+            cursor = self.db.execute(query, (patient_id, amount, payment_date, notes))
+            self.db.changes.publish('payments', cursor.lastrowid, INSERT)
+            self.db.changes.publish('patient_ledger_totals', patient_id, UPDATE)
         return True
     
     def get_patient_payments(self, patient_id):
@@ -29,20 +45,85 @@ class PaymentManager:
         '''
         return self.db.fetchall(query)
     
+    def _payment_filters(self, patient_id, period):
+        conditions, params = [], []
+        if patient_id is not None:
+            conditions.append('p.patient_id = ?')
+            params.append(patient_id)
+        if period is not None:
+            condition, period_params = period.where('p.payment_date')
+            conditions.append(condition)
+            params.extend(period_params)
+        return conditions, params
+    
+    def get_payments_page(self, patient_id=None, period=None, after=None, limit=PAGE_SIZE,
+                          sort='date', descending=True):
+        # الأحدث أولاً افتراضياً، بنفس أعمدة get_all_payments
+        conditions, params = self._payment_filters(patient_id, period)
+        return keyset_page(self.db, 'p.*, pt.name', 'payments p JOIN patients pt ON p.patient_id = pt.id',
+                           PAYMENT_SORTS[sort], descending, conditions, params, after, limit, 'p.id')
+    
+    def count_payments(self, patient_id=None, period=None):
+        return count_rows(self.db, 'payments p JOIN patients pt ON p.patient_id = pt.id', *self._payment_filters(patient_id, period))
+    
+    def get_payments(self, payment_ids=(), patient_ids=()):
+        # صفوف قائمة المدفوعات لدفعات أو مرضى محددين فقط (لتحديث الجدول جزئياً)
+        payment_ids = list(payment_ids)
+        patient_ids = list(patient_ids)
+        if not payment_ids and not patient_ids:
+            return []
+        query = f'''
+            SELECT p.*, pt.name 
+            FROM payments p
+            JOIN patients pt ON p.patient_id = pt.id
+            WHERE p.id IN ({", ".join("?" * len(payment_ids))})
+               OR p.patient_id IN ({", ".join("?" * len(patient_ids))})
+        '''
+        return self.db.fetchall(query, tuple(payment_ids + patient_ids))
+    
     def get_total_revenue(self):
-        query = 'SELECT SUM(amount) FROM payments'
+        query = f'SELECT SUM(amount) FROM {self.archive.table("payments")}'
         result = self.db.fetchone(query)
         return result[0] if result[0] else 0
     
+    def get_revenue(self, period):
+        condition, params = period.where('payment_date')
+        query = f'SELECT SUM(amount) FROM {self.archive.table("payments", period)} WHERE {condition}'
+        result = self.db.fetchone(query, params)
+        return result[0] if result[0] else 0
+    
     def get_monthly_revenue(self, year, month):
-        query = '''
-            SELECT SUM(amount) 
-            FROM payments 
-            WHERE strftime('%Y', payment_date) = ? 
-            AND strftime('%m', payment_date) = ?
+        return self.get_revenue(Period.month(year, month))
+    
+    def get_revenue_by_month(self, period):
+        condition, params = period.where('payment_date')
+        query = f'''
+            SELECT substr(payment_date, 1, 7) AS month, SUM(amount)
+            FROM {self.archive.table('payments', period)}
+            WHERE {condition}
+            GROUP BY month
         '''
-        result = self.db.fetchone(query, (str(year), f'{month:02d}'))
-        return result[0] if result[0] else 0
+        return {row[0]: row[1] for row in self.db.fetchall(query, params)}
+    
+    def get_payments_in_period(self, period):
+        return list(self.iter_payments(period))
+    
+    def iter_payments(self, period=None):
+        # (التاريخ، اسم المريض، المبلغ، ملاحظات) الأحدث أولاً؛ period = None لكل السجل
+        condition, params = period.where('p.payment_date') if period else ('1', ())
+        query = f'''
+            SELECT p.payment_date, pt.name, p.amount, p.notes 
+            FROM {self.archive.table('payments', period)} p
+            JOIN {self.archive.table('patients', period)} pt ON p.patient_id = pt.id
+            WHERE {condition}
+            ORDER BY p.payment_date DESC, p.id DESC
+        '''
+        return self.db.iterate(query, params)
+    
+    def count_payments_in_period(self, period):
+        condition, params = period.where('payment_date')
+        query = f'SELECT COUNT(*) FROM {self.archive.table("payments", period)} WHERE {condition}'
+        return self.db.fetchone(query, params)[0]
     
     def get_payment(self, payment_id):
         query = 'SELECT * FROM payments WHERE id = ?'
@@ -54,10 +135,102 @@ class PaymentManager:
             SET patient_id = ?, amount = ?, payment_date = ?, notes = ?
             WHERE id = ?
         '''
-        self.db.execute(query, (patient_id, amount, payment_date, notes, payment_id))
+        with self.db.transaction():
+            previous = self.db.fetchone('SELECT patient_id FROM payments WHERE id = ?', (payment_id,))
+            self.db.execute(query, (patient_id, amount, payment_date, notes, payment_id))
+            self.db.changes.publish('payments', payment_id, UPDATE)
+            self.db.changes.publish('patient_ledger_totals', patient_id, UPDATE)
+            if previous and previous[0] != patient_id:
+                self.db.changes.publish('patient_ledger_totals', previous[0], UPDATE)
         return True
     
     def delete_payment(self, payment_id):
         query = 'DELETE FROM payments WHERE id = ?'
-        self.db.execute(query, (payment_id,))
+        with self.db.transaction():
+            previous = self.db.fetchone('SELECT patient_id FROM payments WHERE id = ?', (payment_id,))
+            self.db.execute(query, (payment_id,))
+            self.db.changes.publish('payments', payment_id, DELETE)
+            if previous:
+                self.db.changes.publish('patient_ledger_totals', previous[0], UPDATE)
+        return True
+    
+    def get_ledger_totals(self, patient_id):
+        query = '''
+            SELECT total_paid, payment_count, last_payment_date
+            FROM patient_ledger_totals
+            WHERE patient_id = ?
+        '''
+        result = self.db.fetchone(query, (patient_id,))
+        if not result:
+            return {'total_paid': 0, 'payment_count': 0, 'last_payment_date': None}
+        return {
+            'total_paid': result[0],
+            'payment_count': result[1],
+            'last_payment_date': result[2]
+        }
+    
+    def _actual_ledger_totals(self):
+        actual = {}
+        for patient_id, total_paid, payment_count, last_payment_date in self.db.fetchall('''
+            SELECT patient_id, SUM(amount), COUNT(*), MAX(payment_date)
+            FROM payments
+            GROUP BY patient_id
+        '''):
+            actual[patient_id] = [total_paid, payment_count, last_payment_date, 0, 0, 0]
+        
+        for patient_id, accommodation, cigarettes, days in self.db.fetchall('''
+            SELECT patient_id,
+                   SUM(CASE WHEN charge_type = 'accommodation' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN charge_type = 'cigarettes' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN charge_type = 'accommodation' THEN 1 ELSE 0 END)
+            FROM charges
+            GROUP BY patient_id
+        '''):
+            totals = actual.setdefault(patient_id, [0, 0, None, 0, 0, 0])
+            totals[3:] = [accommodation, cigarettes, days]
+        return actual
+    
+    def verify_ledger_totals(self):
+        # مقارنة الإجماليات المخزنة بالمدفوعات والمستحقات الفعلية وإرجاع المرضى المختلفين
+        stored = {
+            row[0]: list(row[1:])
+            for row in self.db.fetchall('''
+                SELECT patient_id, total_paid, payment_count, last_payment_date,
+                       accommodation_charged, cigarettes_charged, charged_days
+                FROM patient_ledger_totals
+            ''')
+        }
+        actual = self._actual_ledger_totals()
+        
+        empty = [0, 0, None, 0, 0, 0]
+        drift = []
+        for patient_id in set(stored) | set(actual):
+            stored_totals = stored.get(patient_id, empty)
+            actual_totals = actual.get(patient_id, empty)
+            amounts_differ = any(
+                abs((stored_totals[i] or 0) - (actual_totals[i] or 0)) > 0.005
+                for i in (0, 3, 4)
+            )
+            if (amounts_differ or stored_totals[1] != actual_totals[1]
+                    or stored_totals[2] != actual_totals[2]
+                    or stored_totals[5] != actual_totals[5]):
+                drift.append({
+                    'patient_id': patient_id,
+                    'stored_total': stored_totals[0],
+                    'actual_total': actual_totals[0],
+                    'stored_count': stored_totals[1],
+                    'actual_count': actual_totals[1]
+                })
+        return drift
+    
+    def rebuild_ledger_totals(self):
+        with self.db.transaction():
+            actual = self._actual_ledger_totals()
+            self.db.execute('DELETE FROM patient_ledger_totals')
+            self.db.executemany('''
+                INSERT INTO patient_ledger_totals
+                    (patient_id, total_paid, payment_count, last_payment_date,
+                     accommodation_charged, cigarettes_charged, charged_days)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(patient_id, *totals) for patient_id, totals in actual.items()])
         return True
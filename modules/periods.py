@@ -0,0 +1,83 @@
+from datetime import date, datetime, timedelta
+
+DATE_FORMAT = '%Y-%m-%d'
+# الأسبوع يبدأ يوم السبت (weekday() == 5)
+WEEK_START = 5
+
+def to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], DATE_FORMAT).date()
+
+class Period:
+    # فترة زمنية مغلقة [start, end] تتحول إلى شرط نطاق على عمود التاريخ
+    # بدلاً من strftime() حتى يستطيع SQLite استخدام الفهرس
+    def __init__(self, start, end, label=''):
+        self.start = to_date(start)
+        self.end = to_date(end)
+        if self.end < self.start:
+            raise ValueError('تاريخ النهاية قبل تاريخ البداية')
+        self.label = label
+
+    @classmethod
+    def day(cls, value=None):
+        value = to_date(value or date.today())
+        return cls(value, value, value.strftime(DATE_FORMAT))
+
+    @classmethod
+    def week(cls, value=None):
+        value = to_date(value or date.today())
+        start = value - timedelta(days=(value.weekday() - WEEK_START) % 7)
+        return cls(start, start + timedelta(days=6))
+
+    @classmethod
+    def month(cls, year, month):
+        start = date(year, month, 1)
+        if month == 12:
+            end = date(year + 1, 1, 1) - timedelta(days=1)
+        else:
+            end = date(year, month + 1, 1) - timedelta(days=1)
+        return cls(start, end, f'{year}/{month:02d}')
+
+    @classmethod
+    def quarter(cls, year, quarter):
+        first_month = (quarter - 1) * 3 + 1
+        start = cls.month(year, first_month).start
+        end = cls.month(year, first_month + 2).end
+        return cls(start, end, f'{year} Q{quarter}')
+
+    @classmethod
+    def year(cls, year):
+        return cls(date(year, 1, 1), date(year, 12, 31), str(year))
+
+    @classmethod
+    def custom(cls, start, end):
+        return cls(start, end)
+
+    @property
+    def start_str(self):
+        return self.start.strftime(DATE_FORMAT)
+
+    @property
+    def end_str(self):
+        return self.end.strftime(DATE_FORMAT)
+
+    @property
+    def days(self):
+        return (self.end - self.start).days + 1
+
+    def where(self, column):
+        # نطاق نصف مفتوح حتى تدخل القيم التي تحتوي على وقت في آخر يوم
+        next_day = (self.end + timedelta(days=1)).strftime(DATE_FORMAT)
+        return f'{column} >= ? AND {column} < ?', (self.start_str, next_day)
+
+    def months(self):
+        year, month = self.start.year, self.start.month
+        while (year, month) <= (self.end.year, self.end.month):
+            yield year, month
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    def __repr__(self):
+        return f'Period({self.start_str}, {self.end_str})'
@@ -0,0 +1,138 @@
+from datetime import date, timedelta
+from modules.periods import to_date, DATE_FORMAT
+from db.archive import Archive
+
+class PatientRateHistory:
+    # التكلفة اليومية والقسم وعدد السجائر اليومي لكل مريض بتاريخ سريان؛ كل سطر يسري حتى
+    # السطر التالي للمريض نفسه. الفترات تُبنى بمرور واحد على السطور مرتبة حسب (المريض، التاريخ)
+    def __init__(self, db):
+        self.db = db
+        self.archive = Archive(db)
+
+    def get_history(self, patient_id):
+        query = '''
+            SELECT effective_date, daily_cost, department, cigarettes_count
+            FROM patient_rate_history
+            WHERE patient_id = ?
+            ORDER BY effective_date
+        '''
+        return self.db.fetchall(query, (patient_id,))
+
+    def set_rate(self, patient_id, daily_cost, department, cigarettes_count, effective_date=None):
+        # cigarettes_count = 0 للمريض الذي لا يستلم سجائر
+        effective = to_date(effective_date or date.today())
+        admission = self.db.fetchone('SELECT admission_date FROM patients WHERE id = ?', (patient_id,))
+        if admission:
+            # لا يوجد سعر قبل الدخول: التعديل بتاريخ سابق يستبدل سعر الدخول
+            effective = max(effective, to_date(admission[0]))
+        self.db.execute('''
+            INSERT OR REPLACE INTO patient_rate_history
+                (patient_id, effective_date, daily_cost, department, cigarettes_count)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (patient_id, effective.strftime(DATE_FORMAT), float(daily_cost), department, int(cigarettes_count)))
+        return effective
+
+    def intervals(self, patient_ids=None, through_date=None, period=None):
+        # يعيد (patient_id, start, end, daily_cost, department, cigarettes_count) مرتبة ومقصوصة على مدة
+        # الإقامة: من الدخول حتى التخرج أو through_date للمرضى النشطين.
+        # period يحدد هل يُقرأ الأرشيف أيضاً (للتقارير)
+        through = to_date(through_date or date.today())
+        patients = 'patients'
+        rates = 'patient_rate_history'
+        if period is not None:
+            patients = self.archive.table(patients, period)
+            rates = self.archive.table(rates, period)
+        query = f'''
+            SELECT p.id, p.admission_date, p.status, p.discharged_at,
+                   r.effective_date, r.daily_cost, r.department, r.cigarettes_count
+            FROM {patients} p
+            JOIN {rates} r ON r.patient_id = p.id
+        '''
+        params = ()
+        if patient_ids is not None:
+            patient_ids = list(patient_ids)
+            if not patient_ids:
+                return
+            query += f' WHERE p.id IN ({", ".join("?" * len(patient_ids))})'
+            params = tuple(patient_ids)
+        query += ' ORDER BY p.id, r.effective_date'
+
+        pending = None
+        for patient_id, admission_date, status, discharged_at, effective_date, daily_cost, department, \
+                cigarettes_count in self.db.fetchall(query, params):
+            admission = to_date(admission_date)
+            stay_end = through
+            if status == 'متخرج' and discharged_at:
+                stay_end = min(stay_end, to_date(discharged_at))
+
+            if pending and pending[0] == patient_id:
+                # السطر السابق ينتهي قبل سريان هذا السطر بيوم
+                end = min(pending[2], to_date(effective_date) - timedelta(days=1))
+                if end >= pending[1]:
+                    yield (patient_id, pending[1], end) + pending[3:]
+                start = max(to_date(effective_date), admission)
+            else:
+                if pending and pending[2] >= pending[1]:
+                    yield pending
+                # أول سعر يغطي الإقامة من يوم الدخول
+                start = admission
+            pending = (patient_id, start, stay_end, float(daily_cost), department, cigarettes_count)
+
+        if pending and pending[2] >= pending[1]:
+            yield pending
+
+    def cost_intervals(self, patient_ids=None, through_date=None, period=None):
+        # مثل intervals بدون عدد السجائر: (patient_id, start, end, daily_cost, department).
+        # سطر غيّر السجائر فقط لا يقطع فترة الإقامة، فيُدمج مع الفترة السابقة له
+        pending = None
+        for patient_id, start, end, daily_cost, department, _ in self.intervals(patient_ids, through_date, period):
+            if (pending and pending[0] == patient_id and pending[3:] == (daily_cost, department)
+                    and pending[2] + timedelta(days=1) == start):
+                pending = pending[:2] + (end,) + pending[3:]
+                continue
+            if pending:
+                yield pending
+            pending = (patient_id, start, end, daily_cost, department)
+        if pending:
+            yield pending
+
+    def sweep(self, period, patient_ids=None):
+        # الأيام والتكلفة لكل مريض ولكل قسم داخل period في مرور واحد على الفترات
+        through = min(period.end, date.today())
+        patients = {}
+        departments = {}
+        for patient_id, start, end, daily_cost, department in self.cost_intervals(patient_ids, through, period):
+            start = max(start, period.start)
+            end = min(end, period.end)
+            if end < start:
+                continue
+            days = (end - start).days + 1
+            cost = days * daily_cost
+
+            patient_totals = patients.setdefault(patient_id, {'days': 0, 'cost': 0})
+            patient_totals['days'] += days
+            patient_totals['cost'] += cost
+
+            department_totals = departments.setdefault(department, {'days': 0, 'cost': 0, 'patients': set()})
+            department_totals['days'] += days
+            department_totals['cost'] += cost
+            department_totals['patients'].add(patient_id)
+
+        for department_totals in departments.values():
+            department_totals['patients'] = len(department_totals['patients'])
+        return {'patients': patients, 'departments': departments}
+
+    def get_stay_periods(self, patient_id, through_date=None):
+        # فترات الأسعار لكشف حساب المريض
+        periods = []
+        for _, start, end, daily_cost, department in self.cost_intervals([patient_id], through_date):
+            days = (end - start).days + 1
+            periods.append({
+                'start': start,
+                'end': end,
+                'days': days,
+                'daily_cost': daily_cost,
+                'department': department,
+                'cost': days * daily_cost
+            })
+        return periods
@@ -1,7 +1,12 @@
 from datetime import datetime, timedelta
+from itertools import chain
 import os
 import webbrowser
 import tempfile
+from modules.periods import Period
+
+# مكان المحتوى في القالب؛ التقرير يُكتب للملف قطعة قطعة بين رأس القالب وذيله
+CONTENT_MARKER = '<!--content-->'
 
 class ReportGenerator:
     def __init__(self, db):
@@ -192,54 +197,37 @@ class ReportGenerator:
 </body>
 </html>'''
     
-    def generate_monthly_report(self, year, month, output_path):
-        from modules.payments import PaymentManager
-        from modules.expenses import ExpenseManager
-        from modules.patients import PatientManager
-        
-        payment_mgr = PaymentManager(self.db)
-        expense_mgr = ExpenseManager(self.db)
-        patient_mgr = PatientManager(self.db)
-        
-        revenue = payment_mgr.get_monthly_revenue(year, month)
-        expenses = expense_mgr.get_monthly_expenses(year, month)
-        profit = revenue - expenses
-        
-        active = patient_mgr.get_active_count()
-        graduated = patient_mgr.get_graduated_count()
-        
-        payments_query = '''
-            SELECT p.payment_date, pt.name, p.amount, p.notes 
-            FROM payments p
-            JOIN patients pt ON p.patient_id = pt.id
-            WHERE strftime('%Y', p.payment_date) = ? AND strftime('%m', p.payment_date) = ?
-            ORDER BY p.payment_date DESC
-        '''
-        payments = self.db.fetchall(payments_query, (str(year), f'{month:02d}'))
-        
-        expenses_query = '''
-            SELECT expense_date, category, amount, description
-            FROM expenses
-            WHERE strftime('%Y', expense_date) = ? AND strftime('%m', expense_date) = ?
-            ORDER BY expense_date DESC
-        '''
-        expenses_list = self.db.fetchall(expenses_query, (str(year), f'{month:02d}'))
+    def _write_report(self, output_path, title, chunks):
+        # chunks: نصوص HTML (أو generators تنتجها) تُكتب بالترتيب دون تجميع التقرير في الذاكرة
+        head, tail = self._get_html_template(title, CONTENT_MARKER).split(CONTENT_MARKER)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(head)
+            for chunk in chunks:
+                f.write(chunk)
+            f.write(tail)
         
-        payments_table = ''
-        if payments:
-            payments_table = '''
+        webbrowser.open('file://' + os.path.abspath(output_path))
+        return True
+    
+    def _payments_table(self, payments, date_label='التاريخ'):
+        # payments: صفوف PaymentManager.iter_payments؛ لا جدول إذا لم توجد مدفوعات
+        payments = iter(payments)
+        payment = next(payments, None)
+        if payment is None:
+            return
+        yield f'''
             <h3>💰 المدفوعات</h3>
             <table class="details-table">
                 <tr>
-                    <th>التاريخ</th>
+                    <th>{date_label}</th>
                     <th>اسم المريض</th>
                     <th>المبلغ</th>
                     <th>ملاحظات</th>
                 </tr>
             '''
-            for payment in payments:
-                notes = payment[3] if payment[3] else '-'
-                payments_table += f'''
+        for payment in chain([payment], payments):
+            notes = payment[3] if payment[3] else '-'
+            yield f'''
                 <tr>
                     <td>{payment[0]}</td>
                     <td>{payment[1]}</td>
@@ -247,23 +235,26 @@ class ReportGenerator:
                     <td>{notes}</td>
                 </tr>
                 '''
-            payments_table += '</table>'
-        
-        expenses_table = ''
-        if expenses_list:
-            expenses_table = '''
+        yield '</table>'
+    
+    def _expenses_table(self, expenses, date_label='التاريخ'):
+        expenses = iter(expenses)
+        expense = next(expenses, None)
+        if expense is None:
+            return
+        yield f'''
             <h3>💸 المصروفات</h3>
             <table class="details-table">
                 <tr>
-                    <th>التاريخ</th>
+                    <th>{date_label}</th>
                     <th>البند</th>
                     <th>المبلغ</th>
                     <th>الوصف</th>
                 </tr>
             '''
-            for expense in expenses_list:
-                desc = expense[3] if expense[3] else '-'
-                expenses_table += f'''
+        for expense in chain([expense], expenses):
+            desc = expense[3] if expense[3] else '-'
+            yield f'''
                 <tr>
                     <td>{expense[0]}</td>
                     <td>{expense[1]}</td>
@@ -271,7 +262,54 @@ class ReportGenerator:
                     <td>{desc}</td>
                 </tr>
                 '''
-            expenses_table += '</table>'
+        yield '</table>'
+    
+    def _department_table(self, patient_mgr, period):
+        departments = patient_mgr.get_department_stats(period)
+        if not departments:
+            return ''
+        
+        table = '''
+            <h3>🏥 الإقامة حسب القسم</h3>
+            <table class="details-table">
+                <tr>
+                    <th>القسم</th>
+                    <th>عدد المرضى</th>
+                    <th>أيام الإقامة</th>
+                    <th>تكلفة الإقامة</th>
+                </tr>
+            '''
+        for department, totals in sorted(departments.items()):
+            table += f'''
+                <tr>
+                    <td>{department}</td>
+                    <td>{totals['patients']}</td>
+                    <td>{totals['days']}</td>
+                    <td>{totals['cost']:.2f} جنيه</td>
+                </tr>
+                '''
+        table += '</table>'
+        return table
+    
+    def generate_monthly_report(self, year, month, output_path):
+        from modules.payments import PaymentManager
+        from modules.expenses import ExpenseManager
+        from modules.patients import PatientManager
+        
+        payment_mgr = PaymentManager(self.db)
+        expense_mgr = ExpenseManager(self.db)
+        patient_mgr = PatientManager(self.db)
+        
+        period = Period.month(year, month)
+        revenue = payment_mgr.get_revenue(period)
+        expenses = expense_mgr.get_expenses_total(period)
+        profit = revenue - expenses
+        
+        active = patient_mgr.get_active_count()
+        graduated = patient_mgr.get_graduated_count()
+        
+        payment_count = payment_mgr.count_payments_in_period(period)
+        expense_count = expense_mgr.count_expenses_in_period(period)
         
         content = f'''
         <div class="stats-grid">
@@ -293,97 +331,33 @@ class ReportGenerator:
             <h3>📊 ملخص الشهر</h3>
             <p><strong>المرضى النشطون:</strong> {active} مريض</p>
             <p><strong>الخريجون:</strong> {graduated} مريض</p>
-            <p><strong>عدد المدفوعات:</strong> {len(payments) if payments else 0}</p>
-            <p><strong>عدد المصروفات:</strong> {len(expenses_list) if expenses_list else 0}</p>
+            <p><strong>عدد المدفوعات:</strong> {payment_count}</p>
+            <p><strong>عدد المصروفات:</strong> {expense_count}</p>
         </div>
         
-        {payments_table}
-        {expenses_table}
+        {self._department_table(patient_mgr, period)}
         '''
         
-        html = self._get_html_template(f'تقرير شهري - {year}/{month:02d}', content)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html)
-        
-        webbrowser.open('file://' + os.path.abspath(output_path))
-        return True
+        return self._write_report(output_path, f'تقرير شهري - {year}/{month:02d}', chain(
+            [content],
+            self._payments_table(payment_mgr.iter_payments(period)),
+            self._expenses_table(expense_mgr.iter_expenses(period))
+        ))
     
     def generate_daily_report(self, date, output_path):
-        revenue_query = 'SELECT SUM(amount) FROM payments WHERE payment_date = ?'
-        revenue_result = self.db.fetchone(revenue_query, (date,))
-        revenue = float(revenue_result[0]) if revenue_result and revenue_result[0] is not None else 0.0
+        from modules.payments import PaymentManager
+        from modules.expenses import ExpenseManager
         
-        expense_query = 'SELECT SUM(amount) FROM expenses WHERE expense_date = ?'
-        expenses_result = self.db.fetchone(expense_query, (date,))
-        expenses = float(expenses_result[0]) if expenses_result and expenses_result[0] is not None else 0.0
+        payment_mgr = PaymentManager(self.db)
+        expense_mgr = ExpenseManager(self.db)
         
+        period = Period.day(date)
+        revenue = float(payment_mgr.get_revenue(period))
+        expenses = float(expense_mgr.get_expenses_total(period))
         profit = revenue - expenses
         
-        payments_query = '''
-            SELECT p.payment_date, pt.name, p.amount, p.notes 
-            FROM payments p
-            JOIN patients pt ON p.patient_id = pt.id
-            WHERE p.payment_date = ?
-            ORDER BY p.id DESC
-        '''
-        payments = self.db.fetchall(payments_query, (date,))
-        
-        expenses_query = '''
-            SELECT expense_date, category, amount, description
-            FROM expenses
-            WHERE expense_date = ?
-            ORDER BY id DESC
-        '''
-        expenses_list = self.db.fetchall(expenses_query, (date,))
-        
-        payments_table = ''
-        if payments:
-            payments_table = '''
-            <h3>💰 المدفوعات</h3>
-            <table class="details-table">
-                <tr>
-                    <th>الوقت</th>
-                    <th>اسم المريض</th>
-                    <th>المبلغ</th>
-                    <th>ملاحظات</th>
-                </tr>
-            '''
-            for payment in payments:
-                notes = payment[3] if payment[3] else '-'
-                payments_table += f'''
-                <tr>
-                    <td>{payment[0]}</td>
-                    <td>{payment[1]}</td>
-                    <td>{payment[2]:.2f} جنيه</td>
-                    <td>{notes}</td>
-                </tr>
-                '''
-            payments_table += '</table>'
-        
-        expenses_table = ''
-        if expenses_list:
-            expenses_table = '''
-            <h3>💸 المصروفات</h3>
-            <table class="details-table">
-                <tr>
-                    <th>الوقت</th>
-                    <th>البند</th>
-                    <th>المبلغ</th>
-                    <th>الوصف</th>
-                </tr>
-            '''
-            for expense in expenses_list:
-                desc = expense[3] if expense[3] else '-'
-                expenses_table += f'''
-                <tr>
-                    <td>{expense[0]}</td>
-                    <td>{expense[1]}</td>
-                    <td>{expense[2]:.2f} جنيه</td>
-                    <td>{desc}</td>
-                </tr>
-                '''
-            expenses_table += '</table>'
+        payment_count = payment_mgr.count_payments_in_period(period)
+        expense_count = expense_mgr.count_expenses_in_period(period)
         
         content = f'''
         <div class="stats-grid">
@@ -403,97 +377,32 @@ class ReportGenerator:
         
         <div class="summary">
             <h3>📊 ملخص اليوم</h3>
-            <p><strong>عدد المدفوعات:</strong> {len(payments) if payments else 0}</p>
-            <p><strong>عدد المصروفات:</strong> {len(expenses_list) if expenses_list else 0}</p>
+            <p><strong>عدد المدفوعات:</strong> {payment_count}</p>
+            <p><strong>عدد المصروفات:</strong> {expense_count}</p>
         </div>
         
-        {payments_table}
-        {expenses_table}
         '''
         
-        html = self._get_html_template(f'تقرير يومي - {date}', content)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html)
-        
-        webbrowser.open('file://' + os.path.abspath(output_path))
-        return True
+        return self._write_report(output_path, f'تقرير يومي - {date}', chain(
+            [content],
+            self._payments_table(payment_mgr.iter_payments(period), 'الوقت'),
+            self._expenses_table(expense_mgr.iter_expenses(period), 'الوقت')
+        ))
     
     def generate_weekly_report(self, start_date, end_date, output_path):
-        revenue_query = 'SELECT SUM(amount) FROM payments WHERE payment_date BETWEEN ? AND ?'
-        revenue_result = self.db.fetchone(revenue_query, (start_date, end_date))
-        revenue = float(revenue_result[0]) if revenue_result and revenue_result[0] is not None else 0.0
+        from modules.payments import PaymentManager
+        from modules.expenses import ExpenseManager
         
-        expense_query = 'SELECT SUM(amount) FROM expenses WHERE expense_date BETWEEN ? AND ?'
-        expenses_result = self.db.fetchone(expense_query, (start_date, end_date))
-        expenses = float(expenses_result[0]) if expenses_result and expenses_result[0] is not None else 0.0
+        payment_mgr = PaymentManager(self.db)
+        expense_mgr = ExpenseManager(self.db)
         
+        period = Period.custom(start_date, end_date)
+        revenue = float(payment_mgr.get_revenue(period))
+        expenses = float(expense_mgr.get_expenses_total(period))
         profit = revenue - expenses
         
-        payments_query = '''
-            SELECT p.payment_date, pt.name, p.amount, p.notes 
-            FROM payments p
-            JOIN patients pt ON p.patient_id = pt.id
-            WHERE p.payment_date BETWEEN ? AND ?
-            ORDER BY p.payment_date DESC
-        '''
-        payments = self.db.fetchall(payments_query, (start_date, end_date))
-        
-        expenses_query = '''
-            SELECT expense_date, category, amount, description
-            FROM expenses
-            WHERE expense_date BETWEEN ? AND ?
-            ORDER BY expense_date DESC
-        '''
-        expenses_list = self.db.fetchall(expenses_query, (start_date, end_date))
-        
-        payments_table = ''
-        if payments:
-            payments_table = '''
-            <h3>💰 المدفوعات</h3>
-            <table class="details-table">
-                <tr>
-                    <th>التاريخ</th>
-                    <th>اسم المريض</th>
-                    <th>المبلغ</th>
-                    <th>ملاحظات</th>
-                </tr>
-            '''
-            for payment in payments:
-                notes = payment[3] if payment[3] else '-'
-                payments_table += f'''
-                <tr>
-                    <td>{payment[0]}</td>
-                    <td>{payment[1]}</td>
-                    <td>{payment[2]:.2f} جنيه</td>
-                    <td>{notes}</td>
-                </tr>
-                '''
-            payments_table += '</table>'
-        
-        expenses_table = ''
-        if expenses_list:
-            expenses_table = '''
-            <h3>💸 المصروفات</h3>
-            <table class="details-table">
-                <tr>
-                    <th>التاريخ</th>
-                    <th>البند</th>
-                    <th>المبلغ</th>
-                    <th>الوصف</th>
-                </tr>
-            '''
-            for expense in expenses_list:
-                desc = expense[3] if expense[3] else '-'
-                expenses_table += f'''
-                <tr>
-                    <td>{expense[0]}</td>
-                    <td>{expense[1]}</td>
-                    <td>{expense[2]:.2f} جنيه</td>
-                    <td>{desc}</td>
-                </tr>
-                '''
-            expenses_table += '</table>'
+        payment_count = payment_mgr.count_payments_in_period(period)
+        expense_count = expense_mgr.count_expenses_in_period(period)
         
         content = f'''
         <div class="stats-grid">
@@ -515,21 +424,17 @@ class ReportGenerator:
             <h3>📊 ملخص الفترة</h3>
             <p><strong>من تاريخ:</strong> {start_date}</p>
             <p><strong>إلى تاريخ:</strong> {end_date}</p>
-            <p><strong>عدد المدفوعات:</strong> {len(payments) if payments else 0}</p>
-            <p><strong>عدد المصروفات:</strong> {len(expenses_list) if expenses_list else 0}</p>
+            <p><strong>عدد المدفوعات:</strong> {payment_count}</p>
+            <p><strong>عدد المصروفات:</strong> {expense_count}</p>
         </div>
         
-        {payments_table}
-        {expenses_table}
         '''
         
-        html = self._get_html_template(f'تقرير أسبوعي - من {start_date} إلى {end_date}', content)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html)
-        
-        webbrowser.open('file://' + os.path.abspath(output_path))
-        return True
+        return self._write_report(output_path, f'تقرير أسبوعي - من {start_date} إلى {end_date}', chain(
+            [content],
+            self._payments_table(payment_mgr.iter_payments(period)),
+            self._expenses_table(expense_mgr.iter_expenses(period))
+        ))
     
     def generate_yearly_report(self, year, output_path):
         from modules.payments import PaymentManager
@@ -540,23 +445,22 @@ class ReportGenerator:
         expense_mgr = ExpenseManager(self.db)
         patient_mgr = PatientManager(self.db)
         
-        revenue_query = "SELECT SUM(amount) FROM payments WHERE strftime('%Y', payment_date) = ?"
-        revenue_result = self.db.fetchone(revenue_query, (str(year),))
-        revenue = float(revenue_result[0]) if revenue_result and revenue_result[0] is not None else 0.0
-        
-        expense_query = "SELECT SUM(amount) FROM expenses WHERE strftime('%Y', expense_date) = ?"
-        expenses_result = self.db.fetchone(expense_query, (str(year),))
-        expenses = float(expenses_result[0]) if expenses_result and expenses_result[0] is not None else 0.0
-        
+        period = Period.year(year)
+        revenue = float(payment_mgr.get_revenue(period))
+        expenses = float(expense_mgr.get_expenses_total(period))
         profit = revenue - expenses
         
         active = patient_mgr.get_active_count()
         graduated = patient_mgr.get_graduated_count()
         
+        revenue_by_month = payment_mgr.get_revenue_by_month(period)
+        expenses_by_month = expense_mgr.get_expenses_by_month(period)
+        
         monthly_stats = []
-        for month in range(1, 13):
-            month_revenue = payment_mgr.get_monthly_revenue(year, month)
-            month_expenses = expense_mgr.get_monthly_expenses(year, month)
+        for _, month in period.months():
+            key = f'{year}-{month:02d}'
+            month_revenue = revenue_by_month.get(key) or 0
+            month_expenses = expenses_by_month.get(key) or 0
             month_profit = month_revenue - month_expenses
             monthly_stats.append((month, month_revenue, month_expenses, month_profit))
         
@@ -607,13 +511,8 @@ class ReportGenerator:
             <p><strong>الخريجون:</strong> {graduated} مريض</p>
         </div>
         
+        {self._department_table(patient_mgr, period)}
         {monthly_table}
         '''
         
-        html = self._get_html_template(f'تقرير سنوي - {year}', content)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html)
-        
-        webbrowser.open('file://' + os.path.abspath(output_path))
-        return True
+        return self._write_report(output_path, f'تقرير سنوي - {year}', [content])
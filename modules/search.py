@@ -0,0 +1,201 @@
+import re
+from collections import namedtuple
+
+# توحيد الحروف العربية قبل الفهرسة والبحث: أشكال الألف، التاء المربوطة، الألف
+# المقصورة، التشكيل والتطويل، والأرقام الهندية. نفس الجدول يُستخدم في بايثون
+# (normalize_arabic) وفي triggers الفهرس (normalized_sql) حتى يتطابق الطرفان
+ARABIC_NORMALIZATION = [
+    ('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ٱ', 'ا'),
+    ('ة', 'ه'), ('ى', 'ي'),
+    ('ـ', ''),
+] + [(chr(mark), '') for mark in range(0x064B, 0x0653)] \
+  + [(chr(0x0660 + digit), str(digit)) for digit in range(10)]
+
+SEARCH_LIMIT = 200
+
+def normalize_arabic(text):
+    text = (text or '').lower()
+    for source, target in ARABIC_NORMALIZATION:
+        text = text.replace(source, target)
+    return text
+
+def normalized_sql(expression):
+    # تعبير SQL يطبق ARABIC_NORMALIZATION بسلسلة replace() داخل triggers
+    sql = f"lower(COALESCE({expression}, ''))"
+    for source, target in ARABIC_NORMALIZATION:
+        sql = f"replace({sql}, '{source}', '{target}')"
+    return sql
+
+def fts_query(text):
+    # كل كلمة تُبحث كبادئة ("محم"* تطابق محمد)؛ الكلمات مرتبطة بـ AND
+    tokens = re.findall(r'\w+', normalize_arabic(text))
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def create_patients_index(db):
+    # فهرس FTS5 لاسم المريض وهاتف الأهل بعد التوحيد؛ rowid = رقم المريض
+    db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+            name, phone, tokenize = 'unicode61'
+        )
+    ''')
+    name, phone = normalized_sql('NEW.name'), normalized_sql('NEW.family_phone')
+    db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_patients_fts_insert
+        AFTER INSERT ON patients
+        BEGIN
+            INSERT INTO patients_fts (rowid, name, phone) VALUES (NEW.id, {name}, {phone});
+        END
+    ''')
+    db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_patients_fts_update
+        AFTER UPDATE OF name, family_phone ON patients
+        BEGIN
+            DELETE FROM patients_fts WHERE rowid = OLD.id;
+            INSERT INTO patients_fts (rowid, name, phone) VALUES (NEW.id, {name}, {phone});
+        END
+    ''')
+    db.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_patients_fts_delete
+        AFTER DELETE ON patients
+        BEGIN
+            DELETE FROM patients_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    db.execute('DELETE FROM patients_fts')
+    db.execute(f'''
+        INSERT INTO patients_fts (rowid, name, phone)
+        SELECT id, {normalized_sql('name')}, {normalized_sql('family_phone')} FROM patients
+    ''')
+
+# الفهرس الموحد للمدفوعات والمصروفات والموظفين وحركاتهم: صف لكل سجل ونوعه في
+# entity. rowid = id * ENTITY_SLOTS + رمز النوع حتى تحذف triggers الصف مباشرة
+ENTITY_SLOTS = 8
+SEARCH_ENTITIES = {
+    'payments': (1, ('notes', 'amount')),
+    'expenses': (2, ('category', 'description', 'amount')),
+    'employees': (3, ('name', 'phone', 'position')),
+    'employee_transactions': (4, ('transaction_type', 'notes', 'amount')),
+}
+OMNIBOX_LIMIT = 50
+
+SearchResult = namedtuple('SearchResult', ['entity', 'entity_id', 'title', 'detail', 'owner_id'])
+
+def _indexed_text(columns, prefix=''):
+    # كل عمود يُوحد وحده: سلسلة replace() واحدة حول الربط تتجاوز عمق محلل SQLite
+    return " || ' ' || ".join(normalized_sql(f'{prefix}{column}') for column in columns)
+
+def create_search_index(db):
+    db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            entity UNINDEXED, entity_id UNINDEXED, body, tokenize = 'unicode61'
+        )
+    ''')
+    db.execute('DELETE FROM search_index')
+    for table, (code, columns) in SEARCH_ENTITIES.items():
+        text = _indexed_text(columns, 'NEW.')
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO search_index (rowid, entity, entity_id, body)
+                VALUES (NEW.id * {ENTITY_SLOTS} + {code}, '{table}', NEW.id, {text});
+            END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_update
+            AFTER UPDATE OF {', '.join(columns)} ON {table}
+            BEGIN
+                DELETE FROM search_index WHERE rowid = OLD.id * {ENTITY_SLOTS} + {code};
+                INSERT INTO search_index (rowid, entity, entity_id, body)
+                VALUES (NEW.id * {ENTITY_SLOTS} + {code}, '{table}', NEW.id, {text});
+            END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM search_index WHERE rowid = OLD.id * {ENTITY_SLOTS} + {code};
+            END
+        ''')
+        db.execute(f'''
+            INSERT INTO search_index (rowid, entity, entity_id, body)
+            SELECT id * {ENTITY_SLOTS} + {code}, '{table}', id, {_indexed_text(columns)} FROM main.{table}
+        ''')
+
+class SearchService:
+    # بحث واحد في كل الكيانات: المرضى من patients_fts والباقي من search_index،
+    # ثم تُقرأ بيانات العرض لكل نوع باستعلام واحد
+    def __init__(self, db):
+        self.db = db
+
+    def search(self, text, limit=OMNIBOX_LIMIT):
+        query_text = fts_query(text)
+        if not query_text:
+            return []
+        patient_ids = [row[0] for row in self.db.fetchall('''
+            SELECT rowid FROM patients_fts WHERE patients_fts MATCH ?
+            ORDER BY bm25(patients_fts, 10.0, 1.0) LIMIT ?
+        ''', (query_text, limit))]
+        matches = self.db.fetchall('''
+            SELECT entity, entity_id FROM search_index WHERE search_index MATCH ?
+            ORDER BY rank LIMIT ?
+        ''', (query_text, limit))
+
+        results = self._patients(patient_ids)
+        ids_by_entity = {}
+        for entity, entity_id in matches:
+            ids_by_entity.setdefault(entity, []).append(entity_id)
+        rows = {}
+        for entity, ids in ids_by_entity.items():
+            rows.update(((entity, result.entity_id), result)
+                        for result in getattr(self, f'_{entity}')(ids))
+        # ترتيب المطابقة من الفهرس؛ صف حُذف قبل قراءة تفاصيله يُتجاهل
+        results.extend(rows[(entity, entity_id)] for entity, entity_id in matches
+                       if (entity, entity_id) in rows)
+        return results[:limit]
+
+    def _fetch(self, query, ids):
+        return self.db.fetchall(query.format(ids=', '.join('?' * len(ids))), tuple(ids))
+
+    def _patients(self, ids):
+        if not ids:
+            return []
+        rows = {row[0]: row for row in self._fetch(
+            'SELECT id, name, family_phone, status FROM patients WHERE id IN ({ids})', ids)}
+        return [SearchResult('patients', patient_id, rows[patient_id][1],
+                             f'{rows[patient_id][2] or ""} — {rows[patient_id][3]}', None)
+                for patient_id in ids if patient_id in rows]
+
+    def _payments(self, ids):
+        return [SearchResult('payments', payment_id, f'دفعة {amount:.2f} — {name or ""}',
+                             f'{payment_date} {notes or ""}'.strip(), patient_id)
+                for payment_id, patient_id, amount, payment_date, notes, name in self._fetch('''
+                    SELECT p.id, p.patient_id, p.amount, p.payment_date, p.notes, pt.name
+                    FROM payments p LEFT JOIN patients pt ON pt.id = p.patient_id
+                    WHERE p.id IN ({ids})
+                ''', ids)]
+
+    def _expenses(self, ids):
+        return [SearchResult('expenses', expense_id, f'{category} {amount:.2f}',
+                             f'{expense_date} {description or ""}'.strip(), None)
+                for expense_id, category, amount, expense_date, description in self._fetch('''
+                    SELECT id, category, amount, expense_date, description
+                    FROM expenses WHERE id IN ({ids})
+                ''', ids)]
+
+    def _employees(self, ids):
+        return [SearchResult('employees', employee_id, name,
+                             ' — '.join(part for part in (position, phone) if part), None)
+                for employee_id, name, position, phone in self._fetch(
+                    'SELECT id, name, position, phone FROM employees WHERE id IN ({ids})', ids)]
+
+    def _employee_transactions(self, ids):
+        return [SearchResult('employee_transactions', transaction_id,
+                             f'{transaction_type} {amount:.2f} — {name or ""}',
+                             f'{transaction_date} {notes or ""}'.strip(), employee_id)
+                for transaction_id, employee_id, transaction_type, amount, transaction_date, notes, name
+                in self._fetch('''
+                    SELECT t.id, t.employee_id, t.transaction_type, t.amount, t.transaction_date, t.notes, e.name
+                    FROM employee_transactions t LEFT JOIN employees e ON e.id = t.employee_id
+                    WHERE t.id IN ({ids})
+                ''', ids)]
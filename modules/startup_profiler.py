@@ -0,0 +1,75 @@
+import builtins
+import sys
+import threading
+import time
+from datetime import datetime
+
+STARTUP_LOG = 'startup_log.txt'
+# عدد الوحدات الأبطأ استيراداً التي تُكتب في السجل
+SLOWEST_IMPORTS = 15
+
+class StartupProfiler:
+    # أزمنة الإقلاع: مدة كل مرحلة بين نقطتي checkpoint، وزمن استيراد كل وحدة أثناء
+    # install/uninstall بتغليف __import__. زمن الوحدة ذاتي (بدون الوحدات التي
+    # استوردتها) مثل python -X importtime، والنتيجة تُضاف لملف STARTUP_LOG
+    def __init__(self):
+        self.imports = {}
+        self._original_import = None
+        self._stack = []
+        self.restart()
+
+    def restart(self):
+        self.started = self.last = time.perf_counter()
+        self.phases = []
+
+    def checkpoint(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    # --- أزمنة الاستيراد ---
+
+    def install(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            self._thread = threading.get_ident()
+            builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # الوحدات المحملة سابقاً والاستيراد النسبي وخيوط الخلفية تمر دون قياس
+        if level or name in sys.modules or threading.get_ident() != self._thread:
+            return self._original_import(name, globals, locals, fromlist, level)
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            self.imports[name] = self.imports.get(name, 0.0) + elapsed - children
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    # --- السجل ---
+
+    def write(self, title, path=STARTUP_LOG):
+        total = time.perf_counter() - self.started
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        lines = [f'\n=== {title} - {timestamp} ===', f'الإجمالي: {total * 1000:.0f} ms']
+        lines += [f'  {name}: {seconds * 1000:.0f} ms' for name, seconds in self.phases]
+        if self.imports:
+            lines.append(f'الاستيراد: {len(self.imports)} وحدة في {sum(self.imports.values()) * 1000:.0f} ms، الأبطأ:')
+            slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:SLOWEST_IMPORTS]
+            lines += [f'  {name}: {seconds * 1000:.1f} ms' for name, seconds in slowest]
+            self.imports = {}
+        lines.append('=' * 50)
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+        except Exception as e:
+            print(f'فشل كتابة سجل الإقلاع: {str(e)}')
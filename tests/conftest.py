@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+# الاختبارات تستورد db و modules من جذر المشروع كما يفعل main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import Database
+from modules.patients import PatientManager
+from modules.payments import PaymentManager
+from modules.expenses import ExpenseManager
+
+@pytest.fixture
+def db(tmp_path):
+    # قاعدة جديدة مع أرشيفها في مجلد مؤقت لكل اختبار
+    database = Database(str(tmp_path / 'db' / 'test.db'))
+    yield database
+    database.close()
+
+@pytest.fixture
+def patients(db):
+    return PatientManager(db)
+
+@pytest.fixture
+def payments(db):
+    return PaymentManager(db)
+
+@pytest.fixture
+def expenses(db):
+    return ExpenseManager(db)
+
+@pytest.fixture
+def add_patient(db, patients):
+    # يعيد id المريض؛ add_patient في المدير يعيد True فقط
+    def add(admission_date, daily_cost=100, cigarettes_count=0, department='ديتوكس', name='مريض'):
+        patients.add_patient(name, '', str(admission_date), department, daily_cost,
+                             1 if cigarettes_count else 0, cigarettes_count)
+        return db.fetchone('SELECT MAX(id) FROM patients')[0]
+    return add
@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+from modules.accruals import ACCOMMODATION, CIGARETTES
+from modules.periods import Period
+
+def days_ago(days):
+    return date.today() - timedelta(days=days)
+
+def charges(db, patient_id, charge_type):
+    return db.fetchall('''
+        SELECT charge_date, amount FROM charges
+        WHERE patient_id = ? AND charge_type = ?
+        ORDER BY charge_date
+    ''', (patient_id, charge_type))
+
+def test_run_is_idempotent(db, patients, add_patient):
+    patient_id = add_patient(days_ago(9), daily_cost=100, cigarettes_count=20)
+    rows = db.fetchone('SELECT COUNT(*) FROM charges')[0]
+
+    assert len(charges(db, patient_id, ACCOMMODATION)) == 10
+    assert patients.accruals.run() == 0
+    assert patients.accruals.run(patient_ids=[patient_id]) == 0
+    assert db.fetchone('SELECT COUNT(*) FROM charges')[0] == rows
+    assert patients.get_all_balances()[patient_id]['accommodation_cost'] == 1000
+
+def test_run_continues_from_last_charge(db, patients, add_patient):
+    patient_id = add_patient(days_ago(9))
+    db.execute('DELETE FROM charges WHERE charge_date > ?', (days_ago(3).isoformat(),))
+
+    assert patients.accruals.run() == 3
+    assert [row[0] for row in charges(db, patient_id, ACCOMMODATION)][-1] == date.today().isoformat()
+
+def test_reading_balances_does_not_accrue(db, patients, add_patient):
+    patient_id = add_patient(days_ago(4))
+    db.execute('DELETE FROM charges WHERE charge_date = ?', (date.today().isoformat(),))
+
+    patients.get_all_balances()
+    patients.get_balances([patient_id])
+    assert len(charges(db, patient_id, ACCOMMODATION)) == 4
+
+def test_cigarette_price_change_mid_stay(db, patients, add_patient):
+    prices = patients.accruals.prices
+    old_price = prices.price_on()
+    patient_id = add_patient(days_ago(9), cigarettes_count=20)
+
+    # نفس خطوات شاشة السجائر: السعر الجديد من تاريخ سريانه ثم إعادة الحساب منه
+    with db.transaction():
+        effective = prices.set_price(old_price + 10, days_ago(3))
+        patients.accruals.recalculate(charge_type=CIGARETTES, since=effective)
+
+    amounts = [amount for _, amount in charges(db, patient_id, CIGARETTES)]
+    assert amounts == [old_price] * 6 + [old_price + 10] * 4
+    assert prices.pack_cost(days_ago(9), date.today()) == sum(amounts)
+
+def test_rate_change_applies_from_effective_date(db, patients, add_patient):
+    patient_id = add_patient(days_ago(9), daily_cost=100)
+
+    patients.update_patient(patient_id, 'مريض', '', 'تأهيل', 150, 0, 0, effective_date=days_ago(3))
+
+    rows = db.fetchall('''
+        SELECT amount, department FROM charges
+        WHERE patient_id = ? AND charge_type = ?
+        ORDER BY charge_date
+    ''', (patient_id, ACCOMMODATION))
+    assert rows == [(100, 'ديتوكس')] * 6 + [(150, 'تأهيل')] * 4
+
+    intervals = list(patients.accruals.rates.intervals([patient_id]))
+    assert [(start, end, cost, department) for _, start, end, cost, department, _ in intervals] == [
+        (days_ago(9), days_ago(4), 100, 'ديتوكس'),
+        (days_ago(3), date.today(), 150, 'تأهيل'),
+    ]
+
+    sweep = patients.accruals.rates.sweep(Period.custom(days_ago(9), date.today()))
+    assert sweep['patients'][patient_id] == {'days': 10, 'cost': 1200}
+    assert sweep['departments']['ديتوكس']['days'] == 6
+    assert sweep['departments']['تأهيل']['cost'] == 600
+
+def test_rate_before_admission_replaces_admission_rate(db, patients, add_patient):
+    patient_id = add_patient(days_ago(5), daily_cost=100)
+
+    effective = patients.accruals.rates.set_rate(patient_id, 120, 'ديتوكس', 0, days_ago(30))
+    assert effective == days_ago(5)
+    assert patients.accruals.rates.get_history(patient_id) == [(days_ago(5).isoformat(), 120, 'ديتوكس', 0)]
+
+def test_cigarettes_change_keeps_earlier_charges(db, patients, add_patient):
+    price = patients.accruals.prices.price_on()
+    smoker = add_patient(days_ago(9), cigarettes_count=20)
+    other = add_patient(days_ago(9))
+
+    patients.set_cigarettes(smoker, 0, 20)
+    patients.set_cigarettes(other, 1, 10, effective_date=days_ago(1))
+
+    assert len(charges(db, smoker, CIGARETTES)) == 9
+    assert [amount for _, amount in charges(db, other, CIGARETTES)] == [price / 2] * 2
+
+def test_cigarettes_change_does_not_split_stay_periods(db, patients, add_patient):
+    patient_id = add_patient(days_ago(9), daily_cost=100)
+
+    patients.set_cigarettes(patient_id, 1, 20)
+
+    periods = patients.accruals.rates.get_stay_periods(patient_id)
+    assert [(period['start'], period['days'], period['cost'], period['department']) for period in periods] == [
+        (days_ago(9), 10, 1000, 'ديتوكس'),
+    ]
+    assert len(charges(db, patient_id, CIGARETTES)) == 1
+    sweep = patients.accruals.rates.sweep(Period.custom(days_ago(9), date.today()))
+    assert sweep['patients'][patient_id] == {'days': 10, 'cost': 1000}
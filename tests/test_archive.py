@@ -0,0 +1,53 @@
+import os
+import sqlite3
+
+import pytest
+
+from db.archive import archive_path_for
+from db.backup import BackupService
+
+def discharged_patient(db, payments, add_patient, year, amount=100):
+    patient_id = add_patient(f'{year}-01-01', daily_cost=10)
+    payments.add_payment(patient_id, amount, f'{year}-02-01')
+    db.execute("UPDATE patients SET status = 'متخرج', discharged_at = ? WHERE id = ?",
+               (f'{year}-03-01', patient_id))
+    return patient_id
+
+def test_archive_keeps_totals(db, payments, expenses, add_patient):
+    discharged_patient(db, payments, add_patient, 2020)
+    active = add_patient('2024-01-01')
+    payments.add_payment(active, 50, '2024-02-01')
+    expenses.add_expense('كهرباء', 30, '2020-05-01')
+    expenses.add_expense('كهرباء', 20, '2024-05-01')
+
+    assert payments.archive.archive_before(2021) == {'patients': 1, 'expenses': 1}
+    assert payments.archive.get_counts() == {'patients': 1, 'payments': 1, 'expenses': 1}
+    assert db.fetchone('SELECT COUNT(*) FROM main.payments')[0] == 1
+    assert payments.get_total_revenue() == 150
+    assert expenses.get_total_expenses() == 50
+
+def test_backup_restores_archive_with_main(db, tmp_path, payments, add_patient):
+    discharged_patient(db, payments, add_patient, 2023)
+    discharged_patient(db, payments, add_patient, 2024)
+    payments.archive.archive_before(2024)
+    service = BackupService(db, str(tmp_path / 'backups'))
+    backup = service.create_backup('manual', keep=None)
+    assert os.path.exists(archive_path_for(backup))
+    assert service.list_backups() == [os.path.basename(backup)]
+
+    payments.archive.archive_before(2025)
+    service.restore(backup)
+    db.settings.reload()
+    assert payments.get_total_revenue() == 200
+    assert payments.archive.get_counts()['patients'] == 1
+
+def test_restore_without_archive_refuses_overlap(db, tmp_path, payments, add_patient):
+    discharged_patient(db, payments, add_patient, 2023)
+    service = BackupService(db, str(tmp_path / 'backups'))
+    backup = service.create_backup('manual', keep=None)
+    os.remove(archive_path_for(backup))
+    payments.archive.archive_before(2024)
+
+    with pytest.raises(sqlite3.DatabaseError):
+        service.restore(backup)
+    assert payments.get_total_revenue() == 100
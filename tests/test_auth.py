@@ -0,0 +1,34 @@
+from modules.auth import AuthManager
+
+def admin_password(db):
+    return db.fetchone("SELECT password FROM users WHERE username = 'admin'")[0]
+
+def test_default_admin_is_hashed_once(db):
+    auth = AuthManager(db)
+    auth.initialize_default_users()
+    stored = admin_password(db)
+
+    assert auth.is_hashed(stored)
+    assert auth.authenticate('admin', '1231')['role'] == 'admin'
+    assert auth.authenticate('admin', 'admin123') is None
+    assert auth.authenticate('user', '1')['role'] == 'accountant'
+
+    auth.initialize_default_users()
+    assert admin_password(db) == stored
+
+def test_plaintext_admin_is_rehashed(db):
+    auth = AuthManager(db)
+    db.execute("INSERT INTO users (username, password, full_name, role) VALUES ('admin', 'admin123', '', 'admin')")
+
+    auth.initialize_default_users()
+    assert auth.is_hashed(admin_password(db))
+    assert auth.authenticate('admin', '1231') is not None
+
+def test_changed_admin_password_is_kept(db):
+    auth = AuthManager(db)
+    auth.initialize_default_users()
+    auth.update_password('admin', 'new-password')
+
+    auth.initialize_default_users()
+    assert auth.authenticate('admin', 'new-password') is not None
+    assert auth.authenticate('admin', '1231') is None
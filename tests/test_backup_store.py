@@ -0,0 +1,43 @@
+import os
+import sqlite3
+
+from db.backup_store import BackupStore
+
+def test_snapshot_restore_round_trip(db, tmp_path, payments, add_patient):
+    patient_id = add_patient('2024-01-01')
+    payments.add_payment(patient_id, 250, '2024-01-05')
+    db.checkpoint()
+    store = BackupStore(str(tmp_path / 'store'))
+    progress = []
+
+    snapshot_id, written = store.snapshot(db.db_path, 'test', lambda done, total: progress.append((done, total)))
+    assert written
+    assert progress[-1] == (100, 100)
+    assert progress == sorted(progress)
+    # لا تغيير: نفس النسخة بدون كتابة قطع
+    assert store.snapshot(db.db_path) == (snapshot_id, 0)
+
+    restored = str(tmp_path / 'restored.db')
+    store.restore(snapshot_id, restored)
+    conn = sqlite3.connect(restored)
+    try:
+        assert conn.execute('SELECT patient_id, amount FROM payments').fetchall() == [(patient_id, 250)]
+        assert conn.execute('SELECT COUNT(*) FROM charges').fetchone()[0] == \
+            db.fetchone('SELECT COUNT(*) FROM charges')[0]
+    finally:
+        conn.close()
+
+def test_snapshot_writes_only_changed_chunks(db, tmp_path, payments, add_patient):
+    for _ in range(50):
+        add_patient('2024-01-01')
+    db.checkpoint()
+    store = BackupStore(str(tmp_path / 'store'))
+    first_id, first_written = store.snapshot(db.db_path)
+
+    payments.add_payment(1, 10, '2024-02-01')
+    db.checkpoint()
+    second_id, second_written = store.snapshot(db.db_path)
+
+    assert second_id != first_id
+    assert 0 < second_written < first_written
+    assert store.load_manifest(second_id)['size'] == os.path.getsize(db.db_path)
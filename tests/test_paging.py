@@ -0,0 +1,41 @@
+import pytest
+
+from db.paging import keyset_page
+
+KEYS = [None, 3, None, 1, 3, 2, None, 1, 3, 3, None, 2]
+
+@pytest.fixture
+def items(db):
+    db.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, key INTEGER)')
+    db.executemany('INSERT INTO items (id, key) VALUES (?, ?)', enumerate(KEYS, 1))
+    return db
+
+def read_all(db, descending, limit):
+    ids = []
+    after = None
+    while True:
+        page = keyset_page(db, 'id', 'items', 'key', descending, after=after, limit=limit)
+        ids.extend(row[0] for row in page.rows)
+        after = page.cursor
+        if not page.has_more:
+            return ids
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('limit', [1, 2, 3, 5, 20])
+def test_pages_match_full_order(items, descending, limit):
+    # NULL أولاً تصاعدياً وأخيراً تنازلياً كما في ORDER BY في SQLite، والتعادل يُحسم بـ id
+    direction = 'DESC' if descending else 'ASC'
+    expected = [row[0] for row in items.fetchall(f'SELECT id FROM items ORDER BY key {direction}, id {direction}')]
+    assert read_all(items, descending, limit) == expected
+
+def test_page_after_null_cursor(items):
+    page = keyset_page(items, 'id', 'items', 'key', after=(None, 3), limit=2)
+    assert [row[0] for row in page.rows] == [7, 11]
+    assert page.cursor == (None, 11)
+    assert page.has_more
+
+def test_conditions_apply_with_cursor(items):
+    page = keyset_page(items, 'id', 'items', 'key', conditions=['key = ?'], params=[3],
+                       after=(3, 5), limit=10)
+    assert [row[0] for row in page.rows] == [9, 10]
+    assert not page.has_more
@@ -0,0 +1,24 @@
+from datetime import date
+
+import pytest
+
+@pytest.mark.parametrize('raw', [0, -5, '', 'abc', None])
+def test_invalid_cigarettes_per_box_falls_back(db, raw):
+    db.settings.set('cigarettes_per_box', raw)
+
+    assert db.settings.get('cigarettes_per_box') == 20
+    db.settings.reload()
+    assert db.settings.get('cigarettes_per_box') == 20
+
+def test_cigarettes_per_box_is_read_as_int(db):
+    db.settings.set('cigarettes_per_box', '10')
+
+    assert db.settings.get('cigarettes_per_box') == 10
+
+def test_cigarette_cost_with_zero_box_size(db, patients, add_patient):
+    db.settings.set('cigarettes_per_box', 0)
+    prices = patients.accruals.prices
+
+    patient_id = add_patient(date.today(), cigarettes_count=20)
+    assert prices.cost_for_interval(date.today(), date.today(), 20) == prices.price_on()
+    assert patients.get_balances([patient_id])[patient_id]['cigarettes_cost'] == prices.price_on()
@@ -0,0 +1,65 @@
+from PyQt6.QtCore import QObject, QTimer, QItemSelectionModel, QAbstractProxyModel, pyqtSignal
+
+# أكثر من هذا العدد من الصفوف المتغيرة: إعادة تحميل الجدول أرخص من ترقيعه
+PATCH_LIMIT = 50
+
+class ChangeNotifier(QObject):
+    # يجمع أحداث ChangeBus القادمة من أي خيط ويرسلها للواجهة دفعة واحدة في
+    # الدورة التالية للـ event loop، فعملية تنشر عشرات الأحداث تسبب تحديثاً واحداً
+    changed = pyqtSignal(list)
+    _received = pyqtSignal(object)
+    
+    def __init__(self, changes, parent=None):
+        super().__init__(parent)
+        self._pending = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(0)
+        self._flush_timer.timeout.connect(self.flush)
+        self._received.connect(self._queue)
+        
+        listener = self._received.emit
+        changes.subscribe(listener)
+        self.destroyed.connect(lambda: changes.unsubscribe(listener))
+    
+    def _queue(self, change):
+        if change not in self._pending:
+            self._pending.append(change)
+        self._flush_timer.start()
+    
+    def flush(self):
+        changes, self._pending = self._pending, []
+        if changes:
+            self.changed.emit(changes)
+
+def changed_rows(changes, *tables):
+    # أرقام الصفوف المتأثرة في الجداول المطلوبة، أو None إذا تغير أحدها بالكامل.
+    # الشاشة تعيد قراءة هذه الصفوف فقط: الصف غير الموجود يعني أنه حُذف
+    rows = set()
+    for change in changes:
+        if change.table not in tables:
+            continue
+        if change.row_id is None:
+            return None
+        rows.add(change.row_id)
+    if len(rows) > PATCH_LIMIT:
+        return None
+    return rows
+
+def select_row(view, row_id):
+    # تحديد صف السجل في جدول SqlTableModel (مباشرة أو عبر proxy) وإظهاره؛ False إذا لم
+    # يكن محملاً أو معروضاً (فلتر أو بحث في الشاشة)
+    model = view.model()
+    source = model.sourceModel() if isinstance(model, QAbstractProxyModel) else model
+    row = source.row_of(row_id)
+    if row is None:
+        return False
+    index = source.index(row, 0)
+    if model is not source:
+        index = model.mapFromSource(index)
+        if not index.isValid():
+            return False
+    view.selectionModel().setCurrentIndex(index, QItemSelectionModel.SelectionFlag.ClearAndSelect
+                                          | QItemSelectionModel.SelectionFlag.Rows)
+    view.scrollTo(index)
+    return True
@@ -1,18 +1,29 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                              QLabel, QTableWidget, QTableWidgetItem, QHeaderView,
                              QLineEdit, QMessageBox, QDialog, QDialogButtonBox,
-                             QSpinBox, QCheckBox, QFrame)
+                             QSpinBox, QCheckBox, QFrame, QFileDialog)
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QFont
 from datetime import datetime
 import os
 import webbrowser
 import tempfile
+from modules.accruals import CIGARETTES
+from ui.db_worker import DatabaseWorker
+from ui.settings_notifier import SettingsNotifier
+from ui.change_notifier import ChangeNotifier, changed_rows
 
 class CigarettesWidget(QWidget):
-    def __init__(self, db, patient_mgr, current_user=None):  # --- NEW (إضافة المستخدم الحالي) ---
+    def __init__(self, db, patient_mgr, current_user=None, worker=None, settings_notifier=None,
+                 change_notifier=None):  # --- NEW (إضافة المستخدم الحالي) ---
         super().__init__()
         self.db = db
+        self.worker = worker or DatabaseWorker(self)
+        self.settings_notifier = settings_notifier or SettingsNotifier(db.settings, self)
+        self.settings_notifier.changed.connect(self.on_setting_changed)
+        self.change_notifier = change_notifier or ChangeNotifier(db.changes, self)
+        self.change_notifier.changed.connect(self.on_changes)
+        self.stale = False
         self.patient_mgr = patient_mgr
         self.current_user = current_user  # --- NEW (تخزين المستخدم الحالي) ---
         self.setup_ui()
@@ -29,9 +40,9 @@ class CigarettesWidget(QWidget):
         price_frame.setFrameStyle(QFrame.Shape.StyledPanel)
         price_layout = QHBoxLayout()
         
-        price_label = QLabel('سعر علبة السجائر (20 سيجارة):')
-        price_label.setFont(QFont('Arial', 12))
-        price_layout.addWidget(price_label)
+        self.price_label = QLabel(self.price_label_text())
+        self.price_label.setFont(QFont('Arial', 12))
+        price_layout.addWidget(self.price_label)
         
         self.price_input = QLineEdit()
         self.price_input.setFixedWidth(150)
@@ -47,6 +58,10 @@ class CigarettesWidget(QWidget):
         save_price_btn.clicked.connect(self.save_price)
         price_layout.addWidget(save_price_btn)
         
+        import_log_btn = QPushButton('📥 استيراد سجل الأسعار')
+        import_log_btn.clicked.connect(self.import_price_log)
+        price_layout.addWidget(import_log_btn)
+        
         price_layout.addStretch()
         price_frame.setLayout(price_layout)
         layout.addWidget(price_frame)
@@ -55,19 +70,16 @@ class CigarettesWidget(QWidget):
         stats_frame.setFrameStyle(QFrame.Shape.StyledPanel)
         stats_layout = QHBoxLayout()
         
-        total_cigarettes = self.patient_mgr.get_total_cigarettes()
-        total_packs = total_cigarettes / 20
-        daily_cost = total_packs * current_price
-        
-        self.stat1_label = QLabel(f'إجمالي السجائر اليومية: {total_cigarettes} سيجارة')
+        # الإحصائيات تُملأ مع الجدول من خيط قاعدة البيانات (populate_cigarettes_data)
+        self.stat1_label = QLabel('إجمالي السجائر اليومية: ...')
         self.stat1_label.setFont(QFont('Arial', 12, QFont.Weight.Bold))
         stats_layout.addWidget(self.stat1_label)
         
-        self.stat2_label = QLabel(f'عدد العلب المطلوبة: {total_packs:.1f} علبة')
+        self.stat2_label = QLabel('عدد العلب المطلوبة: ...')
         self.stat2_label.setFont(QFont('Arial', 12, QFont.Weight.Bold))
         stats_layout.addWidget(self.stat2_label)
         
-        self.stat3_label = QLabel(f'التكلفة اليومية: {daily_cost:.2f} جنيه')
+        self.stat3_label = QLabel('التكلفة اليومية: ...')
         self.stat3_label.setFont(QFont('Arial', 12, QFont.Weight.Bold))
         stats_layout.addWidget(self.stat3_label)
         
@@ -102,9 +114,22 @@ class CigarettesWidget(QWidget):
         self.load_cigarettes_data()
     
     def get_cigarette_price(self):
-        query = "SELECT setting_value FROM settings WHERE setting_key = 'cigarette_pack_price'"
-        result = self.db.fetchone(query)
-        return float(result[0]) if result else 40.0
+        return self.db.settings.get('cigarette_pack_price')
+    
+    def get_cigarettes_per_box(self):
+        return self.db.settings.get('cigarettes_per_box')
+    
+    def price_label_text(self):
+        return f'سعر علبة السجائر ({self.get_cigarettes_per_box()} سيجارة):'
+    
+    def on_setting_changed(self, key, value):
+        # تغيير السعر أو حجم العلبة من أي مكان يحدّث الشاشة
+        if key not in ('cigarette_pack_price', 'cigarettes_per_box'):
+            return
+        self.price_label.setText(self.price_label_text())
+        if not self.price_input.hasFocus():
+            self.price_input.setText(str(self.get_cigarette_price()))
+        self.load_cigarettes_data()
     
     def save_price(self):
         try:
@@ -127,8 +152,9 @@ class CigarettesWidget(QWidget):
             total_daily_cigarettes = result[1] if result and result[1] else 0
             
             # Calculate daily financial difference
-            old_daily_cost = (total_daily_cigarettes / 20) * old_price
-            new_daily_cost = (total_daily_cigarettes / 20) * new_price
+            cigarettes_per_box = self.get_cigarettes_per_box()
+            old_daily_cost = (total_daily_cigarettes / cigarettes_per_box) * old_price
+            new_daily_cost = (total_daily_cigarettes / cigarettes_per_box) * new_price
             daily_difference = new_daily_cost - old_daily_cost
             
             # Show confirmation dialog
@@ -144,7 +170,7 @@ class CigarettesWidget(QWidget):
             <p><b>إجمالي السجائر اليومية:</b> {total_daily_cigarettes} سيجارة</p>
             <p><b>الفرق في التكلفة اليومية:</b> {daily_difference:+.2f} جنيه</p>
             <br>
-            <p>⚠️ سيؤثر هذا التغيير على حساب تكلفة السجائر في كشوف حساب جميع المرضى الحاليين والمستقبليين.</p>
+            <p>⚠️ يسري السعر الجديد اعتباراً من اليوم، وتبقى تكلفة الأيام السابقة محسوبة بالسعر القديم.</p>
             <p>هل أنت متأكد من التغيير؟</p>
             </div>
             '''
@@ -161,28 +187,40 @@ class CigarettesWidget(QWidget):
             if msg_box.exec() == QMessageBox.StandardButton.Yes:
                 # --- FIX (تحديث السعر داخل transaction آمنة وتسجيل في audit_log) ---
                 try:
-                    # Begin transaction
-                    # Update the price
-                    query = '''
-                        UPDATE settings 
-                        SET setting_value = ?, updated_at = ?
-                        WHERE setting_key = 'cigarette_pack_price'
-                    '''
-                    self.db.execute(query, (str(new_price), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-                    
-                    # Log the price change to audit_log
-                    self.log_price_change(old_price, new_price, affected_count, daily_difference)
+                    with self.db.transaction():
+                        # السعر الجديد يسري من اليوم؛ الأيام السابقة تبقى بسعرها
+                        effective_date = self.patient_mgr.accruals.prices.set_price(new_price)
+                        
+                        # Log the price change to audit_log
+                        self.log_price_change(old_price, new_price, affected_count, daily_difference)
+                        
+                        self.patient_mgr.accruals.recalculate(charge_type=CIGARETTES, since=effective_date)
                     
-                    self.db.conn.commit()
                     QMessageBox.information(self, 'نجح', 'تم حفظ السعر بنجاح وتسجيل التغيير')
-                    self.load_cigarettes_data()
                 except Exception as e:
-                    self.db.conn.rollback()
                     QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء حفظ السعر:\n{str(e)}')
             
         except ValueError:
             QMessageBox.warning(self, 'خطأ', 'الرجاء إدخال سعر صحيح')
     
+    def import_price_log(self):
+        # استيراد تغييرات الأسعار القديمة من cigarette_price_log.txt إلى سجل الأسعار
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, 'اختر ملف سجل الأسعار', 'cigarette_price_log.txt', 'Text Files (*.txt)'
+        )
+        if not file_path:
+            return
+        
+        try:
+            with self.db.transaction():
+                count, earliest = self.patient_mgr.accruals.prices.import_log_file(file_path)
+                if earliest:
+                    self.patient_mgr.accruals.recalculate(charge_type=CIGARETTES, since=earliest)
+            
+            QMessageBox.information(self, 'نجح', f'تم استيراد {count} تغيير في السعر')
+        except Exception as e:
+            QMessageBox.critical(self, 'خطأ', f'فشل استيراد سجل الأسعار:\n{str(e)}')
+    
     def log_price_change(self, old_price, new_price, affected_patients, daily_difference):
         # --- FIX (تسجيل تغيير السعر في audit_log بدلاً من ملف نصي) ---
         try:
@@ -211,21 +249,44 @@ class CigarettesWidget(QWidget):
         except Exception as e:
             print(f'فشل تسجيل تغيير السعر في audit_log: {str(e)}')
     
+    def on_changes(self, changes):
+        # الإجماليات تعتمد على كل المرضى النشطين، فالصفحة تُحمّل كاملة لكن
+        # فقط وهي ظاهرة؛ وإلا عند العودة إليها
+        if changed_rows(changes, 'patients') == set():
+            return
+        if self.isVisible():
+            self.load_cigarettes_data()
+        else:
+            self.stale = True
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.stale:
+            self.load_cigarettes_data()
+    
     def load_cigarettes_data(self):
+        self.stale = False
         query = '''
             SELECT id, name, department, cigarettes_count, receives_cigarettes 
             FROM patients 
             WHERE status = 'نشط'
             ORDER BY receives_cigarettes DESC, name
         '''
-        patients = self.db.fetchall(query)
-        
+        self.worker.submit(self.fetch_cigarettes_data, query, on_result=self.populate_cigarettes_data, key='cigarettes')
+    
+    def fetch_cigarettes_data(self, query):
+        # يعمل في خيط قاعدة البيانات
+        return self.db.fetchall(query), self.patient_mgr.get_total_cigarettes()
+    
+    def populate_cigarettes_data(self, result):
+        patients, total_cigarettes = result
         cigarette_price = self.get_cigarette_price()
+        cigarettes_per_box = self.get_cigarettes_per_box()
         
         self.table.setRowCount(len(patients))
         for row, patient in enumerate(patients):
             patient_id, name, department, cigarettes_count, receives_cigarettes = patient
-            packs = cigarettes_count / 20
+            packs = cigarettes_count / cigarettes_per_box
             daily_cost = packs * cigarette_price
             
             self.table.setItem(row, 0, QTableWidgetItem(str(patient_id)))
@@ -245,8 +306,7 @@ class CigarettesWidget(QWidget):
             action_btn.clicked.connect(lambda checked, pid=patient_id, enabled=receives_cigarettes: self.toggle_cigarettes(pid, enabled))
             self.table.setCellWidget(row, 6, action_btn)
         
-        total_cigarettes = self.patient_mgr.get_total_cigarettes()
-        total_packs = total_cigarettes / 20
+        total_packs = total_cigarettes / cigarettes_per_box
         daily_cost = total_packs * cigarette_price
         
         self.stat1_label.setText(f'إجمالي السجائر اليومية: {total_cigarettes} سيجارة')
@@ -262,14 +322,8 @@ class CigarettesWidget(QWidget):
             )
             
             if reply == QMessageBox.StandardButton.Yes:
-                query = '''
-                    UPDATE patients 
-                    SET receives_cigarettes = 0, cigarettes_count = 0
-                    WHERE id = ?
-                '''
-                self.db.execute(query, (patient_id,))
+                self.patient_mgr.set_cigarettes(patient_id, 0, 0)
                 QMessageBox.information(self, 'نجح', 'تم تعطيل السجائر بنجاح')
-                self.load_cigarettes_data()
         else:
             dialog = QDialog(self)
             dialog.setWindowTitle('تفعيل السجائر')
@@ -299,18 +353,13 @@ class CigarettesWidget(QWidget):
             
             if dialog.exec() == QDialog.DialogCode.Accepted:
                 cigarettes_count = count_input.value()
-                query = '''
-                    UPDATE patients 
-                    SET receives_cigarettes = 1, cigarettes_count = ?
-                    WHERE id = ?
-                '''
-                self.db.execute(query, (cigarettes_count, patient_id))
+                self.patient_mgr.set_cigarettes(patient_id, 1, cigarettes_count)
                 QMessageBox.information(self, 'نجح', f'تم تفعيل السجائر بنجاح ({cigarettes_count} سيجارة يومياً)')
-                self.load_cigarettes_data()
     
     def print_daily_report(self):
         try:
             cigarette_price = self.get_cigarette_price()
+            cigarettes_per_box = self.get_cigarettes_per_box()
             
             query = '''
                 SELECT id, name, department, cigarettes_count 
@@ -326,7 +375,7 @@ class CigarettesWidget(QWidget):
             patients_table_rows = ''
             for patient in patients:
                 patient_id, name, department, cigarettes_count = patient
-                packs = cigarettes_count / 20
+                packs = cigarettes_count / cigarettes_per_box
                 daily_cost = packs * cigarette_price
                 
                 total_cigarettes += cigarettes_count
@@ -343,7 +392,7 @@ class CigarettesWidget(QWidget):
                 </tr>
                 '''
             
-            total_packs = total_cigarettes / 20
+            total_packs = total_cigarettes / cigarettes_per_box
             
             html_content = f'''<!DOCTYPE html>
 <html dir="rtl" lang="ar">
@@ -510,7 +559,7 @@ class CigarettesWidget(QWidget):
         
         <div class="info-section">
             <p>📅 التاريخ: {datetime.now().strftime('%Y-%m-%d')}</p>
-            <p>💰 سعر علبة السجائر (20 سيجارة): {cigarette_price:.2f} جنيه</p>
+            <p>💰 سعر علبة السجائر ({cigarettes_per_box} سيجارة): {cigarette_price:.2f} جنيه</p>
         </div>
         
         <div class="stats-grid">
@@ -3,9 +3,9 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QFont
 from datetime import datetime
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
+from ui.db_worker import DatabaseWorker
+from ui.change_notifier import ChangeNotifier
+from modules.dashboard_stats import DashboardStats, STAT_TABLES
 
 class StatCard(QFrame):
     def __init__(self, title, value, icon=''):
@@ -36,14 +36,24 @@ class StatCard(QFrame):
         self.value_label.setText(str(value))
 
 class DashboardWidget(QWidget):
-    def __init__(self, db, patient_mgr, payment_mgr, expense_mgr, employee_mgr):
+    def __init__(self, db, patient_mgr, payment_mgr, expense_mgr, employee_mgr, worker=None,
+                 change_notifier=None):
         super().__init__()
         self.db = db
+        self.worker = worker or DatabaseWorker(self)
+        self.change_notifier = change_notifier or ChangeNotifier(db.changes, self)
+        self.change_notifier.changed.connect(self.on_changes)
+        self.stats = {'active': 0, 'graduated': 0, 'revenue': 0, 'expenses': 0, 'employees': 0, 'cigarettes': 0}
         self.patient_mgr = patient_mgr
         self.payment_mgr = payment_mgr
         self.expense_mgr = expense_mgr
         self.employee_mgr = employee_mgr
+        self.dashboard_stats = DashboardStats(db, patient_mgr, payment_mgr, expense_mgr, employee_mgr)
         self.setup_ui()
+        # آخر نسخة محفوظة تُعرض فوراً (قراءة صف لكل مؤشر)، والتحقق منها مقابل change_log
+        # في خيط قاعدة البيانات عند أول ظهور (showEvent)
+        self.show_stats(self.dashboard_stats.snapshot()[0])
+        self.stale = True
     
     def setup_ui(self):
         layout = QVBoxLayout()
@@ -87,16 +97,38 @@ class DashboardWidget(QWidget):
         layout.addStretch()
         
         self.setLayout(layout)
-        self.refresh_data()
     
     def refresh_data(self):
-        active = self.patient_mgr.get_active_count()
-        graduated = self.patient_mgr.get_graduated_count()
-        revenue = self.payment_mgr.get_total_revenue()
-        expenses = self.expense_mgr.get_total_expenses()
+        self.stale = False
+        self.worker.submit(self.dashboard_stats.revalidate, list(STAT_TABLES),
+                           on_result=self.show_stats, key='dashboard')
+    
+    def on_changes(self, changes):
+        tables = {change.table for change in changes}
+        if any(tables.intersection(sources) for sources in STAT_TABLES.values()):
+            self.stale = True
+            if self.isVisible():
+                self.refresh_stale_stats()
+    
+    def showEvent(self, event):
+        # المؤشرات التي تغيرت أثناء عرض صفحة أخرى تُحسب عند العودة فقط
+        super().showEvent(event)
+        self.refresh_stale_stats()
+    
+    def refresh_stale_stats(self):
+        # المؤشرات التي تغيرت جداولها منذ آخر نسخة تُحسب من change_log وليس من الأحداث،
+        # فالأحداث المتتالية أثناء الحساب تكفيها إعادة تحقق واحدة
+        if not self.stale:
+            return
+        self.stale = False
+        self.worker.submit(self.dashboard_stats.revalidate, on_result=self.show_stats, key='dashboard')
+    
+    def show_stats(self, stats):
+        self.stats.update(stats)
+        active, graduated, revenue, expenses, employees, cigarettes = (
+            self.stats[name] for name in ('active', 'graduated', 'revenue', 'expenses', 'employees', 'cigarettes')
+        )
         profit = revenue - expenses
-        employees = self.employee_mgr.get_active_count()
-        cigarettes = self.patient_mgr.get_total_cigarettes()
         
         self.active_patients_card.update_value(str(active))
         self.graduated_card.update_value(str(graduated))
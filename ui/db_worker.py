@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from PyQt6.QtCore import QObject, pyqtSignal
+
+class _TaskSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+class DatabaseWorker(QObject):
+    # ينفذ استعلامات المديرين في خيوط منفصلة حتى لا تتجمد الواجهة، ويعيد النتيجة
+    # إلى خيط الواجهة عبر signals. خيوط بايثون عادية (وليس QThreadPool) حتى يحتفظ
+    # كل خيط باتصال SQLite الخاص به في Database بين المهام.
+    # progress: (اسم المهمة، المنجز، الإجمالي) من داخل خيط العامل
+    progress = pyqtSignal(str, int, int)
+    
+    def __init__(self, parent=None, max_threads=2):
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='db-worker')
+        self._pending = {}
+        self._generations = {}
+
+    def submit(self, func, *args, on_result=None, on_error=None, key=None, **kwargs):
+        # key: طلب أحدث بنفس المفتاح يلغي نتيجة الطلب الأقدم (مثل إعادة تحميل جدول)
+        generation = None
+        if key is not None:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+
+        def is_current():
+            return key is None or self._generations.get(key) == generation
+
+        signals = _TaskSignals()
+
+        def finished(result):
+            self._pending.pop(future, None)
+            if on_result and is_current():
+                on_result(result)
+
+        def failed(error):
+            self._pending.pop(future, None)
+            if not is_current():
+                return
+            if on_error:
+                on_error(error)
+            else:
+                print(f'خطأ في تنفيذ استعلام في الخلفية: {str(error)}')
+
+        def done(completed):
+            # يعمل في خيط العامل؛ signals تنقل النتيجة إلى خيط الواجهة
+            error = completed.exception()
+            if error is not None:
+                signals.failed.emit(error)
+            else:
+                signals.finished.emit(completed.result())
+
+        signals.finished.connect(finished)
+        signals.failed.connect(failed)
+        future = self.executor.submit(func, *args, **kwargs)
+        self._pending[future] = signals
+        future.add_done_callback(done)
+        return future
+
+    def progress_callback(self, label):
+        # دالة تُمرر للمهمة لتبلغ عن تقدمها؛ الإشارة آمنة من أي خيط
+        return lambda done, total: self.progress.emit(label, done, total)
+
+    def wait(self, timeout=None):
+        # انتظار المهام الجارية (عند الإغلاق أو قبل استبدال قاعدة البيانات)
+        wait(list(self._pending), timeout=timeout)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
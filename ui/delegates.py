@@ -0,0 +1,59 @@
+from PyQt6.QtWidgets import QStyledItemDelegate, QStyle, QStyleOptionButton, QApplication
+from PyQt6.QtCore import Qt, QEvent, QRect, pyqtSignal
+
+BUTTON_MARGIN = 2
+
+class ButtonsDelegate(QStyledItemDelegate):
+    # يرسم أزرار الخلية بالـ style بدلاً من QPushButton حقيقي في كل صف، فالصفوف غير
+    # الظاهرة لا تكلف شيئاً. buttons(index) تعيد [(action, text), ...] لكل صف،
+    # والنقر يصل عبر clicked(action, قيمة UserRole للصف). placeholder يُرسم بدلاً من
+    # الأزرار حين لا يُسمح للمستخدم بأي إجراء (مثل 🔒 لغير المدير)
+    clicked = pyqtSignal(str, object)
+
+    def __init__(self, buttons, parent=None, placeholder=''):
+        super().__init__(parent)
+        self.buttons = buttons
+        self.placeholder = placeholder
+
+    def _button_rects(self, option, count):
+        # أول زر في بداية الخلية حسب اتجاه الجدول (يمين في الواجهة العربية)
+        rect = option.rect
+        width = (rect.width() - BUTTON_MARGIN) // max(count, 1)
+        return [
+            QStyle.visualRect(option.direction, rect, QRect(
+                rect.left() + BUTTON_MARGIN + i * width, rect.top() + BUTTON_MARGIN,
+                width - BUTTON_MARGIN, rect.height() - 2 * BUTTON_MARGIN))
+            for i in range(count)
+        ]
+
+    def paint(self, painter, option, index):
+        style = option.widget.style() if option.widget else QApplication.style()
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+        buttons = self.buttons(index)
+        if not buttons:
+            painter.drawText(option.rect, Qt.AlignmentFlag.AlignCenter, self.placeholder)
+            return
+        for (_, text), rect in zip(buttons, self._button_rects(option, len(buttons))):
+            button = QStyleOptionButton()
+            button.rect = rect
+            button.text = text
+            button.state = QStyle.StateFlag.State_Enabled | QStyle.StateFlag.State_Raised
+            style.drawControl(QStyle.ControlElement.CE_PushButton, button, painter, option.widget)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() != QEvent.Type.MouseButtonRelease or event.button() != Qt.MouseButton.LeftButton:
+            return False
+        buttons = self.buttons(index)
+        position = event.position().toPoint()
+        for (action, _), rect in zip(buttons, self._button_rects(option, len(buttons))):
+            if rect.contains(position):
+                self.clicked.emit(action, index.data(Qt.ItemDataRole.UserRole))
+                return True
+        return False
+
+def admin_buttons(current_user):
+    # تعديل وحذف للمدير فقط؛ غيره يرى placeholder الـ delegate (🔒)
+    if current_user and current_user.get('role') == 'admin':
+        return lambda index: [('edit', '✏️'), ('delete', '🗑️')]
+    return lambda index: []
@@ -1,9 +1,14 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QPushButton, QTableWidget, QTableWidgetItem, QDialog,
+                             QPushButton, QTableView, QDialog,
                              QLineEdit, QDateEdit, QMessageBox, QHeaderView, QComboBox,
                              QTextEdit, QFileDialog)
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QFont
+from ui.db_worker import DatabaseWorker
+from ui.change_notifier import ChangeNotifier, changed_rows
+from ui.paging import count_text
+from ui.table_model import SqlTableModel, Column, amount_text, sortable_view
+from ui.delegates import ButtonsDelegate, admin_buttons
 from datetime import datetime
 import os
 import webbrowser
@@ -130,14 +135,31 @@ class AddTransactionDialog(QDialog):
         }
 
 class EmployeeDetailsDialog(QDialog):
-    def __init__(self, employee, transactions, balance, parent=None):
+    def __init__(self, employee, balance, employee_mgr, worker=None, parent=None):
         super().__init__(parent)
         self.setWindowTitle(f'تفاصيل الموظف - {employee[1]}')
         self.setMinimumSize(700, 500)
         self.employee = employee
-        self.transactions = transactions
         self.balance = balance
+        self.employee_mgr = employee_mgr
+        self.worker = worker or DatabaseWorker(self)
+        # معاملات الموظف صفحة صفحة مثل باقي الجداول
+        self.trans_model = SqlTableModel(
+            [
+                Column('الرقم', 0, sort='id'),
+                Column('النوع', 2, sort='type'),
+                Column('المبلغ', 3, amount_text(3), 'amount'),
+                Column('التاريخ', 4, sort='date'),
+                Column('ملاحظات', 5),
+            ],
+            self.worker,
+            lambda sort, descending, after: self.employee_mgr.get_transactions_page(
+                employee[0], after=after, sort=sort, descending=descending),
+            lambda: self.employee_mgr.count_transactions(employee[0]),
+            sort='date', parent=self
+        )
         self.setup_ui()
+        self.trans_model.reload()
     
     def setup_ui(self):
         layout = QVBoxLayout()
@@ -171,21 +193,12 @@ class EmployeeDetailsDialog(QDialog):
         trans_label.setFont(QFont('Arial', 14, QFont.Weight.Bold))
         layout.addWidget(trans_label, alignment=Qt.AlignmentFlag.AlignRight)
         
-        self.trans_table = QTableWidget()
-        self.trans_table.setColumnCount(5)
-        self.trans_table.setHorizontalHeaderLabels([
-            'الرقم', 'النوع', 'المبلغ', 'التاريخ', 'ملاحظات'
-        ])
+        self.trans_table = QTableView()
+        self.trans_table.setModel(self.trans_model)
+        self.trans_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
         self.trans_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.trans_table.setLayoutDirection(Qt.LayoutDirection.RightToLeft)
-        self.trans_table.setRowCount(len(self.transactions))
-        
-        for row, trans in enumerate(self.transactions):
-            self.trans_table.setItem(row, 0, QTableWidgetItem(str(trans[0])))
-            self.trans_table.setItem(row, 1, QTableWidgetItem(trans[2]))
-            self.trans_table.setItem(row, 2, QTableWidgetItem(f'{trans[3]:.2f}'))
-            self.trans_table.setItem(row, 3, QTableWidgetItem(trans[4]))
-            self.trans_table.setItem(row, 4, QTableWidgetItem(trans[5] if trans[5] else ''))
+        sortable_view(self.trans_table, self.trans_model)
         
         layout.addWidget(self.trans_table)
         
@@ -205,7 +218,7 @@ class EmployeeDetailsDialog(QDialog):
     def print_statement(self):
         try:
             transactions_rows = ''
-            for trans in self.transactions:
+            for trans in self.employee_mgr.iter_transactions(self.employee[0]):
                 notes = trans[5] if trans[5] else '-'
                 transactions_rows += f'''
                 <tr>
@@ -463,11 +476,34 @@ class EmployeeDetailsDialog(QDialog):
             QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء إنشاء الكشف:\n{str(e)}')
 
 class EmployeesWidget(QWidget):
-    def __init__(self, db, employee_mgr, current_user=None):  # --- NEW FEATURE: User Permissions ---
+    def __init__(self, db, employee_mgr, current_user=None, worker=None,
+                 change_notifier=None):  # --- NEW FEATURE: User Permissions ---
         super().__init__()
         self.db = db
+        self.worker = worker or DatabaseWorker(self)
+        self.change_notifier = change_notifier or ChangeNotifier(db.changes, self)
+        self.change_notifier.changed.connect(self.on_changes)
         self.employee_mgr = employee_mgr
         self.current_user = current_user  # --- NEW FEATURE: User Permissions ---
+        self.model = SqlTableModel(
+            [
+                Column('الرقم', 0, sort='id'),
+                Column('الاسم', 1, sort='name'),
+                Column('المنصب', 2, sort='position'),
+                Column('الهاتف', 3),
+                Column('تاريخ التوظيف', 4, sort='hire_date'),
+                Column('الراتب', 5, amount_text(5), 'salary'),
+                Column('التفاصيل'),
+                Column('إجراءات'),
+            ],
+            self.worker,
+            lambda sort, descending, after: self.employee_mgr.get_employees_page(
+                after=after, sort=sort, descending=descending),
+            self.employee_mgr.count_employees,
+            self.employee_mgr.get_employees,
+            sort='id', parent=self
+        )
+        self.model.loaded.connect(self.update_count)
         self.setup_ui()
     
     def setup_ui(self):
@@ -493,15 +529,22 @@ class EmployeesWidget(QWidget):
         btn_layout.addWidget(refresh_btn)
         
         btn_layout.addStretch()
+        self.count_label = QLabel('')
+        btn_layout.addWidget(self.count_label)
         layout.addLayout(btn_layout)
         
-        self.table = QTableWidget()
-        self.table.setColumnCount(8)
-        self.table.setHorizontalHeaderLabels([
-            'الرقم', 'الاسم', 'المنصب', 'الهاتف', 'تاريخ التوظيف', 'الراتب', 'التفاصيل', 'إجراءات'
-        ])
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.table.setLayoutDirection(Qt.LayoutDirection.RightToLeft)
+        sortable_view(self.table, self.model)
+        self.details_delegate = ButtonsDelegate(lambda index: [('details', '📊')], self)
+        self.actions_delegate = ButtonsDelegate(admin_buttons(self.current_user), self, placeholder='🔒')
+        for delegate in (self.details_delegate, self.actions_delegate):
+            delegate.clicked.connect(self.on_button_clicked, Qt.ConnectionType.QueuedConnection)
+        self.table.setItemDelegateForColumn(6, self.details_delegate)
+        self.table.setItemDelegateForColumn(7, self.actions_delegate)
         layout.addWidget(self.table)
         
         self.setLayout(layout)
@@ -517,7 +560,6 @@ class EmployeesWidget(QWidget):
                     data['hire_date'], data['base_salary']
                 )
                 QMessageBox.information(self, 'نجح', 'تم إضافة الموظف بنجاح')
-                self.load_employees()
     
     def add_transaction(self):
         employees = self.employee_mgr.get_all_employees('نشط')
@@ -534,56 +576,36 @@ class EmployeesWidget(QWidget):
                     data['amount'], data['transaction_date'], data['notes']
                 )
                 QMessageBox.information(self, 'نجح', 'تم إضافة المعاملة بنجاح')
-                self.load_employees()
     
     def view_employee_details(self, employee_id):
         employee = self.employee_mgr.get_employee(employee_id)
-        transactions = self.employee_mgr.get_employee_transactions(employee_id)
         balance = self.employee_mgr.calculate_employee_balance(employee_id)
         
-        dialog = EmployeeDetailsDialog(employee, transactions, balance, self)
+        dialog = EmployeeDetailsDialog(employee, balance, self.employee_mgr, self.worker, self)
         dialog.exec()
     
     def load_employees(self):
-        employees = self.employee_mgr.get_all_employees()
-        self.table.setRowCount(len(employees))
-        
-        for row, employee in enumerate(employees):
-            self.table.setItem(row, 0, QTableWidgetItem(str(employee[0])))
-            self.table.setItem(row, 1, QTableWidgetItem(employee[1]))
-            self.table.setItem(row, 2, QTableWidgetItem(employee[2] if employee[2] else ''))
-            self.table.setItem(row, 3, QTableWidgetItem(employee[3] if employee[3] else ''))
-            self.table.setItem(row, 4, QTableWidgetItem(employee[4]))
-            self.table.setItem(row, 5, QTableWidgetItem(f'{employee[5]:.2f}'))
-            
-            details_btn = QPushButton('📊')
-            details_btn.setFixedWidth(40)
-            details_btn.clicked.connect(lambda checked, emp_id=employee[0]: self.view_employee_details(emp_id))
-            self.table.setCellWidget(row, 6, details_btn)
-            
-            if self.current_user and self.current_user.get('role') == 'admin':
-                actions_widget = QWidget()
-                actions_layout = QHBoxLayout()
-                actions_layout.setContentsMargins(0, 0, 0, 0)
-                
-                edit_btn = QPushButton('✏️')
-                edit_btn.setFixedWidth(40)
-                edit_btn.clicked.connect(lambda checked, eid=employee[0]: self.edit_employee(eid))
-                actions_layout.addWidget(edit_btn)
-                
-                delete_btn = QPushButton('🗑️')
-                delete_btn.setFixedWidth(40)
-                delete_btn.setStyleSheet('background-color: #e74c3c; color: white;')
-                delete_btn.clicked.connect(lambda checked, eid=employee[0]: self.delete_employee(eid))
-                actions_layout.addWidget(delete_btn)
-                
-                actions_widget.setLayout(actions_layout)
-                self.table.setCellWidget(row, 7, actions_widget)
-            else:
-                no_access_label = QLabel('🔒')
-                no_access_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.table.setCellWidget(row, 7, no_access_label)
+        # الصفحة الأولى بالترتيب الحالي فقط؛ الباقي عند التمرير
+        self.model.reload()
     
+    def update_count(self):
+        self.count_label.setText(count_text(self.model.rowCount(), self.model.total))
+    
+    def on_changes(self, changes):
+        employee_ids = changed_rows(changes, 'employees')
+        if employee_ids is None:
+            self.load_employees()
+        elif employee_ids:
+            self.model.refresh_rows(employee_ids)
+    
+    def on_button_clicked(self, action, employee_id):
+        if action == 'details':
+            self.view_employee_details(employee_id)
+        elif action == 'edit':
+            self.edit_employee(employee_id)
+        elif action == 'delete':
+            self.delete_employee(employee_id)
+
     def edit_employee(self, employee_id):
         if not self.current_user or self.current_user.get('role') != 'admin':
             QMessageBox.warning(self, 'تحذير', '⚠️ غير مصرح لك بتعديل البيانات')
@@ -610,7 +632,6 @@ class EmployeesWidget(QWidget):
                     data['phone'], data['base_salary']
                 )
                 QMessageBox.information(self, 'نجح', 'تم تعديل الموظف بنجاح')
-                self.load_employees()
     
     def delete_employee(self, employee_id):
         if not self.current_user or self.current_user.get('role') != 'admin':
@@ -626,4 +647,3 @@ class EmployeesWidget(QWidget):
         if reply == QMessageBox.StandardButton.Yes:
             self.employee_mgr.delete_employee(employee_id)
             QMessageBox.information(self, 'نجح', 'تم حذف الموظف بنجاح')
-            self.load_employees()
@@ -1,8 +1,13 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QPushButton, QTableWidget, QTableWidgetItem, QDialog,
+                             QPushButton, QTableView, QDialog,
                              QLineEdit, QDateEdit, QMessageBox, QHeaderView)
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QFont
+from ui.db_worker import DatabaseWorker
+from ui.change_notifier import ChangeNotifier, changed_rows
+from ui.paging import count_text
+from ui.table_model import SqlTableModel, Column, amount_text, sortable_view
+from ui.delegates import ButtonsDelegate, admin_buttons
 
 class AddExpenseDialog(QDialog):
     def __init__(self, parent=None):
@@ -58,11 +63,32 @@ class AddExpenseDialog(QDialog):
         }
 
 class ExpensesWidget(QWidget):
-    def __init__(self, db, expense_mgr, current_user=None):  # --- NEW FEATURE: User Permissions ---
+    def __init__(self, db, expense_mgr, current_user=None, worker=None,
+                 change_notifier=None):  # --- NEW FEATURE: User Permissions ---
         super().__init__()
         self.db = db
+        self.worker = worker or DatabaseWorker(self)
+        self.change_notifier = change_notifier or ChangeNotifier(db.changes, self)
+        self.change_notifier.changed.connect(self.on_changes)
         self.expense_mgr = expense_mgr
         self.current_user = current_user  # --- NEW FEATURE: User Permissions ---
+        self.model = SqlTableModel(
+            [
+                Column('الرقم', 0, sort='id'),
+                Column('البند', 1, sort='category'),
+                Column('المبلغ', 2, amount_text(2), 'amount'),
+                Column('التاريخ', 3, sort='date'),
+                Column('الوصف', 4),
+                Column('إجراءات'),
+            ],
+            self.worker,
+            lambda sort, descending, after: self.expense_mgr.get_expenses_page(
+                after=after, sort=sort, descending=descending),
+            self.expense_mgr.count_expenses,
+            self.expense_mgr.get_expenses,
+            sort='date', parent=self
+        )
+        self.model.loaded.connect(self.update_count)
         self.setup_ui()
     
     def setup_ui(self):
@@ -84,15 +110,19 @@ class ExpensesWidget(QWidget):
         btn_layout.addWidget(refresh_btn)
         
         btn_layout.addStretch()
+        self.count_label = QLabel('')
+        btn_layout.addWidget(self.count_label)
         layout.addLayout(btn_layout)
         
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels([
-            'الرقم', 'البند', 'المبلغ', 'التاريخ', 'الوصف', 'إجراءات'
-        ])
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.table.setLayoutDirection(Qt.LayoutDirection.RightToLeft)
+        sortable_view(self.table, self.model)
+        self.actions_delegate = ButtonsDelegate(admin_buttons(self.current_user), self, placeholder='🔒')
+        self.actions_delegate.clicked.connect(self.on_button_clicked, Qt.ConnectionType.QueuedConnection)
+        self.table.setItemDelegateForColumn(5, self.actions_delegate)
         layout.addWidget(self.table)
         
         self.setLayout(layout)
@@ -108,42 +138,27 @@ class ExpensesWidget(QWidget):
                     data['expense_date'], data['description']
                 )
                 QMessageBox.information(self, 'نجح', 'تم إضافة المصروف بنجاح')
-                self.load_expenses()
     
     def load_expenses(self):
-        expenses = self.expense_mgr.get_all_expenses()
-        self.table.setRowCount(len(expenses))
-        
-        for row, expense in enumerate(expenses):
-            self.table.setItem(row, 0, QTableWidgetItem(str(expense[0])))
-            self.table.setItem(row, 1, QTableWidgetItem(expense[1]))
-            self.table.setItem(row, 2, QTableWidgetItem(f'{expense[2]:.2f}'))
-            self.table.setItem(row, 3, QTableWidgetItem(expense[3]))
-            self.table.setItem(row, 4, QTableWidgetItem(expense[4] if expense[4] else ''))
-            
-            if self.current_user and self.current_user.get('role') == 'admin':
-                actions_widget = QWidget()
-                actions_layout = QHBoxLayout()
-                actions_layout.setContentsMargins(0, 0, 0, 0)
-                
-                edit_btn = QPushButton('✏️')
-                edit_btn.setFixedWidth(40)
-                edit_btn.clicked.connect(lambda checked, eid=expense[0]: self.edit_expense(eid))
-                actions_layout.addWidget(edit_btn)
-                
-                delete_btn = QPushButton('🗑️')
-                delete_btn.setFixedWidth(40)
-                delete_btn.setStyleSheet('background-color: #e74c3c; color: white;')
-                delete_btn.clicked.connect(lambda checked, eid=expense[0]: self.delete_expense(eid))
-                actions_layout.addWidget(delete_btn)
-                
-                actions_widget.setLayout(actions_layout)
-                self.table.setCellWidget(row, 5, actions_widget)
-            else:
-                no_access_label = QLabel('🔒')
-                no_access_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.table.setCellWidget(row, 5, no_access_label)
+        # الصفحة الأولى بالترتيب الحالي فقط؛ الباقي عند التمرير
+        self.model.reload()
+    
+    def update_count(self):
+        self.count_label.setText(count_text(self.model.rowCount(), self.model.total))
+    
+    def on_changes(self, changes):
+        expense_ids = changed_rows(changes, 'expenses')
+        if expense_ids is None:
+            self.load_expenses()
+        elif expense_ids:
+            self.model.refresh_rows(expense_ids)
     
+    def on_button_clicked(self, action, expense_id):
+        if action == 'edit':
+            self.edit_expense(expense_id)
+        elif action == 'delete':
+            self.delete_expense(expense_id)
+
     def edit_expense(self, expense_id):
         if not self.current_user or self.current_user.get('role') != 'admin':
             QMessageBox.warning(self, 'تحذير', '⚠️ غير مصرح لك بتعديل البيانات')
@@ -169,7 +184,6 @@ class ExpensesWidget(QWidget):
                     data['expense_date'], data['description']
                 )
                 QMessageBox.information(self, 'نجح', 'تم تعديل المصروف بنجاح')
-                self.load_expenses()
     
     def delete_expense(self, expense_id):
         if not self.current_user or self.current_user.get('role') != 'admin':
@@ -185,4 +199,3 @@ class ExpensesWidget(QWidget):
         if reply == QMessageBox.StandardButton.Yes:
             self.expense_mgr.delete_expense(expense_id)
             QMessageBox.information(self, 'نجح', 'تم حذف المصروف بنجاح')
-            self.load_expenses()
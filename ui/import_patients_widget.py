@@ -4,8 +4,6 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                              QMessageBox, QFileDialog, QTextEdit, QGroupBox)
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QFont
-import openpyxl
-import pandas as pd
 from datetime import datetime
 import os
 
@@ -120,6 +118,9 @@ class ImportPatientsWidget(QWidget):
             self.load_excel_file(file_path)
     
     def load_excel_file(self, file_path):
+        # pandas (ومعه numpy) يستغرق مئات الأجزاء من الثانية، فلا يُستورد قبل أول ملف
+        import pandas as pd
+        
         try:
             self.valid_records = []
             self.invalid_records = []
@@ -261,29 +262,28 @@ class ImportPatientsWidget(QWidget):
         
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                # Import in batches
-                batch_size = 50
+                # Import all valid records in one transaction
                 imported_count = 0
                 failed_count = 0
                 
-                for i in range(0, len(self.valid_records), batch_size):
-                    batch = self.valid_records[i:i + batch_size]
-                    
-                    for record in batch:
-                        try:
-                            self.patient_mgr.add_patient(
-                                record['name'],
-                                record['family_phone'],
-                                record['admission_date'],
-                                record['department'],
-                                record['daily_cost'],
-                                record['receives_cigarettes'],
-                                record['cigarettes_count']
-                            )
-                            imported_count += 1
-                        except Exception as e:
-                            failed_count += 1
-                            self.error_log.append(f'فشل حفظ: {record["name"]} - {str(e)}')
+                records = [
+                    (
+                        record['name'],
+                        record['family_phone'],
+                        record['admission_date'],
+                        record['department'],
+                        record['daily_cost'],
+                        record['receives_cigarettes'],
+                        record['cigarettes_count']
+                    )
+                    for record in self.valid_records
+                ]
+                
+                try:
+                    imported_count = self.patient_mgr.add_patients(records)
+                except Exception as e:
+                    failed_count = len(records)
+                    self.error_log.append(f'فشل حفظ السجلات: {str(e)}')
                 
                 # Log the import operation
                 self.log_import_operation(imported_count, failed_count)
@@ -0,0 +1,2 @@
+def count_text(shown, total):
+    return f'عرض {shown} من {total}'
@@ -0,0 +1,97 @@
+import re
+from PyQt6.QtCore import QSortFilterProxyModel
+from modules.search import normalize_arabic
+from modules.patients import PATIENT_SORTS
+from ui.table_model import SqlTableModel, Column, amount_text
+
+STATEMENT_COLUMN = 10
+ACTIONS_COLUMN = 11
+# عمود مفتاح الترتيب في صف المريض لكل ترتيب من PATIENT_SORTS
+SORT_FIELDS = {'name': 1, 'admission_date': 3}
+
+class PatientsTableModel(SqlTableModel):
+    # جدول المرضى على SqlTableModel؛ الحالة والترتيب من قوائم الصفحة والبحث من فهرس
+    # FTS. الرصيد يُضاف في نهاية كل صف عند القراءة فيبقى الصف وحدة واحدة عند التحديث
+    def __init__(self, patient_mgr, worker, parent=None):
+        columns = [
+            Column('الرقم', 0),
+            Column('الاسم', 1),
+            Column('هاتف الأهل', 2),
+            Column('تاريخ الدخول', 3),
+            Column('القسم', 4),
+            Column('التكلفة اليومية', 5, amount_text(5)),
+            Column('السجائر', 6, lambda patient: 'نعم' if patient[6] else 'لا'),
+            Column('العدد', 7),
+            Column('الحالة', 8),
+            Column('المتبقي', text=amount_text(-1)),
+            Column('كشف الحساب'),
+            Column('إجراءات'),
+        ]
+        super().__init__(columns, worker, None, None, sort='newest', parent=parent)
+        self.patient_mgr = patient_mgr
+        self.status = None
+        self.search_text = ''
+
+    # --- القراءة في خيط قاعدة البيانات ---
+
+    def query(self):
+        return self.status, self.sort_name, self.search_text
+
+    def with_balances(self, patients):
+        balances = self.patient_mgr.get_balances([patient[0] for patient in patients])
+        return [
+            tuple(patient) + (balances[patient[0]]['balance'] if patient[0] in balances else 0,)
+            for patient in patients
+        ]
+
+    def read_page(self, query, after=None):
+        # نتائج البحث مرتبة حسب المطابقة وبلا صفحات
+        status, sort, search_text = query
+        if search_text:
+            patients = self.with_balances(self.patient_mgr.search_patients(search_text, status))
+            return patients, None, False, len(patients)
+        page = self.patient_mgr.get_patients_page(status, sort, after)
+        total = self.patient_mgr.count_patients(status) if after is None else None
+        return self.with_balances(page.rows), page.cursor, page.has_more, total
+
+    def read_rows(self, patient_ids, status):
+        patients = {
+            patient[0]: patient for patient in self.with_balances(self.patient_mgr.get_patients(patient_ids))
+            if status is None or patient[8] == status
+        }
+        return patient_ids, patients, self.patient_mgr.count_patients(status)
+
+    # --- التحميل ---
+
+    def load(self, status=None, sort='newest', search_text=''):
+        self.status, self.sort_name, self.search_text = status, sort, search_text
+        self.reload()
+
+    def refresh_rows(self, patient_ids):
+        # نتائج البحث يعاد طلبها كاملة لأن ترتيبها ومطابقتها من الفهرس
+        if self.search_text:
+            self.reload()
+            return
+        super().refresh_rows(patient_ids, self.status)
+
+    def sort_order(self):
+        key, descending = PATIENT_SORTS[self.sort_name]
+        return SORT_FIELDS[key], descending
+
+class PatientsFilterProxy(QSortFilterProxyModel):
+    # تصفية فورية للصفوف المحملة أثناء الكتابة بنفس قاعدة فهرس البحث (كل كلمة بادئة
+    # لكلمة في الاسم أو الهاتف بعد التوحيد) حتى تصل نتائج الفهرس
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tokens = []
+
+    def set_search(self, text):
+        self.tokens = re.findall(r'\w+', normalize_arabic(text))
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self.tokens:
+            return True
+        patient = self.sourceModel().row_at(source_row)
+        words = re.findall(r'\w+', normalize_arabic(f'{patient[1]} {patient[2] or ""}'))
+        return all(any(word.startswith(token) for word in words) for token in self.tokens)
@@ -1,13 +1,29 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QPushButton, QTableWidget, QTableWidgetItem, QDialog,
+                             QPushButton, QTableWidget, QTableWidgetItem, QTableView, QDialog,
                              QLineEdit, QComboBox, QDateEdit, QCheckBox, QSpinBox,
                              QMessageBox, QFileDialog, QHeaderView, QScrollArea)
-from PyQt6.QtCore import Qt, QDate
+from PyQt6.QtCore import Qt, QDate, QTimer
 from PyQt6.QtGui import QFont
 from datetime import datetime
 import os
 import webbrowser
 import tempfile
+from ui.db_worker import DatabaseWorker
+from ui.change_notifier import ChangeNotifier, changed_rows
+from ui.paging import count_text
+from ui.patients_model import PatientsTableModel, PatientsFilterProxy, STATEMENT_COLUMN, ACTIONS_COLUMN
+from ui.delegates import ButtonsDelegate
+
+# انتظار توقف الكتابة قبل إرسال البحث
+SEARCH_DEBOUNCE_MS = 250
+
+# نص قائمة الترتيب ← ترتيب PatientManager.get_patients_page
+SORT_KEYS = {
+    'أبجدي (صاعد)': 'name',
+    'أبجدي (تنازلي)': 'name_desc',
+    'الأقدم أولاً': 'oldest',
+    'الأحدث أولاً': 'newest',
+}
 
 class AddPatientDialog(QDialog):
     def __init__(self, parent=None):
@@ -124,7 +140,7 @@ class PatientStatementDialog(QDialog):
         expenses_html = f'''
         <div style="text-align: right; direction: rtl; background-color: #34495e; padding: 15px; border-radius: 5px; margin: 10px 0;">
         <h3 style="color: #1abc9c;">المصروفات</h3>
-        <p><b>تكلفة الإقامة:</b> {self.statement['accommodation_cost']:.2f} جنيه ({self.statement['days']} يوم × {patient[5]:.2f} جنيه)</p>
+        <p><b>تكلفة الإقامة:</b> {self.statement['accommodation_cost']:.2f} جنيه {self.rate_periods_html('b')}</p>
         '''
         
         if self.statement['cigarettes_cost'] > 0:
@@ -187,6 +203,20 @@ class PatientStatementDialog(QDialog):
         layout.addLayout(btn_layout)
         self.setLayout(layout)
     
+    def rate_periods_html(self, tag):
+        # تفصيل الإقامة حسب فترات السعر والقسم؛ فترة واحدة تُعرض كالسابق
+        periods = self.statement['rate_periods']
+        if len(periods) == 1:
+            return f"({periods[0]['days']} يوم × {periods[0]['daily_cost']:.2f} جنيه)"
+        
+        lines = ''
+        for period in periods:
+            lines += (
+                f"<br><{tag}>{period['start'].strftime('%Y-%m-%d')} → {period['end'].strftime('%Y-%m-%d')}:</{tag}> "
+                f"{period['department']} - {period['days']} يوم × {period['daily_cost']:.2f} جنيه = {period['cost']:.2f} جنيه"
+            )
+        return lines
+    
     def print_statement(self):
         try:
             patient = self.statement['patient']
@@ -393,7 +423,7 @@ class PatientStatementDialog(QDialog):
         
         <div class="expenses-section">
             <h3>💸 المصروفات</h3>
-            <p><strong>تكلفة الإقامة:</strong> {self.statement["accommodation_cost"]:.2f} جنيه ({self.statement['days']} يوم × {patient[5]:.2f} جنيه)</p>
+            <p><strong>تكلفة الإقامة:</strong> {self.statement["accommodation_cost"]:.2f} جنيه {self.rate_periods_html('strong')}</p>
             {cigarettes_info}
             <p style="font-size: 18px; margin-top: 15px;"><strong>إجمالي المصروفات:</strong> {self.statement['total_expenses']:.2f} جنيه</p>
         </div>
@@ -454,12 +484,20 @@ class PatientStatementDialog(QDialog):
             QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء إنشاء الكشف:\n{str(e)}')
 
 class PatientsWidget(QWidget):
-    def __init__(self, db, patient_mgr, payment_mgr, current_user=None):  # --- NEW FEATURE: User Permissions ---
+    def __init__(self, db, patient_mgr, payment_mgr, current_user=None, worker=None,
+                 change_notifier=None):  # --- NEW FEATURE: User Permissions ---
         super().__init__()
         self.db = db
+        self.worker = worker or DatabaseWorker(self)
+        self.change_notifier = change_notifier or ChangeNotifier(db.changes, self)
+        self.change_notifier.changed.connect(self.on_changes)
         self.patient_mgr = patient_mgr
         self.payment_mgr = payment_mgr
         self.current_user = current_user  # --- NEW FEATURE: User Permissions ---
+        self.model = PatientsTableModel(patient_mgr, self.worker, self)
+        self.model.loaded.connect(self.on_loaded)
+        self.proxy = PatientsFilterProxy(self)
+        self.proxy.setSourceModel(self.model)
         self.setup_ui()
     
     def setup_ui(self):
@@ -475,7 +513,13 @@ class PatientsWidget(QWidget):
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText('ابحث بالاسم أو الهاتف...')
         self.search_input.setAlignment(Qt.AlignmentFlag.AlignRight)
-        self.search_input.textChanged.connect(self.search_patients)
+        # البحث في فهرس FTS بعد توقف الكتابة؛ حتى ذلك الحين تُصفى الصفوف المحملة فوراً
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.load_patients)
+        self.search_input.textChanged.connect(self.proxy.set_search)
+        self.search_input.textChanged.connect(self.search_timer.start)
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(search_label)
         layout.addLayout(search_layout)
@@ -505,14 +549,16 @@ class PatientsWidget(QWidget):
         btn_layout.addWidget(self.sort_combo)
         
         btn_layout.addStretch()
+        self.count_label = QLabel('')
+        btn_layout.addWidget(self.count_label)
         layout.addLayout(btn_layout)
         
-        self.table = QTableWidget()
-        self.table.setColumnCount(12)
-        self.table.setHorizontalHeaderLabels([
-            'الرقم', 'الاسم', 'هاتف الأهل', 'تاريخ الدخول', 'القسم',
-            'التكلفة اليومية', 'السجائر', 'العدد', 'الحالة', 'المتبقي', 'كشف الحساب', 'إجراءات'
-        ])
+        # الجدول يعرض النموذج مباشرة: الصفوف تُقرأ صفحة صفحة عند التمرير، والأزرار
+        # مرسومة بـ ButtonsDelegate بدلاً من ودجات حقيقية في كل صف
+        self.table = QTableView()
+        self.table.setModel(self.proxy)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.verticalHeader().setDefaultSectionSize(34)
         self.table.setColumnWidth(0, 60)
         self.table.setColumnWidth(1, 300)
         self.table.setColumnWidth(2, 150)
@@ -526,6 +572,14 @@ class PatientsWidget(QWidget):
         self.table.setColumnWidth(10, 120)
         self.table.setColumnWidth(11, 250)
         self.table.setLayoutDirection(Qt.LayoutDirection.RightToLeft)
+        
+        self.statement_delegate = ButtonsDelegate(lambda index: [('statement', '📊 كشف الحساب')], self)
+        self.actions_delegate = ButtonsDelegate(self.action_buttons, self)
+        for delegate in (self.statement_delegate, self.actions_delegate):
+            # الحوار يُفتح بعد انتهاء حدث النقر وليس من داخل editorEvent
+            delegate.clicked.connect(self.on_button_clicked, Qt.ConnectionType.QueuedConnection)
+        self.table.setItemDelegateForColumn(STATEMENT_COLUMN, self.statement_delegate)
+        self.table.setItemDelegateForColumn(ACTIONS_COLUMN, self.actions_delegate)
         layout.addWidget(self.table)
         
         self.setLayout(layout)
@@ -542,92 +596,71 @@ class PatientsWidget(QWidget):
                     data['cigarettes_count']
                 )
                 QMessageBox.information(self, 'نجح', 'تم إضافة المريض بنجاح')
-                self.load_patients()
     
     def view_patient_statement(self, patient_id):
-        statement = self.patient_mgr.get_patient_detailed_statement(patient_id)
+        # الكشف يُقرأ في خيط قاعدة البيانات ثم يُعرض
+        self.worker.submit(
+            self.patient_mgr.get_patient_detailed_statement, patient_id,
+            on_result=self.show_patient_statement,
+            on_error=lambda e: QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء قراءة كشف الحساب:\n{str(e)}'),
+            key='patient_statement'
+        )
+    
+    def show_patient_statement(self, statement):
         if statement:
             dialog = PatientStatementDialog(statement, self)
             dialog.exec()
         else:
             QMessageBox.warning(self, 'خطأ', 'لم يتم العثور على بيانات المريض')
     
-    def load_patients(self):
+    def status_filter(self):
         filter_text = self.filter_combo.currentText() if hasattr(self, 'filter_combo') else 'الكل'
-        sort_text = self.sort_combo.currentText() if hasattr(self, 'sort_combo') else 'الأحدث أولاً'
         
         if filter_text == 'النشطون':
-            patients = self.patient_mgr.get_all_patients('نشط')
+            return 'نشط'
         elif filter_text == 'الخريجون':
-            patients = self.patient_mgr.get_all_patients('متخرج')
-        else:
-            patients = self.patient_mgr.get_all_patients()
-        
-        patients = list(patients)
-        if sort_text == 'أبجدي (صاعد)':
-            patients.sort(key=lambda x: x[1])
-        elif sort_text == 'أبجدي (تنازلي)':
-            patients.sort(key=lambda x: x[1], reverse=True)
-        elif sort_text == 'الأقدم أولاً':
-            patients.sort(key=lambda x: x[3])
-        else:
-            patients.sort(key=lambda x: x[3], reverse=True)
-        
-        self.table.setRowCount(len(patients))
-        
-        for row, patient in enumerate(patients):
-            balance = self.patient_mgr.get_patient_balance(patient[0])
-            
-            self.table.setItem(row, 0, QTableWidgetItem(str(patient[0])))
-            self.table.setItem(row, 1, QTableWidgetItem(patient[1]))
-            self.table.setItem(row, 2, QTableWidgetItem(patient[2]))
-            self.table.setItem(row, 3, QTableWidgetItem(patient[3]))
-            self.table.setItem(row, 4, QTableWidgetItem(patient[4]))
-            self.table.setItem(row, 5, QTableWidgetItem(f'{patient[5]:.2f}'))
-            self.table.setItem(row, 6, QTableWidgetItem('نعم' if patient[6] else 'لا'))
-            self.table.setItem(row, 7, QTableWidgetItem(str(patient[7])))
-            self.table.setItem(row, 8, QTableWidgetItem(patient[8]))
-            self.table.setItem(row, 9, QTableWidgetItem(f'{balance:.2f}'))
-            
-            statement_btn = QPushButton('📊 كشف الحساب')
-            statement_btn.clicked.connect(lambda checked, p_id=patient[0]: self.view_patient_statement(p_id))
-            self.table.setCellWidget(row, 10, statement_btn)
-            
-            actions_widget = QWidget()
-            actions_layout = QHBoxLayout()
-            actions_layout.setContentsMargins(2, 2, 2, 2)
-            
-            edit_btn = QPushButton('✏️')
-            edit_btn.setFixedWidth(35)
-            edit_btn.clicked.connect(lambda checked, p_id=patient[0]: self.edit_patient(p_id))
-            actions_layout.addWidget(edit_btn)
-            
-            delete_btn = QPushButton('🗑️')
-            delete_btn.setFixedWidth(35)
-            delete_btn.clicked.connect(lambda checked, p_id=patient[0]: self.delete_patient(p_id))
-            actions_layout.addWidget(delete_btn)
-            
-            if patient[8] == 'نشط':
-                discharge_btn = QPushButton('🏁')
-                discharge_btn.setFixedWidth(35)
-                discharge_btn.clicked.connect(lambda checked, p_id=patient[0]: self.discharge_patient(p_id))
-                actions_layout.addWidget(discharge_btn)
-            
-            actions_widget.setLayout(actions_layout)
-            self.table.setCellWidget(row, 11, actions_widget)
+            return 'متخرج'
+        return None
+    
+    def search_text(self):
+        return self.search_input.text().strip() if hasattr(self, 'search_input') else ''
+    
+    def sort_key(self):
+        return SORT_KEYS[self.sort_combo.currentText()] if hasattr(self, 'sort_combo') else 'newest'
+    
+    def load_patients(self):
+        # الصفحة الأولى فقط بالترتيب المطلوب من القاعدة؛ الباقي عند التمرير
+        self.model.load(self.status_filter(), self.sort_key(), self.search_text())
+    
+    def on_loaded(self):
+        # الصفوف الآن من القاعدة بالتصفية الحالية، فلا حاجة لتصفية الواجهة
+        if self.model.search_text == self.search_text():
+            self.proxy.set_search('')
+        self.count_label.setText(count_text(self.model.rowCount(), self.model.total))
+    
+    def on_changes(self, changes):
+        # الصفوف المتأثرة فقط تُقرأ من جديد؛ الأرصدة تتغير مع المدفوعات والمستحقات
+        patient_ids = changed_rows(changes, 'patients', 'patient_ledger_totals')
+        if patient_ids is None:
+            self.load_patients()
+        elif patient_ids:
+            self.model.refresh_rows(patient_ids)
     
-    def search_patients(self):
-        search_text = self.search_input.text().lower()
-        for row in range(self.table.rowCount()):
-            name_item = self.table.item(row, 1)
-            phone_item = self.table.item(row, 2)
-            if name_item and phone_item:
-                name = name_item.text().lower()
-                phone = phone_item.text().lower()
-                if search_text in name or search_text in phone:
-                    self.table.setRowHidden(row, False)
-                else:
-                    self.table.setRowHidden(row, True)
+    def action_buttons(self, index):
+        buttons = [('edit', '✏️'), ('delete', '🗑️')]
+        if index.siblingAtColumn(8).data() == 'نشط':
+            buttons.append(('discharge', '🏁'))
+        return buttons
+    
+    def on_button_clicked(self, action, patient_id):
+        if action == 'statement':
+            self.view_patient_statement(patient_id)
+        elif action == 'edit':
+            self.edit_patient(patient_id)
+        elif action == 'delete':
+            self.delete_patient(patient_id)
+        elif action == 'discharge':
+            self.discharge_patient(patient_id)
     
     def edit_patient(self, patient_id):
         # --- FIX (فحص صلاحيات المستخدم قبل التعديل) ---
@@ -657,7 +690,6 @@ class PatientsWidget(QWidget):
                 data['receives_cigarettes'], data['cigarettes_count']
             )
             QMessageBox.information(self, 'نجح', 'تم تحديث بيانات المريض بنجاح')
-            self.load_patients()
     
     def delete_patient(self, patient_id):
         # --- FIX (فحص صلاحيات المستخدم قبل الحذف) ---
@@ -672,9 +704,8 @@ class PatientsWidget(QWidget):
         )
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                self.db.execute('DELETE FROM patients WHERE id = ?', (patient_id,))
+                self.patient_mgr.delete_patient(patient_id)
                 QMessageBox.information(self, 'نجح', 'تم حذف المريض بنجاح')
-                self.load_patients()
             except Exception as e:
                 QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء الحذف:\n{str(e)}')
     
@@ -692,4 +723,3 @@ class PatientsWidget(QWidget):
         if reply == QMessageBox.StandardButton.Yes:
             self.patient_mgr.discharge_patient(patient_id)
             QMessageBox.information(self, 'نجح', 'تم تخريج المريض بنجاح')
-            self.load_patients()
@@ -1,8 +1,13 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QPushButton, QTableWidget, QTableWidgetItem, QDialog,
+                             QPushButton, QTableView, QDialog,
                              QLineEdit, QComboBox, QDateEdit, QMessageBox, QHeaderView)
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QFont
+from ui.db_worker import DatabaseWorker
+from ui.change_notifier import ChangeNotifier, changed_rows
+from ui.paging import count_text
+from ui.table_model import SqlTableModel, Column, amount_text, sortable_view
+from ui.delegates import ButtonsDelegate, admin_buttons
 
 class AddPaymentDialog(QDialog):
     def __init__(self, patients, parent=None):
@@ -59,12 +64,33 @@ class AddPaymentDialog(QDialog):
         }
 
 class PaymentsWidget(QWidget):
-    def __init__(self, db, payment_mgr, patient_mgr, current_user=None):  # --- NEW FEATURE: User Permissions ---
+    def __init__(self, db, payment_mgr, patient_mgr, current_user=None, worker=None,
+                 change_notifier=None):  # --- NEW FEATURE: User Permissions ---
         super().__init__()
         self.db = db
+        self.worker = worker or DatabaseWorker(self)
+        self.change_notifier = change_notifier or ChangeNotifier(db.changes, self)
+        self.change_notifier.changed.connect(self.on_changes)
         self.payment_mgr = payment_mgr
         self.patient_mgr = patient_mgr
         self.current_user = current_user  # --- NEW FEATURE: User Permissions ---
+        self.model = SqlTableModel(
+            [
+                Column('الرقم', 0, sort='id'),
+                Column('اسم المريض', 6, sort='patient'),
+                Column('المبلغ', 2, amount_text(2), 'amount'),
+                Column('التاريخ', 3, sort='date'),
+                Column('ملاحظات', 4),
+                Column('إجراءات'),
+            ],
+            self.worker,
+            lambda sort, descending, after: self.payment_mgr.get_payments_page(
+                after=after, sort=sort, descending=descending),
+            self.payment_mgr.count_payments,
+            self.payment_mgr.get_payments,
+            sort='date', parent=self
+        )
+        self.model.loaded.connect(self.update_count)
         self.setup_ui()
     
     def setup_ui(self):
@@ -86,15 +112,19 @@ class PaymentsWidget(QWidget):
         btn_layout.addWidget(refresh_btn)
         
         btn_layout.addStretch()
+        self.count_label = QLabel('')
+        btn_layout.addWidget(self.count_label)
         layout.addLayout(btn_layout)
         
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels([
-            'الرقم', 'اسم المريض', 'المبلغ', 'التاريخ', 'ملاحظات', 'إجراءات'
-        ])
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.table.setLayoutDirection(Qt.LayoutDirection.RightToLeft)
+        sortable_view(self.table, self.model)
+        self.actions_delegate = ButtonsDelegate(admin_buttons(self.current_user), self, placeholder='🔒')
+        self.actions_delegate.clicked.connect(self.on_button_clicked, Qt.ConnectionType.QueuedConnection)
+        self.table.setItemDelegateForColumn(5, self.actions_delegate)
         layout.addWidget(self.table)
         
         self.setLayout(layout)
@@ -115,41 +145,28 @@ class PaymentsWidget(QWidget):
                     data['payment_date'], data['notes']
                 )
                 QMessageBox.information(self, 'نجح', 'تم إضافة الدفعة بنجاح')
-                self.load_payments()
     
     def load_payments(self):
-        payments = self.payment_mgr.get_all_payments()
-        self.table.setRowCount(len(payments))
-        
-        for row, payment in enumerate(payments):
-            self.table.setItem(row, 0, QTableWidgetItem(str(payment[0])))
-            self.table.setItem(row, 1, QTableWidgetItem(payment[6]))
-            self.table.setItem(row, 2, QTableWidgetItem(f'{payment[2]:.2f}'))
-            self.table.setItem(row, 3, QTableWidgetItem(payment[3]))
-            self.table.setItem(row, 4, QTableWidgetItem(payment[4] if payment[4] else ''))
-            
-            if self.current_user and self.current_user.get('role') == 'admin':
-                actions_widget = QWidget()
-                actions_layout = QHBoxLayout()
-                actions_layout.setContentsMargins(0, 0, 0, 0)
-                
-                edit_btn = QPushButton('✏️')
-                edit_btn.setFixedWidth(40)
-                edit_btn.clicked.connect(lambda checked, pid=payment[0]: self.edit_payment(pid))
-                actions_layout.addWidget(edit_btn)
-                
-                delete_btn = QPushButton('🗑️')
-                delete_btn.setFixedWidth(40)
-                delete_btn.setStyleSheet('background-color: #e74c3c; color: white;')
-                delete_btn.clicked.connect(lambda checked, pid=payment[0]: self.delete_payment(pid))
-                actions_layout.addWidget(delete_btn)
-                
-                actions_widget.setLayout(actions_layout)
-                self.table.setCellWidget(row, 5, actions_widget)
-            else:
-                no_access_label = QLabel('🔒')
-                no_access_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.table.setCellWidget(row, 5, no_access_label)
+        # الصفحة الأولى بالترتيب الحالي فقط؛ الصفحات التالية عند التمرير
+        self.model.reload()
+    
+    def update_count(self):
+        self.count_label.setText(count_text(self.model.rowCount(), self.model.total))
+    
+    def on_changes(self, changes):
+        # اسم المريض يظهر في كل دفعة، فتعديل مريض يعيد قراءة دفعاته فقط
+        payment_ids = changed_rows(changes, 'payments')
+        patient_ids = changed_rows(changes, 'patients')
+        if payment_ids is None or patient_ids is None:
+            self.load_payments()
+        elif payment_ids or patient_ids:
+            self.model.refresh_rows(payment_ids, patient_ids)
+    
+    def on_button_clicked(self, action, payment_id):
+        if action == 'edit':
+            self.edit_payment(payment_id)
+        elif action == 'delete':
+            self.delete_payment(payment_id)
     
     def edit_payment(self, payment_id):
         if not self.current_user or self.current_user.get('role') != 'admin':
@@ -184,7 +201,6 @@ class PaymentsWidget(QWidget):
                     data['payment_date'], data['notes']
                 )
                 QMessageBox.information(self, 'نجح', 'تم تعديل الدفعة بنجاح')
-                self.load_payments()
     
     def delete_payment(self, payment_id):
         if not self.current_user or self.current_user.get('role') != 'admin':
@@ -200,4 +216,3 @@ class PaymentsWidget(QWidget):
         if reply == QMessageBox.StandardButton.Yes:
             self.payment_mgr.delete_payment(payment_id)
             QMessageBox.information(self, 'نجح', 'تم حذف الدفعة بنجاح')
-            self.load_payments()
@@ -0,0 +1,85 @@
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QListWidget, QListWidgetItem
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from ui.db_worker import DatabaseWorker
+
+# الفهرس يجيب في أجزاء من الملي ثانية، فالانتظار فقط حتى لا يُرسل طلب لكل حرف
+OMNIBOX_DEBOUNCE_MS = 120
+
+ENTITY_LABELS = {
+    'patients': '👥 مريض',
+    'payments': '💰 دفعة',
+    'expenses': '📊 مصروف',
+    'employees': '👔 موظف',
+    'employee_transactions': '🧾 حركة موظف',
+}
+
+class SearchDialog(QDialog):
+    # بحث شامل (Ctrl+K): سطر بحث وقائمة نتائج من SearchService؛ Enter يفتح النتيجة
+    result_chosen = pyqtSignal(object)
+
+    def __init__(self, search_service, worker=None, parent=None):
+        super().__init__(parent)
+        self.search_service = search_service
+        self.worker = worker or DatabaseWorker(self)
+        self.setWindowTitle('بحث شامل')
+        self.setMinimumSize(600, 450)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText('ابحث عن مريض، دفعة، مصروف، موظف أو ملاحظة...')
+        self.search_input.setAlignment(Qt.AlignmentFlag.AlignRight)
+        self.search_input.returnPressed.connect(self.choose_current)
+        self.search_input.installEventFilter(self)
+        layout.addWidget(self.search_input)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(OMNIBOX_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_input.textChanged.connect(self.search_timer.start)
+
+        self.results_list = QListWidget()
+        self.results_list.setLayoutDirection(Qt.LayoutDirection.RightToLeft)
+        self.results_list.itemActivated.connect(self.choose)
+        layout.addWidget(self.results_list)
+
+        self.status_label = QLabel('')
+        layout.addWidget(self.status_label)
+
+        self.setLayout(layout)
+
+    def eventFilter(self, obj, event):
+        # الأسهم في سطر البحث تتنقل في النتائج دون ترك السطر
+        if obj is self.search_input and event.type() == event.Type.KeyPress \
+                and event.key() in (Qt.Key.Key_Down, Qt.Key.Key_Up):
+            step = 1 if event.key() == Qt.Key.Key_Down else -1
+            row = min(max(self.results_list.currentRow() + step, 0), self.results_list.count() - 1)
+            self.results_list.setCurrentRow(row)
+            return True
+        return super().eventFilter(obj, event)
+
+    def run_search(self):
+        self.worker.submit(self.search_service.search, self.search_input.text(),
+                           on_result=self.show_results, key='omnibox')
+
+    def show_results(self, results):
+        self.results_list.clear()
+        for result in results:
+            item = QListWidgetItem(f'{ENTITY_LABELS[result.entity]}  {result.title}\n    {result.detail}')
+            item.setData(Qt.ItemDataRole.UserRole, result)
+            self.results_list.addItem(item)
+        if results:
+            self.results_list.setCurrentRow(0)
+        self.status_label.setText(f'{len(results)} نتيجة' if self.search_input.text().strip() else '')
+
+    def choose_current(self):
+        item = self.results_list.currentItem()
+        if item:
+            self.choose(item)
+
+    def choose(self, item):
+        self.result_chosen.emit(item.data(Qt.ItemDataRole.UserRole))
+        self.accept()
@@ -0,0 +1,13 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+
+class SettingsNotifier(QObject):
+    # يحول مستمعي SettingsRegistry إلى signal؛ الكتابة قد تحدث في خيط قاعدة البيانات
+    # والإشارة تصل للواجهة في خيطها
+    changed = pyqtSignal(str, object)
+    
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.settings = settings
+        listener = self.changed.emit
+        settings.subscribe(listener)
+        self.destroyed.connect(lambda: settings.unsubscribe(listener))
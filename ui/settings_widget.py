@@ -6,13 +6,17 @@ from PyQt6.QtGui import QFont
 from datetime import datetime, timedelta
 from modules.reports import ReportGenerator
 from modules.db_import import DatabaseImportDialog
+from modules.payments import PaymentManager
+from db.archive import Archive
+from ui.db_worker import DatabaseWorker
 
 class SettingsWidget(QWidget):
     theme_changed = pyqtSignal(str)
     
-    def __init__(self, db=None):
+    def __init__(self, db=None, worker=None):
         super().__init__()
         self.db = db
+        self.worker = worker or DatabaseWorker(self)
         self.setup_ui()
     
     def setup_ui(self):
@@ -130,6 +134,21 @@ class SettingsWidget(QWidget):
         import_btn.clicked.connect(self.import_database)
         db_layout.addWidget(import_btn)
         
+        ledger_btn = QPushButton('🔧 فحص وإصلاح أرصدة المرضى')
+        ledger_btn.clicked.connect(self.repair_ledger_totals)
+        db_layout.addWidget(ledger_btn)
+        
+        archive_layout = QHBoxLayout()
+        archive_layout.addWidget(QLabel('أرشفة المتخرجين والمصروفات قبل سنة:'))
+        self.archive_year = QSpinBox()
+        self.archive_year.setRange(2000, 2100)
+        self.archive_year.setValue(datetime.now().year - 1)
+        archive_layout.addWidget(self.archive_year)
+        archive_btn = QPushButton('🗄️ أرشفة')
+        archive_btn.clicked.connect(self.archive_old_records)
+        archive_layout.addWidget(archive_btn)
+        db_layout.addLayout(archive_layout)
+        
         db_group.setLayout(db_layout)
         layout.addWidget(db_group)
         
@@ -153,12 +172,7 @@ class SettingsWidget(QWidget):
         )
         
         if file_path:
-            try:
-                report_gen = ReportGenerator(self.db)
-                report_gen.generate_daily_report(date, file_path)
-                QMessageBox.information(self, 'نجح', f'تم إنشاء التقرير بنجاح في:\n{file_path}')
-            except Exception as e:
-                QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء إنشاء التقرير:\n{str(e)}')
+            self.run_report(ReportGenerator(self.db).generate_daily_report, date, file_path)
     
     def generate_weekly_report(self):
         if not self.db:
@@ -174,12 +188,7 @@ class SettingsWidget(QWidget):
         )
         
         if file_path:
-            try:
-                report_gen = ReportGenerator(self.db)
-                report_gen.generate_weekly_report(start_date, end_date, file_path)
-                QMessageBox.information(self, 'نجح', f'تم إنشاء التقرير بنجاح في:\n{file_path}')
-            except Exception as e:
-                QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء إنشاء التقرير:\n{str(e)}')
+            self.run_report(ReportGenerator(self.db).generate_weekly_report, start_date, end_date, file_path)
     
     def generate_monthly_report(self):
         if not self.db:
@@ -195,12 +204,7 @@ class SettingsWidget(QWidget):
         )
         
         if file_path:
-            try:
-                report_gen = ReportGenerator(self.db)
-                report_gen.generate_monthly_report(year, month, file_path)
-                QMessageBox.information(self, 'نجح', f'تم إنشاء التقرير بنجاح في:\n{file_path}')
-            except Exception as e:
-                QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء إنشاء التقرير:\n{str(e)}')
+            self.run_report(ReportGenerator(self.db).generate_monthly_report, year, month, file_path)
     
     def generate_yearly_report(self):
         if not self.db:
@@ -215,14 +219,64 @@ class SettingsWidget(QWidget):
         )
         
         if file_path:
-            try:
-                report_gen = ReportGenerator(self.db)
-                report_gen.generate_yearly_report(year, file_path)
-                QMessageBox.information(self, 'نجح', f'تم إنشاء التقرير بنجاح في:\n{file_path}')
-            except Exception as e:
-                QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء إنشاء التقرير:\n{str(e)}')
+            self.run_report(ReportGenerator(self.db).generate_yearly_report, year, file_path)
+    
+    def run_report(self, generate, *args):
+        # التقرير يُبنى في خيط قاعدة البيانات؛ آخر معامل دائماً مسار الملف
+        file_path = args[-1]
+        self.worker.submit(
+            generate, *args,
+            on_result=lambda _: QMessageBox.information(self, 'نجح', f'تم إنشاء التقرير بنجاح في:\n{file_path}'),
+            on_error=lambda e: QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء إنشاء التقرير:\n{str(e)}')
+        )
     
     def import_database(self):
         if self.db:
-            dialog = DatabaseImportDialog(self.db.db_path, self)
+            self.worker.wait()
+            dialog = DatabaseImportDialog(self.db, self.worker, self)
             dialog.exec()
+    
+    def repair_ledger_totals(self):
+        if not self.db:
+            QMessageBox.warning(self, 'خطأ', 'لم يتم تهيئة قاعدة البيانات')
+            return
+        
+        try:
+            payment_mgr = PaymentManager(self.db)
+            drift = payment_mgr.verify_ledger_totals()
+            if not drift:
+                QMessageBox.information(self, 'نجح', 'أرصدة جميع المرضى مطابقة للمدفوعات')
+                return
+            
+            payment_mgr.rebuild_ledger_totals()
+            QMessageBox.information(
+                self, 'نجح',
+                f'تم إصلاح أرصدة {len(drift)} مريض وإعادة حسابها من المدفوعات'
+            )
+        except Exception as e:
+            QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء فحص الأرصدة:\n{str(e)}')
+    
+    def archive_old_records(self):
+        if not self.db:
+            QMessageBox.warning(self, 'خطأ', 'لم يتم تهيئة قاعدة البيانات')
+            return
+        
+        year = self.archive_year.value()
+        reply = QMessageBox.question(
+            self, 'تأكيد الأرشفة',
+            f'سيتم نقل المرضى المتخرجين قبل {year} مع مدفوعاتهم، ومصروفات ما قبل {year} إلى الأرشيف.\n'
+            'ستبقى ظاهرة في التقارير لكن لن تظهر في القوائم. هل تريد المتابعة؟',
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        
+        self.worker.submit(
+            Archive(self.db).archive_before, year,
+            on_result=lambda counts: QMessageBox.information(
+                self, 'نجح',
+                f'تمت أرشفة {counts["patients"]} مريض و {counts["expenses"]} مصروف'
+            ),
+            on_error=lambda e: QMessageBox.critical(self, 'خطأ', f'حدث خطأ أثناء الأرشفة:\n{str(e)}'),
+            key='archive'
+        )
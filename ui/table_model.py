@@ -0,0 +1,226 @@
+from collections import namedtuple
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+
+# field: موضع القيمة في صف القاعدة (ويُستخدم لموضع الصفوف المعدلة عند الترتيب بهذا العمود)
+# text: دالة تعيد نص الخلية من الصف كاملاً بدلاً من row[field]
+# sort: اسم الترتيب الذي يفهمه المدير، أو None لعمود لا يُرتب به (مثل الأزرار)
+Column = namedtuple('Column', ['title', 'field', 'text', 'sort'], defaults=(None, None, None))
+
+def amount_text(field):
+    return lambda row: f'{row[field]:.2f}'
+
+class SqlTableModel(QAbstractTableModel):
+    # صفوف جدول تُقرأ صفحة صفحة (keyset) من دالة المدير عند طلب العرض عبر
+    # canFetchMore / fetchMore في خيط قاعدة البيانات. الترتيب ينفذ في SQL: النقر على
+    # رأس عمود له sort يعيد القراءة من الصفحة الأولى بالترتيب الجديد.
+    #   fetch_page(sort, descending, after) -> Page
+    #   fetch_total() -> عدد الصفوف الكلي للعداد
+    #   fetch_rows(row_ids, *args) -> صفوف محددة لتحديثها بعد أحداث ChangeBus
+    # الصف الأول في كل صف من القاعدة هو id، ويُعاد في UserRole للـ delegates
+    loaded = pyqtSignal()
+    # نص الخطأ عند فشل قراءة في خيط قاعدة البيانات
+    failed = pyqtSignal(str)
+
+    def __init__(self, columns, worker, fetch_page, fetch_total, fetch_rows=None,
+                 sort=None, descending=True, parent=None):
+        super().__init__(parent)
+        self.columns = columns
+        self.worker = worker
+        self.fetch_page = fetch_page
+        self.fetch_total = fetch_total
+        self.fetch_rows = fetch_rows
+        self.sort_name = sort
+        self.descending = descending
+        self.rows = []
+        self.cursor = None
+        self.has_more = False
+        self.loading = False
+        self.total = 0
+        self.pending = []
+
+    # --- القراءة في خيط قاعدة البيانات ---
+
+    def query(self):
+        # معاملات القراءة الحالية؛ تُمرر كما هي لخيط قاعدة البيانات
+        return self.sort_name, self.descending
+
+    def read_page(self, query, after=None):
+        page = self.fetch_page(*query, after)
+        total = self.fetch_total() if after is None else None
+        return page.rows, page.cursor, page.has_more, total
+
+    def read_rows(self, row_ids, *args):
+        # الصفوف المعادة قد تشمل صفوفاً غير row_ids (مثل دفعات مريض عُدل اسمه)
+        rows = {row[0]: row for row in self.fetch_rows(row_ids, *args)}
+        return set(row_ids) | set(rows), rows, self.fetch_total()
+
+    # --- التحميل ---
+
+    def reload(self):
+        self.loading = True
+        self.worker.submit(self.read_page, self.query(), on_result=self._reset,
+                           on_error=self._failed, key=('table_model', id(self)))
+
+    def _reset(self, result):
+        self.beginResetModel()
+        rows, self.cursor, self.has_more, self.total = result
+        self.rows = list(rows)
+        self.loading = False
+        self.endResetModel()
+        self._loaded()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self.loading = True
+        self.worker.submit(self.read_page, self.query(), self.cursor, on_result=self._append,
+                           on_error=self._failed, key=('table_model', id(self)))
+
+    def _append(self, result):
+        rows, self.cursor, self.has_more, _ = result
+        self.loading = False
+        if rows:
+            start = len(self.rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+        self._loaded()
+
+    def _failed(self, error):
+        # الصفحة لن تصل: loading لا تبقى عالقة و callbacks المنتظرة تعمل على الصفوف الحالية.
+        # has_more يتوقف وإلا طلب العرض الصفحة الفاشلة نفسها فوراً؛ reload() يعيد المحاولة
+        self.loading = False
+        self.has_more = False
+        self._report(error)
+        self._loaded()
+
+    def _report(self, error):
+        print(f'خطأ في قراءة بيانات الجدول: {str(error)}')
+        self.failed.emit(str(error))
+
+    def _loaded(self):
+        self.loaded.emit()
+        callbacks, self.pending = self.pending, []
+        for callback in callbacks:
+            callback()
+
+    def when_loaded(self, callback):
+        # callback بعد وصول الصفحة الجارية قراءتها (مثل جدول صفحة بُنيت للتو)، أو فوراً
+        if self.loading:
+            self.pending.append(callback)
+        else:
+            callback()
+
+    def refresh_rows(self, row_ids, *args):
+        # تحديث صفوف بعينها بعد حدث ChangeBus دون إعادة تحميل الجدول
+        self.worker.submit(self.read_rows, row_ids, *args, on_result=self.patch, on_error=self._report)
+
+    def patch(self, result):
+        row_ids, rows, total = result
+        for row_id in row_ids:
+            row = self.row_of(row_id)
+            if row is not None:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.rows[row]
+                self.endRemoveRows()
+            values = rows.get(row_id)
+            if values is None:
+                continue
+            row = self._position(values)
+            if row is None:
+                continue
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.rows.insert(row, values)
+            self.endInsertRows()
+        self.total = total
+        self.loaded.emit()
+
+    def sort_order(self):
+        # (موضع مفتاح الترتيب في الصف، تنازلي؟)
+        field = next(column.field for column in self.columns if column.sort == self.sort_name)
+        return field, self.descending
+
+    def _position(self, values):
+        # موضع الصف بالترتيب (المفتاح، id) نفسه الذي تستخدمه الصفحات؛ صف يقع بعد آخر
+        # صف محمل ينتمي لصفحة لم تُقرأ بعد فلا يُدرج الآن. NULL أولاً كما في SQLite
+        field, descending = self.sort_order()
+
+        def key(row):
+            return row[field] is not None, row[field], row[0]
+
+        target = key(values)
+        row = next((
+            row for row, other in enumerate(self.rows)
+            if (key(other) < target if descending else key(other) > target)
+        ), len(self.rows))
+        if self.has_more and row >= len(self.rows):
+            return None
+        return row
+
+    # --- الوصول للصفوف ---
+
+    def row_at(self, row):
+        return self.rows[row]
+
+    def row_of(self, row_id):
+        for row, values in enumerate(self.rows):
+            if values[0] == row_id:
+                return row
+        return None
+
+    # --- QAbstractTableModel ---
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.columns[section].title
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        values = self.rows[index.row()]
+        if role == Qt.ItemDataRole.UserRole:
+            return values[0]
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        column = self.columns[index.column()]
+        if column.text is not None:
+            return column.text(values)
+        if column.field is None:
+            return None
+        value = values[column.field]
+        return '' if value is None else str(value)
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        # يستدعيه QTableView عند النقر على رأس العمود
+        sort = self.columns[column].sort
+        descending = order == Qt.SortOrder.DescendingOrder
+        if sort is None or (sort, descending) == (self.sort_name, self.descending):
+            return
+        self.sort_name, self.descending = sort, descending
+        self.reload()
+
+    def sort_indicator(self):
+        column = next(i for i, column in enumerate(self.columns) if column.sort == self.sort_name)
+        return column, Qt.SortOrder.DescendingOrder if self.descending else Qt.SortOrder.AscendingOrder
+
+    def header_clicked(self, section):
+        # رأس عمود بلا ترتيب لا يغير الترتيب، فيعود المؤشر لعمود الترتيب الحالي
+        if self.columns[section].sort is None:
+            self.sender().setSortIndicator(*self.sort_indicator())
+
+def sortable_view(view, model):
+    # مؤشر الترتيب يبدأ على ترتيب النموذج الحالي، والنقر على الرأس يستدعي model.sort
+    header = view.horizontalHeader()
+    header.setSortIndicator(*model.sort_indicator())
+    view.setSortingEnabled(True)
+    header.sectionClicked.connect(model.header_clicked)
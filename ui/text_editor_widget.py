@@ -8,10 +8,6 @@ from PyQt6.QtCore import Qt
 from PyQt6.QtGui import (QFont, QTextCharFormat, QTextCursor, QPageSize, QPageLayout, 
                          QTextTableFormat, QAction, QColor, QTextListFormat)
 from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from bs4 import BeautifulSoup
 import os
 
 class TextEditorWidget(QWidget):
@@ -250,6 +246,7 @@ class TextEditorWidget(QWidget):
                     with open(file_path, 'r', encoding='utf-8') as f:
                         self.text_edit.setPlainText(f.read())
                 elif file_path.endswith('.docx'):
+                    from docx import Document
                     doc = Document(file_path)
                     full_text = []
                     for para in doc.paragraphs:
@@ -290,6 +287,11 @@ class TextEditorWidget(QWidget):
         
         if file_path:
             try:
+                # مكتبات Word و HTML تُستورد عند الحفظ فقط
+                from docx import Document
+                from docx.enum.text import WD_ALIGN_PARAGRAPH
+                from bs4 import BeautifulSoup
+                
                 doc = Document()
                 
                 # --- FIX (تحويل الجداول من QTextEdit إلى Word) ---